@@ -1,14 +1,47 @@
-from typing import List, Dict, Union
-from kivy.core.window import Window
+import sys
+from typing import TYPE_CHECKING, Iterable, Optional, Union
+
+from utils.startup_profile import StartupProfiler
+from utils.tracing import traced, tracer
+
+startup_profiler = StartupProfiler() # Enabled by --profile-startup
+watching = False # Reloading edited config and asset files while the game runs, for content authors, enabled by --watch
+recording = None # Path of the player input recorded for benchmarks.replay, set by --record
+if __name__ == '__main__':
+    # The game flags are only read when the game is run, importing the module leaves sys.argv alone.
+    # They are removed before kivy is imported, as kivy exits on options it does not know, and
+    # tracing is configured before the game modules are imported, so their traced functions get wrapped.
+    startup_profiler = StartupProfiler.from_argv(sys.argv) # Timing the imports below and the build phases
+    tracer.configure(sys.argv)
+    from utils.hot_reload import watch_requested
+    from utils.input_trace import record_requested
+    watching = watch_requested(sys.argv)
+    recording = record_requested(sys.argv)
+
+from kivymd.app import MDApp
+from kivy.clock import Clock
+from kivy.core.window import Window # Already loaded by kivymd's theming, the window can not be deferred
 from kivy.uix.screenmanager import ScreenManager, Screen
 
-import json
-from configs.constants import GAME_TITLE, INTRO_SCENE_ID, DEFAULTS
+from configs.constants import CONFIG_PATH, DEFAULTS, GAME_TITLE, INTRO_SCENE_ID, JOURNAL_PATH, WINDOW_SIZE
+
+from utils.asset_store import AssetStore
+from utils.media import acquire_sound
+from utils.scene_graph import SceneConfigError, load_scene_graph
+from utils.scene_spec import SceneRegistry
+from utils.session_journal import SessionJournal
+from utils.subtitle_store import SubtitleStore
 
-# Widget Import
-from widgets.scene import Scene
+if TYPE_CHECKING:
+    from utils.prefetcher import PrefetchedAssets
+    from utils.sharded_story import ShardedStory
 
-Window.size = (960, 540) # 1920x1080 aspect ratio of the window
+# The prefetcher, audio engine, boot, image levels, bundle, sharded story, text cache, transitions
+# and scene widgets are imported in build and start_services, where they are first used
+
+Window.size = WINDOW_SIZE # 1920x1080 aspect ratio of the window
+SCENE_SCREEN_NAME = 'scene' # Name of the single Screen whose scene widgets are reused across scenes
+startup_profiler.stop_imports()
 
 
 class App(MDApp):
@@ -18,103 +51,268 @@ class App(MDApp):
         MDApp (_type_): Inherits MDApp class for creating the application.
     """
 
+    config_path = CONFIG_PATH # Scenes json config loaded by the game
+    timeline_clock = None # Clock driving the scene timelines, the Kivy Clock when None
+    downscale_images = True # Showing images downscaled for the window, the source images when False
+    pcm_audio = True # Mixing pre-decoded audio with the audio engine when miniaudio is installed, SoundLoader otherwise
+    record_path = recording # Input trace written while playing, None records nothing
+    journal_path = JOURNAL_PATH # Session journal the game resumes from, None starts every run at the intro
+    watch = watching # Reloading edited config and asset files while the game runs
+
     def build(self) -> ScreenManager:
         """Build the application.
 
         Returns:
             ScreenManager: returns the ScreenManager instance
         """
+        from utils.prefetcher import AssetPrefetcher
+        from utils.sharded_story import is_sharded_story
+        from utils.text_cache import TextTextureCache
+        from utils.timeline import KivyClock
+        from utils.transitions import TransitionController
+
         self.title = GAME_TITLE # Setting the application title
         self.sm = ScreenManager()
-        self.scenes = self.load_scenes_from_config()
-        self.current_scene_id = INTRO_SCENE_ID
+        self.hot_reloader = None
+        with startup_profiler.phase('open session journal'):
+            self.journal = SessionJournal(self.journal_path) if self.journal_path else None
+        # A json config is loaded in the background once its first scene is shown, a sharded story opens at once
+        if is_sharded_story(self.config_path):
+            self.boot = None
+        else:
+            from utils.boot import StagedBoot
+            self.boot = StagedBoot(self.config_path, INTRO_SCENE_ID)
+        self.booted = self.boot is None
+        if self.boot:
+            with startup_profiler.phase('load first scene'):
+                self.scenes = self.boot_scenes()
+            self.scene_graph = None # Compiled by the boot thread
+            self.bundle = None # Opened by the boot thread, the first scene is read from the loose files
+        else:
+            with startup_profiler.phase('load scenes'):
+                self.scenes = self.load_scenes_from_config()
+                self.current_scene_id = self.resume_scene_id()
+            with startup_profiler.phase('open asset bundle'):
+                from utils.bundle import AssetBundle
+                self.bundle = AssetBundle.open_default() # Packed assets, None when the game runs from loose files
+        # Subtitles are loaded on first use until the boot thread loaded them all, and always for a sharded story
+        self.subtitles = SubtitleStore(self.scenes, self.bundle, lazy=True)
+        self.asset_store = AssetStore(bundle=self.bundle) # Shares decoded images and sounds between scenes with identical files
+        self.text_cache = TextTextureCache() # Shared by the subtitle and choice button labels, revisited text is not rendered again
+        self.audio_engine = None
+        if self.pcm_audio:
+            with startup_profiler.phase('start audio engine'):
+                from utils.audio_engine import AudioEngine
+                self.audio_engine = AudioEngine.create()
+        self.acquire_audio = self.audio_engine.acquire if self.audio_engine else acquire_sound
+        self.image_lod = None
+        if self.downscale_images:
+            from utils.image_lod import ImageLod
+            self.image_lod = ImageLod(target=Window.size)
+            # Images prefetched from now on are downscaled for the new window size
+            Window.bind(size=lambda _, size: setattr(self.image_lod, 'target', tuple(size)))
+        # Loads the assets of the next reachable scenes in the background
+        self.prefetcher = AssetPrefetcher(self.scenes, self.asset_store, acquire_audio=self.acquire_audio, image_lod=self.image_lod)
         self.current_scene = None
+        # Switches requested by the buttons and timers are prepared over the next frames, then swapped in at once
+        self.transitions = TransitionController(self, self.timeline_clock or KivyClock())
+        self.recorder = None
+        if self.record_path:
+            from utils.input_trace import InputRecorder
+            self.recorder = InputRecorder(self.record_path, self.timeline_clock or KivyClock())
+            self.recorder.start(self.config_path)
 
-        self.switch_to_scene(self.current_scene_id)
+        with startup_profiler.phase('build first scene'):
+            self.switch_to_scene(self.current_scene_id)
+        if self.boot: # Loading the rest of the story while the first scene is shown
+            self.boot.start(lambda: Clock.schedule_once(self.finish_boot))
+        else:
+            self.start_services()
+        tracer.start_frames()
+        if startup_profiler.enabled: # Printing the breakdown once the first frame is drawn
+            Clock.schedule_once(lambda _: print(startup_profiler.report()))
         return self.sm
 
-    def switch_to_scene(self, scene_id: str) -> None:
-        """Switch to the specified scene id.
+    def boot_scenes(self) -> SceneRegistry:
+        """Read the scenes shown first from the config, without loading the rest of the story.
+
+        Raises:
+            SceneConfigError: when the config has no intro scene
+
+        Returns:
+            SceneRegistry: the intro scene, and the scene the game resumes in when there is one
+        """
+        digests = self.journal.recent_digests(1) if self.journal else []
+        start, resume = self.boot.first_specs(digests[0] if digests else None, self.journal.digest if self.journal else None)
+        if start is None:
+            raise SceneConfigError(f"Missing '{INTRO_SCENE_ID}' scene in {self.config_path}")
+        if resume is None or not (resume.button_config or resume.last_scene_id):
+            resume = start # New game, or the last scene was removed from the story or was an ending
+        self.start_scene_id = start.scene_id
+        self.current_scene_id = resume.scene_id
+        return SceneRegistry([start] if resume is start else [start, resume])
+
+    def finish_boot(self, _=None) -> None:
+        """Swap in the story loaded by the boot thread, waiting for it if needed. Runs once, on the UI thread.
+
+        Raises:
+            SceneConfigError: when the config has errors
+        """
+        if self.booted:
+            return
+        self.boot.wait()
+        self.booted = True
+        if self.boot.error:
+            raise self.boot.error
+        self.scene_graph = self.boot.graph
+        self.scenes = self.prefetcher.scenes = self.scene_graph.registry
+        self.bundle = self.asset_store.bundle = self.boot.bundle
+        self.subtitles = self.boot.subtitles
+        if startup_profiler.enabled:
+            print(self.boot.report())
+        self.start_services()
+        self.prefetcher.prefetch_neighbours(self.scenes.get(self.current_scene_id))
+
+    def start_services(self) -> None:
+        """Start what needs the whole story: the warm prefetch of the recent scenes and the hot reload."""
+        if self.journal: # Loading the assets of the scenes the player visited last, they are likely visited again
+            recent = self.journal.recent(self.journal_scene_ids(), DEFAULTS['WARM_SCENES'])
+            self.prefetcher.warm(recent, self.scenes.get(self.current_scene_id))
+        if self.watch and self.scene_graph is None:
+            print('--watch only reloads json configs, not sharded stories')
+        elif self.watch:
+            from utils.hot_reload import HotReloader
+            self.hot_reloader = HotReloader(self)
+            self.hot_reloader.start()
+
+    @traced('App.switch_to_scene')
+    def switch_to_scene(self, scene_id: str, prefetched: Optional['PrefetchedAssets'] = None) -> None:
+        """Switch to the specified scene id at once. Buttons and timers go through self.transitions instead.
 
         Args:
             scene_id (str): scene id to switch the scene to
+            prefetched (Optional[PrefetchedAssets]): assets already loaded for the scene, taken from the prefetcher when None
         """
-        # If there's a current scene, exit it and remove it from the ScreenManager
+        # Looking up the spec for the specified scene id
+        scene_data = self.scenes.get(scene_id)
+        if not scene_data and not self.booted: # Chosen before the boot thread loaded the rest of the story
+            self.finish_boot()
+            scene_data = self.scenes.get(scene_id)
+        if not scene_data:
+            return
+        if prefetched is None:
+            prefetched = self.prefetcher.take(scene_id) # Assets loaded ahead of time, None on a prefetch miss.
+
+        if self.journal: # Only buffered here, the journal is synced to disk in batches by its own thread
+            self.journal.record(self.current_scene_id if self.current_scene else None, scene_id)
+        if self.recorder:
+            self.recorder.scene(scene_id)
+
+        # If there's a current scene, exit it and rebind its pooled widgets to the new scene
         if self.current_scene:
             self.current_scene.on_exit()
-            self.sm.remove_widget(self.sm.get_screen(self.current_scene_id))
+            self.current_scene.load_spec(scene_data, prefetched)
+            self.current_scene_id = scene_id
+        else:
+            from widgets.scene import Scene # The scene widgets are imported with the first scene
 
-        # Finding the data for the specified scene id
-        scene_data = next(
-            (scene_data for scene_data in self.scenes if scene_data.scene_id == scene_id), None
-        )
-        if not scene_data:
-            return
+            # Create the Scene object with the specified parameters, it is reused by every later scene.
+            self.current_scene = Scene(
+                self,  # Reference to the main application.
+                scene_id=scene_id,  # Unique identifier for the scene.
+                media_source=scene_data.media_source,  # Source of media (e.g., image, video).
+                media_type=scene_data.media_type,  # Type of media (e.g., 'image', 'video').
+                audio_source=scene_data.audio_source,  # Source of audio associated with the scene.
+                button_config=scene_data.button_config,  # Configuration for interactive buttons.
+                text_style=scene_data.text_style,  # Style settings for text.
+                bg_color=scene_data.bg_color,  # Background color in RGBA format.
+                audio_repeat_count=scene_data.audio_repeat_count,  # Number of times to repeat audio.
+                backoff_rate=scene_data.backoff_rate,  # Rate for backoff mechanism.
+                has_text=scene_data.has_text,  # Flag indicating whether the scene has text.
+                last_scene_id=scene_data.last_scene_id,  # Identifier of the previous scene.
+                prefetched=prefetched,  # Assets loaded ahead of time.
+                # Additional parameters can be added based on the Scene constructor.
+            )
+            self.current_scene_id = scene_id
+
+            # Creating the Screen holding the scene for the whole game
+            screen = Screen(name=SCENE_SCREEN_NAME)
+            screen.add_widget(self.current_scene.build())
+            with tracer.span('Screen.add_widget', scene_id=scene_id):
+                self.sm.add_widget(screen) # Adding the Screen to the ScreenManager
 
-        # Create a Scene object with the specified parameters.
-        self.current_scene = Scene(
-            self,  # Reference to the main application.
-            scene_id=scene_id,  # Unique identifier for the scene.
-            media_source=scene_data.media_source,  # Source of media (e.g., image, video).
-            media_type=scene_data.media_type,  # Type of media (e.g., 'image', 'video').
-            audio_source=scene_data.audio_source,  # Source of audio associated with the scene.
-            button_config=scene_data.button_config,  # Configuration for interactive buttons.
-            text_style=scene_data.text_style,  # Style settings for text.
-            bg_color=scene_data.bg_color,  # Background color in RGBA format.
-            audio_repeat_count=scene_data.audio_repeat_count,  # Number of times to repeat audio.
-            backoff_rate=scene_data.backoff_rate,  # Rate for backoff mechanism.
-            has_text=scene_data.has_text,  # Flag indicating whether the scene has text.
-            last_scene_id=scene_data.last_scene_id,  # Identifier of the previous scene.
-            # Additional parameters can be added based on the Scene constructor.
-)
-
-        self.current_scene_id = scene_id
-
-        # Creating a new Screen and add the current scene's widget to it
-        screen = Screen(name=scene_id)
-        screen.add_widget(self.current_scene.build())
-        self.sm.add_widget(screen) # Adding the new Screen to the ScreenManager
-
-    def load_scenes_from_config(self) -> List[Scene]:
-        """Load scenes from configuration json which has the list of scenes.
+        # Starting to load the assets of every scene the player can go to next
+        self.scenes.visit(scene_id) # Sharded stories drop the shards far from the player
+        self.prefetcher.prefetch_neighbours(scene_data)
+
+    def resume_scene_id(self) -> str:
+        """Return the scene the game starts in.
 
         Returns:
-            List[Scene]: returns the list of scene objects
+            str: the last scene of the session journal, or the intro scene for a new or finished game
         """
-        try:
-            with open('./configs/scenes_config.json', 'r') as file: # Loading scenes data from the scenes_config.json file
-                scenes_data = json.load(file)
-            scenes = [self.create_scene_from_data(scene_data) for scene_data in scenes_data]
-            return scenes
-        except Exception as e:
-            print(f"Error loading scenes from JSON: {e}")
-            return []
-
-    def create_scene_from_data(self, scene_data: Dict[str, Union[str, int]]) -> Scene:
-        """Create a Scene instance from JSON data.
+        if self.journal is None:
+            return self.start_scene_id
+        scene_id = self.journal.last_scene(self.journal_scene_ids())
+        spec = self.scenes.get(scene_id) if scene_id else None
+        if spec is None or not (spec.button_config or spec.last_scene_id):
+            return self.start_scene_id # The last scene was removed from the story or was an ending
+        return scene_id
 
-        Args:
-            scene_data (Dict[str, Union[str, int]]): scene data from the json file
+    def journal_scene_ids(self) -> Iterable[str]:
+        """Return the scene ids the journaled scenes are looked up in.
 
         Returns:
-            Scene: Scene class instance
+            Iterable[str]: every scene id, or for a sharded story only the ids of the shards holding recent scenes
         """
-        return Scene(
-            self,  # Reference to the main application.
-            scene_id=scene_data['scene_id'],  # Unique identifier for the scene.
-            media_source=scene_data['media_source'],  # Source of media (e.g., image, video).
-            media_type=scene_data['media_type'],  # Type of media (e.g., 'image', 'video').
-            audio_source=scene_data['audio_source'],  # Source of audio associated with the scene.
-            
-            # Optional parameters with default values or None if not provided in scene_data.
-            button_config=scene_data.get('button_config', None),  # Configuration for interactive buttons.
-            text_style=scene_data.get('text_style', None),  # Style settings for text.
-            bg_color=scene_data.get('bg_color', DEFAULTS['BG_COLOR']),  # Background color in RGBA format.
-            audio_repeat_count=scene_data.get('audio_repeat_count', DEFAULTS['AUDIO_REPEAT']),  # Number of times to repeat audio.
-            backoff_rate=scene_data.get('backoff_rate', DEFAULTS['BACKOFF_RATE']),  # Rate for backoff mechanism.
-            has_text=scene_data.get('has_text', True),  # Flag indicating whether the scene has text.
-            last_scene_id=scene_data.get('last_scene_id', None),  # Identifier of the previous scene.
-        )
+        if self.scene_graph is None:
+            return self.scenes.ids_for_digests(self.journal.recent_digests(DEFAULTS['WARM_SCENES']))
+        return self.scene_graph.ids
+
+    def on_stop(self) -> None:
+        """Stop the background prefetching and close the asset bundle and journal when the application closes."""
+        self.transitions.drop()
+        if self.hot_reloader:
+            self.hot_reloader.stop()
+        self.prefetcher.shutdown()
+        if self.audio_engine:
+            self.audio_engine.close()
+        if self.bundle:
+            self.bundle.close()
+        if self.journal:
+            self.journal.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.scene_graph is None and self.booted: # A sharded story, holding its open shards
+            self.scenes.close()
+        if tracer.enabled: # Writing the trace and printing the time spent in every span
+            tracer.stop_frames()
+            print(f"Trace written to {tracer.export()}")
+            print(tracer.format_summary())
+
+    def load_scenes_from_config(self) -> Union[SceneRegistry, 'ShardedStory']:
+        """Load scenes from the compiled scene graph of the configuration json, or open a sharded story.
+
+        The config is validated and compiled only when it changed since the last launch,
+        otherwise the cached graph is loaded without parsing the json. When config_path is
+        a sharded story directory, scenes are parsed on demand as the player reaches them.
+
+        Raises:
+            SceneConfigError: when the config references unknown scenes or misses the intro scene
+
+        Returns:
+            Union[SceneRegistry, ShardedStory]: returns the registry of scene specs keyed by scene id
+        """
+        from utils.sharded_story import ShardedStory, is_sharded_story
+
+        if is_sharded_story(self.config_path):
+            self.scene_graph = None # A sharded story is never loaded whole, it was validated when imported
+            story = ShardedStory(self.config_path)
+            self.start_scene_id = story.start_id
+            return story
+        self.scene_graph = load_scene_graph(self.config_path, INTRO_SCENE_ID)
+        self.start_scene_id = INTRO_SCENE_ID
+        return self.scene_graph.registry
 
 
 if __name__ == '__main__':
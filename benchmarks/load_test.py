@@ -0,0 +1,177 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import statistics
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+from configs.constants import CONFIG_PATH
+from utils.story_server import StoryServer, read_websocket_frame
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Return the sample at the given fraction of the sorted samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+class HttpPlayer:
+    """Plays the story over one keep-alive HTTP connection."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def request(self, method: str, path: str) -> Tuple[int, bytes]:
+        """Send a request and return the status and body of its response."""
+        self.writer.write(f'{method} {path} HTTP/1.1\r\nHost: story\r\nContent-Length: 0\r\n\r\n'.encode('latin-1'))
+        status = int((await self.reader.readuntil(b'\r\n')).split(b' ', 2)[1])
+        length = 0
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.partition(b':')
+            if name.strip().lower() == b'content-length':
+                length = int(value)
+        return status, await self.reader.readexactly(length) if length else b''
+
+    async def start(self) -> Dict:
+        _, body = await self.request('POST', '/sessions')
+        return json.loads(body)
+
+    async def move(self, document: Dict, choice: Optional[int]) -> Dict:
+        path = f"/sessions/{document['session']}/" + ('advance' if choice is None else f'choices/{choice}')
+        _, body = await self.request('POST', path)
+        return json.loads(body)
+
+    async def finish(self, document: Dict) -> None:
+        await self.request('DELETE', f"/sessions/{document['session']}")
+
+
+class WebSocketPlayer:
+    """Plays the story over one websocket."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    async def handshake(self) -> None:
+        key = base64.b64encode(os.urandom(16)).decode('latin-1')
+        self.writer.write((
+            'GET /ws HTTP/1.1\r\nHost: story\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'
+        ).encode('latin-1'))
+        await self.reader.readuntil(b'\r\n\r\n')
+
+    async def send(self, message: Dict) -> Dict:
+        payload = json.dumps(message).encode('utf-8')
+        mask = os.urandom(4)
+        masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+        self.writer.write(struct.pack('!BB', 0x81, 0x80 | len(payload)) + mask + masked) # Messages are under 126 bytes
+        _, reply = await read_websocket_frame(self.reader)
+        return json.loads(reply)
+
+    async def start(self) -> Dict:
+        await self.handshake()
+        return await self.send({'op': 'start'})
+
+    async def move(self, document: Dict, choice: Optional[int]) -> Dict:
+        return await self.send({'op': 'advance'} if choice is None else {'op': 'choose', 'choice': choice})
+
+    async def finish(self, document: Dict) -> None:
+        self.writer.write(struct.pack('!BB', 0x88, 0x80) + os.urandom(4))
+
+
+async def play(host: str, port: int, websocket: bool, rng: random.Random, max_steps: int,
+               latencies: List[float]) -> int:
+    """Play one session to an ending with random choices, recording the latency of every choice.
+
+    Returns:
+        int: the number of choices made
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    player = (WebSocketPlayer if websocket else HttpPlayer)(reader, writer)
+    try:
+        document = await player.start()
+        steps = 0
+        while steps < max_steps and not document['scene']['ending']:
+            choices = document['scene']['choices']
+            choice = rng.randrange(len(choices)) if choices else None
+            start = time.perf_counter()
+            document = await player.move(document, choice)
+            latencies.append(time.perf_counter() - start)
+            steps += 1
+        await player.finish(document)
+        return steps
+    finally:
+        writer.close()
+
+
+async def run_load(host: str, port: int, sessions: int, concurrency: int, websocket: bool, max_steps: int,
+                   seed: int) -> Dict[str, float]:
+    """Play many sessions with a bounded number running at once.
+
+    Returns:
+        Dict[str, float]: throughput and choice latency percentiles
+    """
+    rng = random.Random(seed)
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_session() -> int:
+        async with semaphore:
+            return await play(host, port, websocket, rng, max_steps, latencies)
+
+    start = time.perf_counter()
+    choices = sum(await asyncio.gather(*(one_session() for _ in range(sessions)))) # Each session counts its own choices
+    elapsed = time.perf_counter() - start
+    return {
+        'transport': 'websocket' if websocket else 'http',
+        'sessions': sessions,
+        'concurrency': concurrency,
+        'elapsed_s': elapsed,
+        'sessions_per_s': sessions / elapsed,
+        'choices_per_s': choices / elapsed,
+        'choice_p50_ms': percentile(latencies, 0.50) * 1000,
+        'choice_p99_ms': percentile(latencies, 0.99) * 1000,
+        'choice_mean_ms': statistics.fmean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, float]:
+    host, port = args.host, args.port
+    server = None
+    if port is None: # No server given, one is started in this process on a free port
+        server = StoryServer.from_config(args.config)
+        listener = await server.start('127.0.0.1', 0)
+        host, port = '127.0.0.1', listener.sockets[0].getsockname()[1]
+    try:
+        return await run_load(host, port, args.sessions, args.concurrency, args.websocket, args.max_steps, args.seed)
+    finally:
+        if server:
+            await server.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Load test the story server with concurrent random players.')
+    parser.add_argument('--host', default='127.0.0.1', help='story server host')
+    parser.add_argument('--port', type=int, default=None, help='story server port, a server is started in process when omitted')
+    parser.add_argument('--config', default=CONFIG_PATH, help='scenes config of the in process server')
+    parser.add_argument('--sessions', type=int, default=2000, help='sessions played')
+    parser.add_argument('--concurrency', type=int, default=200, help='sessions played at the same time')
+    parser.add_argument('--websocket', action='store_true', help='play over websockets instead of HTTP')
+    parser.add_argument('--max-steps', type=int, default=100, help='longest session played')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random choices')
+    args = parser.parse_args(argv)
+    print(json.dumps(asyncio.run(main_async(args)), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
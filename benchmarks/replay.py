@@ -0,0 +1,216 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.run import patched, percentile, stand_ins
+
+from configs.constants import INTRO_SCENE_ID
+from utils.input_trace import load_trace
+from utils.timeline import ManualClock
+
+
+class VirtualSound:
+    """Sound stand-in that plays for its recorded length on the virtual clock, then dispatches on_stop like a Kivy sound."""
+
+    def __init__(self, path: str, length: float, clock: ManualClock):
+        self.source = path
+        self.length = length
+        self.loop = False
+        self.state = 'stop'
+        self._clock = clock
+        self._handle = None
+        self._callbacks: List[Callable[[Any], None]] = []
+
+    def bind(self, on_stop=None, **kwargs):
+        if on_stop:
+            self._callbacks.append(on_stop)
+
+    def unbind(self, on_stop=None, **kwargs):
+        if on_stop in self._callbacks:
+            self._callbacks.remove(on_stop)
+
+    def play(self):
+        if self._handle:
+            self._handle.cancel()
+        self.state = 'play'
+        self._handle = self._clock.call_later(self.length, lambda _: self.stop())
+
+    def stop(self):
+        if self._handle:
+            self._handle.cancel()
+            self._handle = None
+        if self.state == 'play': # Kivy dispatches on_stop when a playing sound ends or is stopped
+            self.state = 'stop'
+            for callback in list(self._callbacks):
+                callback(self)
+
+    def seek(self, position):
+        pass
+
+    def unload(self):
+        self.stop()
+
+
+# Function to seed a journal so the replay resumes in the scene the recording started in
+def seed_journal(path: str, scene_id: str) -> None:
+    """Write a session journal whose last scene is scene_id."""
+    from utils.session_journal import SessionJournal
+
+    journal = SessionJournal(path)
+    journal.record(None, scene_id)
+    journal.close()
+
+
+def replay(trace_path: str, config_path: Optional[str] = None, speed: float = 0.0,
+           output_trace: Optional[str] = None) -> Dict[str, Any]:
+    """Play a recorded session again on a virtual clock and compare the scenes shown.
+
+    Every choice is pressed through the ButtonBar of the current scene at its recorded
+    time. Countdowns, audio repeats, fallbacks and auto-advances run on a ManualClock,
+    with every sound lasting its recorded length, so the replay shows the same scenes
+    at the same virtual times however fast it runs.
+
+    Args:
+        trace_path (str): input trace written by python app.py --record
+        config_path (Optional[str]): scenes config or sharded story replayed, the recorded one by default
+        speed (float): virtual seconds per real second, 0 runs as fast as possible
+        output_trace (Optional[str]): path the trace of the replay is written to
+
+    Returns:
+        Dict[str, Any]: the timing of every replayed choice, and where the replay diverged if it did
+    """
+    from app import App
+    from utils.sharded_story import is_sharded_story
+    import utils.media
+
+    events = load_trace(trace_path)
+    config_path = config_path or events[0]['config']
+    if is_sharded_story(config_path):
+        scenes_data = []
+    else:
+        with open(config_path, 'r') as file:
+            scenes_data = json.load(file)
+    recorded_scenes = [(event['scene'], event['time']) for event in events if event['event'] == 'scene']
+    choices = [event for event in events if event['event'] == 'choice']
+    end_time = events[-1]['time']
+    lengths = {event['path']: event['length'] for event in events if event['event'] == 'sound'}
+
+    directory = tempfile.mkdtemp(prefix='replay_')
+    clock = ManualClock()
+    record_path = output_trace or os.path.join(directory, 'replay.jsonl')
+    journal_path = None
+    if recorded_scenes and recorded_scenes[0][0] != INTRO_SCENE_ID: # The recording resumed a saved game
+        journal_path = os.path.join(directory, 'session.journal')
+        seed_journal(journal_path, recorded_scenes[0][0])
+
+    with stand_ins(scenes_data), \
+            patched(utils.media, load_sound=lambda path, data=None: VirtualSound(path, lengths.get(path, 0.0), clock)), \
+            patched(App, config_path=config_path, timeline_clock=clock, downscale_images=False, pcm_audio=False,
+                    record_path=record_path, journal_path=journal_path):
+        quiet = io.StringIO()
+        app = App()
+        stopped: List[float] = []
+        app.stop = lambda *args: stopped.append(clock.now()) # The idle countdown ends the session
+        steps: List[Dict[str, Any]] = []
+        divergence = None
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(quiet):
+                app.build()
+                app.finish_boot()
+                for choice in choices:
+                    pace(clock, choice['time'], start, speed)
+                    clock.advance(max(choice['time'] - clock.now(), 0.0)) # Running the timers due before the choice
+                    if stopped:
+                        divergence = f"the session ended at {stopped[0]:.3f}s, before the choice at {choice['time']:.3f}s"
+                        break
+                    bar = app.current_scene.button_bar
+                    if app.current_scene_id != choice['scene'] or bar is None or choice['index'] >= len(bar.buttons) \
+                            or bar.buttons[choice['index']].target_scene_id != choice['target']:
+                        divergence = (f"at {choice['time']:.3f}s the player chose '{choice['target']}' in "
+                                      f"'{choice['scene']}', the replay is in '{app.current_scene_id}'")
+                        break
+                    step_start = time.perf_counter()
+                    bar.on_button_press(bar.buttons[choice['index']])
+                    clock.advance(0) # Running what the new scene starts on its first frame, such as its audio
+                    steps.append({'time': choice['time'], 'scene': choice['target'],
+                                  'ms': (time.perf_counter() - step_start) * 1000})
+                if divergence is None and not stopped:
+                    pace(clock, end_time, start, speed)
+                    clock.advance(max(end_time - clock.now(), 0.0))
+        finally:
+            with contextlib.redirect_stdout(quiet):
+                app.on_stop()
+        wall = time.perf_counter() - start
+
+    replayed = [(event['scene'], event['time']) for event in load_trace(record_path) if event['event'] == 'scene']
+    shutil.rmtree(directory, ignore_errors=True)
+    if divergence is None and [scene for scene, _ in replayed] != [scene for scene, _ in recorded_scenes]:
+        divergence = first_difference(recorded_scenes, replayed)
+    drifts = [abs(a[1] - b[1]) for a, b in zip(recorded_scenes, replayed)]
+    samples = [step['ms'] for step in steps]
+    return {
+        'trace': trace_path,
+        'choices': len(choices),
+        'replayed_choices': len(steps),
+        'scenes': len(recorded_scenes),
+        'virtual_s': clock.now(),
+        'wall_s': wall,
+        'speedup': clock.now() / wall if wall else 0.0,
+        'choice_p50_ms': percentile(samples, 0.50),
+        'choice_p99_ms': percentile(samples, 0.99),
+        'choice_mean_ms': statistics.fmean(samples) if samples else 0.0,
+        'max_time_drift_s': max(drifts, default=0.0), # Timer jitter of the recording, replays are exact
+        'divergence': divergence,
+        'steps': steps,
+    }
+
+
+# Function to slow the replay down to a multiple of real time
+def pace(clock: ManualClock, target: float, start: float, speed: float) -> None:
+    """Sleep until the wall time matches the virtual time target at the given speed, 0 never sleeps."""
+    if speed > 0:
+        delay = start + target / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+# Function to describe where two scene sequences part
+def first_difference(recorded: List[Tuple[str, float]], replayed: List[Tuple[str, float]]) -> str:
+    """Return the first scene shown differently by the recording and the replay."""
+    for i, (expected, actual) in enumerate(zip(recorded, replayed)):
+        if expected[0] != actual[0]:
+            return f"scene {i} at {expected[1]:.3f}s was '{expected[0]}', the replay showed '{actual[0]}' at {actual[1]:.3f}s"
+    return f"the recording showed {len(recorded)} scenes, the replay {len(replayed)}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Replay recorded player input on a virtual clock and time every choice.')
+    parser.add_argument('traces', nargs='+', help='input traces recorded with python app.py --record')
+    parser.add_argument('--config', help='scenes config to replay against, the recorded one by default')
+    parser.add_argument('--speed', type=float, default=0.0,
+                        help='virtual seconds per real second, 0 replays as fast as possible')
+    parser.add_argument('--output', default='replay_results.json', help='json file the results are written to')
+    args = parser.parse_args(argv)
+
+    results = []
+    for trace_path in args.traces:
+        result = replay(trace_path, args.config, args.speed)
+        results.append(result)
+        print(json.dumps({key: value for key, value in result.items() if key != 'steps'}))
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    return 1 if any(result['divergence'] for result in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,375 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# Running without a display or audio device, Kivy must be configured before its first import
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+os.environ.setdefault('KIVY_GL_BACKEND', 'mock')
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+from kivy.uix.widget import Widget # noqa: E402
+
+from configs.constants import CONFIG_PATH, DEFAULTS, INTRO_SCENE_ID, WINDOW_SIZE # noqa: E402
+from utils.scene_graph import cache_path_for # noqa: E402
+
+DEFAULT_SIZES = (15, 1000, 10000, 100000)
+
+
+class StandInImage:
+    """Decoded image stand-in, no pixels are decoded."""
+
+    def __init__(self, path: str, data: Optional[memoryview] = None):
+        self.width, self.height = WINDOW_SIZE
+        self.texture = None
+
+
+class StandInSound:
+    """Sound stand-in that never plays."""
+
+    loop = False
+
+    def __init__(self, path: str, data: Optional[memoryview] = None):
+        self.source = path
+
+    def bind(self, **kwargs):
+        pass
+
+    def unbind(self, **kwargs):
+        pass
+
+    def play(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def seek(self, position):
+        pass
+
+    def unload(self):
+        pass
+
+
+class StandInDevice:
+    """Audio device stand-in, the mixer of the audio engine is pulled by the benchmark instead of a sound card."""
+
+    def __init__(self):
+        self.stream = None
+
+    def start(self, stream):
+        self.stream = stream
+
+    def pull(self, frames: int, block: int = 1024) -> None:
+        """Mix frames of audio, in blocks like a device asks for them."""
+        while self.stream is not None and frames > 0:
+            self.stream.send(min(block, frames))
+            frames -= block
+
+    def close(self):
+        self.stream = None
+
+
+# Function standing in for the audio decoder of the audio engine
+def stand_in_pcm(path: str, data: Optional[memoryview] = None, sample_rate: int = DEFAULTS['AUDIO_SAMPLE_RATE'],
+                 channels: int = 2):
+    """Return one second of silence, nothing is decoded."""
+    import numpy as np
+    from utils.audio_engine import PcmBuffer
+
+    return PcmBuffer(np.zeros(sample_rate * channels, dtype=np.int16), channels, sample_rate)
+
+
+# Function to let the audio engine of a benchmarked app mix the audio of a stretch of virtual time
+def pump_audio(app, seconds: float) -> None:
+    """Pull seconds of audio from the stand-in device, so voices end and report it like on a sound card."""
+    engine = getattr(app, 'audio_engine', None)
+    if engine is not None and isinstance(engine.device, StandInDevice):
+        engine.device.pull(int(seconds * engine.sample_rate))
+
+
+class StandInVideo(Widget):
+    """Video widget stand-in, no stream is opened."""
+
+    def __init__(self, options=None, **kwargs):
+        super(StandInVideo, self).__init__(**kwargs)
+        self.source = ''
+        self.state = 'stop'
+
+    def unload(self):
+        pass
+
+
+class StandInBundle:
+    """Asset bundle stand-in serving the same small blob for every asset, so no file is touched."""
+
+    def __init__(self, scenes_data: List[Dict]):
+        self._blob = memoryview(b'\0' * 1024)
+        self._subtitled = [scene['scene_id'] for scene in scenes_data if scene.get('has_text', True)]
+
+    def names(self):
+        return ((scene_id, 'subtitle.txt') for scene_id in self._subtitled)
+
+    def content_key(self, scene_id: str, file_name: str) -> str:
+        return file_name # Assets are shared by name, like a story reusing its art and music
+
+    def get(self, scene_id: str, file_name: str) -> memoryview:
+        return self._blob
+
+    def close(self):
+        pass
+
+
+# Function to set attributes of a module or class for the duration of a with block
+@contextlib.contextmanager
+def patched(target: Any, **values: Any) -> Iterator[None]:
+    """Set attributes of a module or class, and put the original ones back on exit.
+
+    Args:
+        target (Any): module or class whose attributes are set
+        **values (Any): the values set, by attribute name
+    """
+    own = vars(target) # Classmethods are kept as descriptors, not bound
+    originals = {name: own[name] for name in values if name in own}
+    for name, value in values.items():
+        setattr(target, name, value)
+    try:
+        yield
+    finally:
+        for name in values:
+            if name in originals:
+                setattr(target, name, originals[name])
+            else: # Inherited before, inherited again
+                delattr(target, name)
+
+
+# Function to swap the media providers for stand-ins
+@contextlib.contextmanager
+def stand_ins(scenes_data: List[Dict], pcm_audio: bool = False) -> Iterator[None]:
+    """Replace the image, audio, video and bundle providers used by the game with stand-ins, until the block exits.
+
+    Args:
+        scenes_data (List[Dict]): scenes of the benchmarked config
+        pcm_audio (bool): run the audio engine on silent buffers and a stand-in device, used with App.pcm_audio
+    """
+    import utils.audio_engine
+    import utils.bundle
+    import utils.media
+    import widgets.scene
+
+    with contextlib.ExitStack() as stack:
+        if pcm_audio:
+            stack.enter_context(patched(utils.audio_engine, decode_pcm=stand_in_pcm))
+            stack.enter_context(patched(utils.audio_engine.AudioEngine,
+                                        create=classmethod(lambda cls: cls(device=StandInDevice()))))
+        stack.enter_context(patched(utils.media, load_image=StandInImage, load_sound=StandInSound))
+        stack.enter_context(patched(widgets.scene, load_video_class=lambda: StandInVideo))
+        stack.enter_context(patched(utils.bundle.AssetBundle,
+                                    open_default=classmethod(lambda cls, path=None: StandInBundle(scenes_data))))
+        yield
+
+
+# Function to write a synthetic story of the given size
+def make_synthetic_config(scenes: int, directory: str, seed: int = 0) -> Tuple[str, List[Dict]]:
+    """Write a synthetic scenes config. Every scene has two choices to later scenes, so every path ends.
+
+    Args:
+        scenes (int): number of scenes
+        directory (str): directory the config is written to
+        seed (int): seed of the random choice targets
+
+    Returns:
+        Tuple[str, List[Dict]]: the config path and the scenes data
+    """
+    rng = random.Random(seed)
+    ids = [INTRO_SCENE_ID] + [f'scene_{i}' for i in range(1, scenes)]
+    scenes_data = []
+    for i, scene_id in enumerate(ids):
+        scene = {
+            'scene_id': scene_id,
+            'media_source': 'intro.mp4' if i == 0 else f'image_{i % 16}.jpg',
+            'media_type': 'video' if i == 0 else 'image',
+            'audio_source': f'audio_{i % 16}.mp3',
+        }
+        if i < scenes - 1:
+            scene['button_config'] = [
+                {'text': f'Choice {i}a', 'target_scene_id': ids[i + 1]},
+                {'text': f'Choice {i}b', 'target_scene_id': ids[rng.randint(i + 1, scenes - 1)]},
+            ]
+        scenes_data.append(scene)
+
+    path = os.path.join(directory, f'scenes_{scenes}.json')
+    with open(path, 'w') as file:
+        json.dump(scenes_data, file)
+    return path, scenes_data
+
+
+# Function to return a percentile of a list of samples
+def percentile(samples: List[float], fraction: float) -> float:
+    """Return the sample at the given fraction of the sorted samples."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+
+def bench_config(config_path: str, scenes_data: List[Dict], transitions: int, seed: int = 0,
+                 pcm_audio: bool = True) -> Dict[str, float]:
+    """Benchmark startup, scene switches, scene builds and memory for one config.
+
+    Args:
+        config_path (str): scenes json config
+        scenes_data (List[Dict]): scenes of the config
+        transitions (int): number of scene switches measured
+        seed (int): seed of the random choices
+        pcm_audio (bool): play audio through the audio engine like the game, Kivy sounds when False
+
+    Returns:
+        Dict[str, float]: the measurements
+    """
+    from app import App
+    from utils.timeline import ManualClock
+    from utils.transitions import TransitionController
+    from widgets.scene import Scene
+
+    with stand_ins(scenes_data, pcm_audio), patched(
+            App,
+            config_path=config_path,
+            journal_path=None, # Every run starts at the intro, and no journal is written
+            downscale_images=False, # Stand-in images are not decoded, no variants are built
+            pcm_audio=pcm_audio, # Silent buffers mixed for a stand-in device, or sounds from the stand-in SoundLoader
+    ):
+        result = {'scenes': len(scenes_data)}
+        quiet = io.StringIO() # Validation warnings about missing assets are expected for synthetic stories
+
+        # Cold startup compiles the config, warm startup loads the compiled graph cache
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(cache_path_for(config_path))
+        for phase in ('cold', 'warm'):
+            app = App()
+            with contextlib.redirect_stdout(quiet):
+                start = time.perf_counter()
+                app.build()
+                result[f'{phase}_startup_s'] = time.perf_counter() - start # Until the first scene is built
+                app.finish_boot()
+                result[f'{phase}_ready_s'] = time.perf_counter() - start # Until the whole story is loaded
+            app.on_stop()
+
+        with contextlib.redirect_stdout(quiet):
+            start = time.perf_counter()
+            app.load_scenes_from_config()
+            result['load_scenes_s'] = time.perf_counter() - start
+
+        # Measuring the memory held by the loaded scenes
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        with contextlib.redirect_stdout(quiet):
+            registry = app.load_scenes_from_config()
+        result['bytes_per_scene'] = (tracemalloc.get_traced_memory()[0] - before) / len(registry)
+        tracemalloc.stop()
+        del registry
+
+        # Measuring scene switches along random playthroughs
+        app = App()
+        with contextlib.redirect_stdout(quiet):
+            app.build()
+            app.finish_boot()
+        rng = random.Random(seed)
+        samples = []
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(transitions):
+            spec = app.scenes.get(app.current_scene_id)
+            target = rng.choice(spec.button_config).target_scene_id if spec.button_config else INTRO_SCENE_ID
+            start = time.perf_counter()
+            app.switch_to_scene(target)
+            samples.append(time.perf_counter() - start)
+        result['transition_bytes'] = (tracemalloc.get_traced_memory()[0] - before) / max(transitions, 1)
+        tracemalloc.stop()
+        result['transition_p50_ms'] = percentile(samples, 0.50) * 1000
+        result['transition_p99_ms'] = percentile(samples, 0.99) * 1000
+        result['transition_mean_ms'] = statistics.fmean(samples) * 1000 if samples else 0.0
+
+        # Measuring bursts of three taps through the transition controller, each burst should swap in one scene
+        clock = ManualClock()
+        app.transitions = TransitionController(app, clock)
+        bursts = min(transitions, 500)
+        with contextlib.redirect_stdout(quiet):
+            for _ in range(bursts):
+                spec = app.scenes.get(app.current_scene_id)
+                targets = [button.target_scene_id for button in spec.button_config] or [INTRO_SCENE_ID]
+                for _ in range(3): # Tapped before the next frame
+                    app.transitions.request(rng.choice(targets))
+                clock.advance(0) # Running the frames of the transition
+        stats = app.transitions.stats()
+        result['swaps_per_burst'] = stats['swaps'] / max(bursts, 1)
+        result['transition_frames_per_swap'] = stats['frames'] / max(stats['swaps'], 1)
+        result['transition_max_frame_ms'] = stats['max_frame_ms']
+
+        # Measuring the build of a fresh, unpooled Scene
+        samples = []
+        specs = [app.scenes.get(scene['scene_id']) for scene in rng.sample(scenes_data, min(len(scenes_data), 200))]
+        for spec in specs:
+            scene = Scene(app, scene_id=spec.scene_id, media_source=spec.media_source, media_type=spec.media_type,
+                          audio_source=spec.audio_source, button_config=spec.button_config, text_style=spec.text_style,
+                          bg_color=spec.bg_color, audio_repeat_count=spec.audio_repeat_count,
+                          backoff_rate=spec.backoff_rate, has_text=spec.has_text, last_scene_id=spec.last_scene_id)
+            start = time.perf_counter()
+            scene.build()
+            samples.append(time.perf_counter() - start)
+            scene.on_exit()
+        result['scene_build_p50_ms'] = percentile(samples, 0.50) * 1000
+        result['scene_build_p99_ms'] = percentile(samples, 0.99) * 1000
+        app.on_stop()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark startup, scene switch latency and memory per scene.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES),
+                        help='story sizes, 15 benchmarks the shipped config')
+    parser.add_argument('--transitions', type=int, default=2000, help='scene switches measured per size')
+    parser.add_argument('--audio', choices=('pcm', 'kivy'), default='pcm',
+                        help='audio path benchmarked, the audio engine like the game or Kivy sounds')
+    parser.add_argument('--output', default='bench_results.json', help='json file the results are written to')
+    args = parser.parse_args(argv)
+
+    results = []
+    directory = tempfile.mkdtemp(prefix='bench_scenes_')
+    try:
+        for size in args.sizes:
+            if size == 15: # The shipped story, with the real config
+                with open(CONFIG_PATH, 'r') as file:
+                    scenes_data = json.load(file)
+                config_path = shutil.copy(CONFIG_PATH, os.path.join(directory, 'scenes_config.json'))
+            else:
+                config_path, scenes_data = make_synthetic_config(size, directory)
+            result = bench_config(config_path, scenes_data, args.transitions, pcm_audio=args.audio == 'pcm')
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump({
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'results': results,
+        }, file, indent=2)
+    print(f"Results written to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,289 @@
+import argparse
+import contextlib
+import gc
+import io
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, ContextManager, Dict, List, Optional, Set
+
+from benchmarks.run import make_synthetic_config, patched, pump_audio, stand_ins
+
+from configs.constants import CONFIG_PATH, INTRO_SCENE_ID
+
+METRICS = ('traced_bytes', 'widgets', 'textures', 'sounds', 'voices', 'store_entries')
+
+
+class SoundCounter:
+    """Counts the sounds loaded through utils.media and not unloaded yet."""
+
+    def __init__(self):
+        self.live = 0
+        self.loaded = 0
+
+    def install(self) -> ContextManager[None]:
+        """Wrap the sound loader and disposer of utils.media, which the asset store calls by name.
+
+        Returns:
+            ContextManager[None]: puts the wrapped loader and disposer back on exit
+        """
+        import utils.media
+
+        load_sound, unload_sound = utils.media.load_sound, utils.media.unload_sound
+
+        def counted_load(path, data=None):
+            sound = load_sound(path, data)
+            if sound is not None:
+                self.live += 1
+                self.loaded += 1
+            return sound
+
+        def counted_unload(sound):
+            if sound is not None:
+                self.live -= 1
+            unload_sound(sound)
+
+        return patched(utils.media, load_sound=counted_load, unload_sound=counted_unload)
+
+
+# Function to list the live objects of the kinds the game is expected to keep bounded
+def live_objects() -> Dict[str, List[Any]]:
+    """Return the live Kivy widgets and textures, found by walking the objects tracked by the garbage collector."""
+    from kivy.graphics.texture import Texture
+    from kivy.uix.widget import Widget
+
+    gc.collect()
+    found = {'widgets': [], 'textures': []}
+    for obj in gc.get_objects():
+        if isinstance(obj, Widget):
+            found['widgets'].append(obj)
+        elif isinstance(obj, Texture):
+            found['textures'].append(obj)
+    return found
+
+
+# Function to describe what keeps an object alive
+def retention_path(obj: Any, ignore: Set[int], depth: int = 4) -> List[str]:
+    """Follow the referrers of an object up to depth levels, the first referrer of each level.
+
+    Args:
+        obj (Any): the retained object
+        ignore (Set[int]): ids of the containers of the harness, which are not retainers
+        depth (int): number of referrers followed
+
+    Returns:
+        List[str]: type names of the object and its referrers, with the key when a referrer is a dict
+    """
+    path = [type(obj).__qualname__]
+    ignore = ignore | {id(sys._getframe())}
+    for _ in range(depth):
+        referrers = [ref for ref in gc.get_referrers(obj) if id(ref) not in ignore and not isinstance(ref, type(sys._getframe()))]
+        if not referrers:
+            break
+        ignore.add(id(referrers))
+        referrer = referrers[0]
+        if isinstance(referrer, dict):
+            keys = [key for key, value in referrer.items() if value is obj]
+            path.append(f'dict[{keys[0]!r}]' if keys else 'dict')
+        else:
+            path.append(type(referrer).__qualname__)
+        obj = referrer
+    return path
+
+
+# Function to tell whether a metric kept growing after the warm-up
+def growth_per_1000(values: List[float], sample_every: int) -> float:
+    """Return how much a metric grew per 1000 transitions, from the first to the last quarter of its samples.
+
+    Caches and pools fill up during the warm-up and stay level afterwards, so a metric
+    whose last quarter is above its first quarter keeps growing with the transitions.
+    Comparing quarter means rather than two samples keeps the garbage collector noise out.
+
+    Args:
+        values (List[float]): samples taken after the warm-up, one every sample_every transitions
+        sample_every (int): transitions between two samples
+
+    Returns:
+        float: growth per 1000 transitions, 0 with fewer than two samples
+    """
+    if len(values) < 2:
+        return 0.0
+    quarter = max(len(values) // 4, 1)
+    delta = sum(values[-quarter:]) / quarter - sum(values[:quarter]) / quarter
+    return delta * 1000 / ((len(values) - quarter) * sample_every)
+
+
+def soak(config_path: str, scenes_data: List[Dict], transitions: int, sample_every: int, warmup: float,
+         max_bytes_per_1000: int, seed: int = 0, pcm_audio: bool = True) -> Dict[str, Any]:
+    """Drive random transitions through App.switch_to_scene and check that memory stays level.
+
+    Choices are picked at random, and the timeline clock is advanced by random steps, so
+    countdowns, audio starts, fallbacks and auto-advances run too. The Kivy Clock is
+    ticked every few transitions to hand the prefetched assets over.
+
+    Args:
+        config_path (str): scenes json config
+        scenes_data (List[Dict]): scenes of the config
+        transitions (int): number of scene switches
+        sample_every (int): transitions between two samples of the metrics
+        warmup (float): fraction of the transitions run before the growth is measured
+        max_bytes_per_1000 (int): traced memory growth allowed per 1000 transitions after the warm-up
+        seed (int): seed of the random choices
+        pcm_audio (bool): play audio through the audio engine like the game, Kivy sounds when False
+
+    Returns:
+        Dict[str, Any]: the samples, the growth of every metric, the failures and the retainers found
+    """
+    from kivy.clock import Clock
+
+    from app import App
+    from utils.timeline import ManualClock
+
+    sounds = SoundCounter()
+    clock = ManualClock()
+    with stand_ins(scenes_data, pcm_audio), sounds.install(), patched(
+            App,
+            config_path=config_path,
+            timeline_clock=clock,
+            journal_path=None,
+            downscale_images=False,
+            pcm_audio=pcm_audio, # The audio engine mixes silent buffers for a stand-in device, pulled as the clock advances
+    ):
+        quiet = io.StringIO() # Validation warnings about missing assets are expected for synthetic stories
+
+        app = App()
+        with contextlib.redirect_stdout(quiet):
+            app.build()
+            app.finish_boot()
+        rng = random.Random(seed)
+        tracemalloc.start()
+        samples: List[Dict[str, float]] = []
+        sounds_per_scene: Dict[str, int] = {}
+        warmup_end = int(transitions * warmup)
+        warmup_step = None
+        baseline_snapshot = None
+        baseline_ids: Dict[str, Set[int]] = {}
+        start = time.perf_counter()
+
+        for step in range(1, transitions + 1):
+            spec = app.scenes.get(app.current_scene_id)
+            with contextlib.redirect_stdout(quiet):
+                if rng.random() < 0.05: # Letting the countdown, fallback or auto-advance of the scene run out
+                    seconds = rng.uniform(0, 2 * spec.backoff_rate + 12)
+                else:
+                    target = rng.choice(spec.button_config).target_scene_id if spec.button_config else INTRO_SCENE_ID
+                    app.switch_to_scene(target)
+                    seconds = rng.uniform(0, 0.5) # Starting the audio and a few countdown ticks
+                clock.advance(seconds)
+                pump_audio(app, seconds) # Ended voices report on the next Kivy Clock tick
+            if step % 25 == 0:
+                Clock.tick()
+            sounds_per_scene[app.current_scene_id] = max(sounds_per_scene.get(app.current_scene_id, 0), sounds.live)
+
+            if step % sample_every == 0:
+                objects = live_objects()
+                sample = {
+                    'transition': step,
+                    'traced_bytes': tracemalloc.get_traced_memory()[0],
+                    'widgets': len(objects['widgets']),
+                    'textures': len(objects['textures']),
+                    'sounds': sounds.live,
+                    'voices': app.audio_engine.voices if app.audio_engine else 0,
+                    'store_entries': app.asset_store.stats()['entries'],
+                }
+                samples.append(sample)
+                if warmup_step is None and step >= warmup_end: # Everything allocated from now on should be freed again
+                    warmup_step = step
+                    baseline_snapshot = tracemalloc.take_snapshot()
+                    baseline_ids = {kind: {id(obj) for obj in found} for kind, found in objects.items()}
+                del objects
+
+        result: Dict[str, Any] = {
+            'scenes': len(scenes_data),
+            'transitions': transitions,
+            'seconds': time.perf_counter() - start,
+            'sounds_loaded': sounds.loaded,
+            'max_live_sounds_per_scene': dict(sorted(sounds_per_scene.items(), key=lambda item: -item[1])[:10]),
+            'samples': samples,
+        }
+        measured = [sample for sample in samples if warmup_step is not None and sample['transition'] >= warmup_step]
+        result['growth_per_1000'] = {
+            metric: growth_per_1000([sample[metric] for sample in measured], sample_every) for metric in METRICS
+        }
+        failures = []
+        if result['growth_per_1000']['traced_bytes'] > max_bytes_per_1000:
+            failures.append('traced_bytes')
+        failures.extend(metric for metric in METRICS[1:] if result['growth_per_1000'][metric] > 0) # Counts must stay level
+        result['failures'] = failures
+
+        if failures and baseline_snapshot is not None: # Reporting what was allocated and kept since the warm-up
+            snapshot = tracemalloc.take_snapshot()
+            result['top_allocations'] = [str(stat) for stat in snapshot.compare_to(baseline_snapshot, 'lineno')[:15]]
+            objects = live_objects()
+            retainers = {}
+            for kind, found in objects.items():
+                new = [obj for obj in found if id(obj) not in baseline_ids.get(kind, set())]
+                if not new:
+                    continue
+                shown = new[:5]
+                ignore = {id(objects), id(found), id(new), id(shown)}
+                retainers[kind] = {
+                    'new': len(new),
+                    'types': dict(Counter(type(obj).__qualname__ for obj in new).most_common(10)),
+                    'paths': [' <- '.join(retention_path(obj, ignore)) for obj in shown],
+                }
+                del new, shown
+            result['retainers'] = retainers
+            del objects
+        tracemalloc.stop()
+        app.on_stop()
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Drive random scene transitions and fail on unbounded memory growth.')
+    parser.add_argument('--size', type=int, default=15, help='story size, 15 soaks the shipped config')
+    parser.add_argument('--transitions', type=int, default=20000, help='scene switches driven')
+    parser.add_argument('--sample-every', type=int, default=1000, help='transitions between two samples')
+    parser.add_argument('--warmup', type=float, default=0.2, help='fraction of the transitions before growth is measured')
+    parser.add_argument('--max-bytes-per-1000', type=int, default=64 * 1024,
+                        help='traced memory growth allowed per 1000 transitions')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random choices')
+    parser.add_argument('--audio', choices=('pcm', 'kivy'), default='pcm',
+                        help='audio path soaked, the audio engine like the game or Kivy sounds')
+    parser.add_argument('--output', default='soak_results.json', help='json file the report is written to')
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp(prefix='soak_scenes_')
+    try:
+        if args.size == 15: # The shipped story, with the real config
+            with open(CONFIG_PATH, 'r') as file:
+                scenes_data = json.load(file)
+            config_path = shutil.copy(CONFIG_PATH, directory)
+        else:
+            config_path, scenes_data = make_synthetic_config(args.size, directory, args.seed)
+        result = soak(config_path, scenes_data, args.transitions, args.sample_every, args.warmup,
+                      args.max_bytes_per_1000, args.seed, args.audio == 'pcm')
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(result, file, indent=2)
+    print(json.dumps({key: result[key] for key in ('scenes', 'transitions', 'seconds', 'growth_per_1000', 'failures')}))
+    for kind, found in result.get('retainers', {}).items():
+        print(f"{found['new']} {kind} created after the warm-up are still alive: {found['types']}")
+        for path in found['paths']:
+            print(f"  {path}")
+    for line in result.get('top_allocations', []):
+        print(f"  {line}")
+    print(f"Report written to {args.output}")
+    return 1 if result['failures'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
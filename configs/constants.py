@@ -1,5 +1,10 @@
 GAME_TITLE = "Starlight Urban Escape"
 INTRO_SCENE_ID = "intro"
+CONFIG_PATH = "./configs/scenes_config.json"
+WINDOW_SIZE = (960, 540) # 1920x1080 aspect ratio of the window
+BUNDLE_PATH = "assets/assets.bundle" # Packed assets built with `python -m utils.bundle`
+LOD_CACHE_DIR = "assets/.lod" # Downscaled variants of the scene images, built on first use
+JOURNAL_PATH = "session.journal" # Scene transitions of the player, the game resumes from the last one
 
 DEFAULTS = {
     "BACKOFF_RATE": 3,
@@ -9,6 +14,16 @@ DEFAULTS = {
         "text_color": (1, 1, 1, 1),
         "font_style": "Subtitle1",
     },
-    "BG_COLOR": (0, 0, 0, 1)
-    
+    "BG_COLOR": (0, 0, 0, 1),
+    "SUBTITLE_TRACK": "default", # Subtitle track shown, such as a language, falls back to subtitle.txt
+    "ASSET_CACHE_BYTES": 256 * 1024 * 1024, # Byte budget of the shared decoded asset cache
+    "TEXT_CACHE_BYTES": 16 * 1024 * 1024, # Byte budget of the rendered subtitle and button text textures
+    "TRANSITION_FRAME_MS": 8, # Milliseconds per frame spent preparing the next scene, the rest is left to drawing
+    "IMAGE_LOD_LEVELS": ((480, 270), (960, 540), (1920, 1080), (3840, 2160)), # Sizes the scene images are downscaled to fit
+    "VIDEO_RING_SIZE": 4, # Decoded video frames buffered between the decoder thread and the UI
+    "AUDIO_SAMPLE_RATE": 44100, # Sample rate audio is decoded to and mixed at by the audio engine
+    "AUDIO_BLOCK_MS": 20, # Audio mixed at once by the audio engine, the output latency
+    "SHARD_SCENES": 256, # Scenes per shard of a sharded story
+    "LOADED_SHARDS": 8, # Shards of a sharded story kept in memory when they are far from the player
+    "WARM_SCENES": 4, # Recently visited scenes whose assets are prefetched when the game resumes
 }
@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # The game modules are imported from the repo root
+
+
+@pytest.fixture
+def assets(tmp_path, monkeypatch):
+    """Run the test in an empty game directory and return a function writing scene asset files."""
+    monkeypatch.chdir(tmp_path)
+
+    def write(scene_id, file_name, content=b''):
+        path = tmp_path / 'assets' / scene_id / file_name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(content if isinstance(content, bytes) else content.encode('utf-8'))
+        return str(path)
+
+    return write
@@ -0,0 +1,95 @@
+from utils.asset_store import AssetStore
+
+
+def load(path, data):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def test_identical_files_are_decoded_once(assets):
+    assets('a', 'image.png', b'same')
+    assets('b', 'image.png', b'same')
+    store = AssetStore()
+    key_a, value_a = store.acquire('a', 'image.png', load)
+    key_b, value_b = store.acquire('b', 'image.png', load)
+    assert key_a == key_b and value_a is value_b
+    assert store.stats()['decodes'] == 1
+    assert store.stats()['shared'] == 1
+
+
+def test_released_entries_are_evicted_least_recently_used_first(assets):
+    for name in 'abc':
+        assets(name, 'file', name * 10)
+    disposed = []
+    store = AssetStore(byte_budget=20)
+    keys = {}
+    for name in 'ab':
+        keys[name], _ = store.acquire(name, 'file', load, dispose=disposed.append)
+        store.release(keys[name])
+    store.acquire('a', 'file', load) # Using a again, b is now the least recently used
+    store.release(keys['a'])
+    store.acquire('c', 'file', load, dispose=disposed.append)
+    assert disposed == [b'b' * 10]
+    assert store.stats()['used_bytes'] == 20
+
+
+def test_referenced_entries_are_kept_over_budget(assets):
+    assets('a', 'file', b'x' * 10)
+    assets('b', 'file', b'y' * 10)
+    store = AssetStore(byte_budget=5)
+    store.acquire('a', 'file', load)
+    store.acquire('b', 'file', load)
+    assert store.stats()['entries'] == 2
+    assert store.stats()['used_bytes'] == 20
+
+
+def test_invalidate_drops_unused_content_and_decodes_the_new_file(assets):
+    assets('a', 'file', b'old')
+    store = AssetStore()
+    key, _ = store.acquire('a', 'file', load)
+    store.release(key)
+    assets('a', 'file', b'new content')
+    store.invalidate('a', 'file')
+    assert store.stats()['entries'] == 0
+    new_key, value = store.acquire('a', 'file', load)
+    assert new_key != key and value == b'new content'
+
+
+def test_invalidated_content_in_use_is_dropped_on_release(assets):
+    assets('a', 'file', b'old')
+    disposed = []
+    store = AssetStore()
+    key, _ = store.acquire('a', 'file', load, dispose=disposed.append)
+    store.invalidate('a', 'file')
+    assert store.stats()['entries'] == 1
+    store.release(key)
+    assert disposed == [b'old']
+    assert store.stats()['entries'] == 0
+
+
+def test_variants_are_cached_apart_and_invalidated_with_their_content(assets):
+    assets('a', 'image.png', b'pixels')
+    store = AssetStore()
+    key, _ = store.acquire('a', 'image.png', load)
+    variant_key, _ = store.acquire('a', 'image.png', lambda path, data: 'small', variant='480x270')
+    assert variant_key == f'{key}@480x270'
+    assert store.stats()['decodes'] == 2
+    store.release(key)
+    store.release(variant_key)
+    store.invalidate('a', 'image.png')
+    assert store.stats()['entries'] == 0
+
+
+def test_a_failed_load_can_be_retried(assets):
+    assets('a', 'file', b'data')
+    store = AssetStore()
+
+    def failing(path, data):
+        raise OSError('unreadable')
+
+    try:
+        store.acquire('a', 'file', failing)
+    except OSError:
+        pass
+    key, value = store.acquire('a', 'file', load)
+    assert value == b'data'
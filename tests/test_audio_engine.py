@@ -0,0 +1,69 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from utils.audio_engine import AudioEngine, PcmBuffer, repeat_cues # noqa: E402
+
+
+class Device:
+    """Output device pulling the mixer by hand."""
+
+    def start(self, stream):
+        self.stream = stream
+
+    def pull(self, frames):
+        return np.frombuffer(self.stream.send(frames), dtype=np.int16)
+
+    def close(self):
+        pass
+
+
+def buffer(frames, value=1, channels=1, sample_rate=10):
+    return PcmBuffer(np.full(frames * channels, value, dtype=np.int16), channels, sample_rate)
+
+
+def engine():
+    finished = []
+    mixer = AudioEngine(sample_rate=10, channels=1, dispatch=lambda callback: callback(), device=Device())
+    return mixer, finished
+
+
+@pytest.mark.parametrize('repeat_count, backoff, cues', [
+    (1, 0.0, [0]),
+    (3, 0.0, [0, 4, 8]), # Gapless
+    (3, 0.5, [0, 9, 18]), # Half a second of silence is 5 frames at 10 Hz
+    (0, 1.0, [0]), # Played at least once
+])
+def test_repeat_cues(repeat_count, backoff, cues):
+    assert repeat_cues(buffer(4), repeat_count, backoff) == cues
+
+
+def test_repeat_cues_count_frames_not_samples():
+    stereo = buffer(4, channels=2)
+    assert stereo.frames == 4 and stereo.duration == 0.4
+    assert repeat_cues(stereo, 2, 0.0) == [0, 4]
+
+
+def test_cues_play_on_their_frame_and_finish_once():
+    mixer, finished = engine()
+    mixer.play(buffer(3, 100), repeat_cues(buffer(3), 2, 0.2), finished.append) # Cues at 0 and 5
+    assert mixer.device.pull(4).tolist() == [100, 100, 100, 0]
+    assert finished == []
+    assert mixer.device.pull(6).tolist() == [0, 100, 100, 100, 0, 0]
+    assert len(finished) == 1 and mixer.voices == 0
+
+
+def test_voices_are_mixed_and_clipped():
+    mixer, _ = engine()
+    mixer.play(buffer(2, 30000), [0])
+    mixer.play(buffer(2, 30000), [1])
+    assert mixer.device.pull(3).tolist() == [30000, 32767, 30000]
+
+
+def test_stopped_voice_is_silent_and_not_reported():
+    mixer, finished = engine()
+    voice = mixer.play(buffer(4, 7), [0], finished.append)
+    assert mixer.device.pull(2).tolist() == [7, 7]
+    mixer.stop(voice)
+    assert mixer.device.pull(4).tolist() == [0, 0, 0, 0]
+    assert finished == []
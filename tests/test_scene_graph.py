@@ -0,0 +1,116 @@
+import json
+import pickle
+
+import pytest
+
+from utils.scene_graph import (NO_SCENE, SceneConfigError, cache_path_for, compile_scene_graph, load_scene_graph,
+                               validate_scenes)
+
+
+def scene(scene_id, *targets, last_scene_id=None, audio_source=None):
+    return {
+        'scene_id': scene_id,
+        'media_type': 'image',
+        'media_source': f'{scene_id}.jpg',
+        'audio_source': audio_source,
+        'has_text': False,
+        'button_config': [{'text': f'To {target}', 'target_scene_id': target} for target in targets],
+        'last_scene_id': last_scene_id,
+        'bg_color': [0, 0, 0, 1],
+    }
+
+
+def story():
+    return [scene('intro', 'hall', 'garden'), scene('hall', 'end'), scene('garden', 'garden'), scene('end')] # The garden loops forever
+
+
+@pytest.fixture
+def config(assets, tmp_path):
+    """Write a valid story with all its assets and return the path of its config."""
+    for data in story():
+        assets(data['scene_id'], data['media_source'])
+    path = tmp_path / 'scenes.json'
+    path.write_text(json.dumps(story()))
+    return str(path)
+
+
+def test_valid_story_has_no_errors(config):
+    errors, warnings = validate_scenes(story(), 'intro')
+    assert errors == []
+    assert warnings == ['Scene garden is a dead end: no ending can be reached from it']
+
+
+def test_duplicates_and_unknown_targets_are_errors(assets):
+    assert validate_scenes([scene('intro'), scene('intro')], 'intro')[0] == ['Duplicate scene id intro']
+    errors, _ = validate_scenes([scene('intro', 'nowhere')], 'intro')
+    assert errors == ['Scene intro has a choice to unknown scene nowhere']
+    with pytest.raises(SceneConfigError):
+        compile_scene_graph([scene('intro', 'nowhere')], 'intro')
+
+
+def test_missing_start_scene_is_an_error(assets):
+    errors, _ = validate_scenes([scene('hall')], 'intro')
+    assert errors
+
+
+def test_warnings_for_missing_assets_and_unreachable_scenes(assets):
+    _, warnings = validate_scenes([scene('intro'), scene('lost', audio_source='lost.jpg')], 'intro')
+    assert 'Scene intro references missing asset assets/intro/intro.jpg' in warnings
+    assert 'Scene lost uses lost.jpg as audio, which is not an audio file' in warnings
+    assert 'Scene lost can not be reached from intro' in warnings
+
+
+def test_compiled_adjacency(config):
+    graph = compile_scene_graph(story(), 'intro')
+    intro, hall, garden, end = (graph.index[scene_id] for scene_id in ('intro', 'hall', 'garden', 'end'))
+    assert graph.start == intro
+    assert graph.successors(intro) == [hall, garden]
+    assert graph.successors(end) == []
+    assert graph.successors(garden) == [garden]
+    assert graph.last_scene[hall] == NO_SCENE
+    assert all(graph.reachable())
+    assert graph.can_finish()[hall] and not graph.can_finish()[garden]
+
+
+def test_cache_round_trip_holds_only_data(config):
+    compiled = load_scene_graph(config, 'intro')
+    with open(cache_path_for(config), 'rb') as file:
+        data = file.read()
+    assert not data.startswith(b'\x80') # Not a pickle
+    cached = load_scene_graph(config, 'intro')
+    assert list(cached.registry) == list(compiled.registry)
+    assert cached.ids == compiled.ids
+    assert (cached.offsets, cached.targets, cached.last_scene) == \
+        (compiled.offsets, compiled.targets, compiled.last_scene)
+
+
+def test_cache_is_used_when_the_config_is_unchanged(config, monkeypatch):
+    load_scene_graph(config, 'intro')
+    monkeypatch.setattr('utils.scene_graph.compile_scene_graph', lambda *args: pytest.fail('compiled again'))
+    assert len(load_scene_graph(config, 'intro')) == 4
+
+
+@pytest.mark.parametrize('damage', [
+    lambda data: data[:20],
+    lambda data: b'XXXX' + data[4:],
+    lambda data: data[:-4],
+    lambda data: pickle.dumps({'version': 1}),
+])
+def test_damaged_cache_is_rebuilt(config, damage):
+    load_scene_graph(config, 'intro')
+    path = cache_path_for(config)
+    with open(path, 'rb') as file:
+        data = file.read()
+    with open(path, 'wb') as file:
+        file.write(damage(data))
+    graph = load_scene_graph(config, 'intro')
+    assert graph.ids == ['intro', 'hall', 'garden', 'end']
+    with open(path, 'rb') as file:
+        assert file.read() == data # Rewritten
+
+
+def test_edited_config_is_compiled_again(config):
+    load_scene_graph(config, 'intro')
+    with open(config, 'w') as file:
+        json.dump(story() + [scene('extra')], file)
+    assert 'extra' in load_scene_graph(config, 'intro').index
@@ -0,0 +1,95 @@
+import os
+
+import pytest
+
+from utils.session_journal import HEADER, RECORD, SessionJournal
+
+SCENES = ['intro', 'city', 'car', 'tower', 'end']
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'journal.bin')
+
+
+def write_session(path, scene_ids, **options):
+    journal = SessionJournal(path, **options)
+    left = None
+    for scene_id in scene_ids:
+        journal.record(left, scene_id)
+        left = scene_id
+    journal.close()
+
+
+def test_new_journal_has_no_history(path):
+    journal = SessionJournal(path)
+    assert journal.last_scene(SCENES) is None
+    assert journal.recent(SCENES, 3) == []
+    journal.close()
+    assert os.path.getsize(path) == HEADER.size
+
+
+def test_resumes_in_the_last_scene(path):
+    write_session(path, ['intro', 'city', 'car'])
+    journal = SessionJournal(path)
+    assert journal.last_scene(SCENES) == 'car'
+    assert journal.recent(SCENES, 2) == ['car', 'city']
+    journal.close()
+
+
+def test_recent_scenes_are_distinct_and_skip_removed_scenes(path):
+    write_session(path, ['intro', 'city', 'intro', 'removed', 'city'])
+    journal = SessionJournal(path)
+    assert journal.recent(SCENES, 5) == ['city', 'intro']
+    assert journal.last_scene(['intro']) is None # The last scene is no longer in the story
+    journal.close()
+
+
+def test_torn_last_record_is_ignored_and_cut(path):
+    write_session(path, ['intro', 'city'])
+    with open(path, 'ab') as file:
+        file.write(RECORD.pack(0.0, 1, 2)[:7]) # A crash in the middle of a write
+    journal = SessionJournal(path)
+    assert journal.last_scene(SCENES) == 'city'
+    journal.record('city', 'car')
+    journal.close()
+    assert os.path.getsize(path) == HEADER.size + 3 * RECORD.size # Whole records only, the torn one was dropped
+    journal = SessionJournal(path)
+    assert journal.recent(SCENES, 3) == ['car', 'city', 'intro']
+    journal.close()
+
+
+def test_foreign_file_is_replaced(path):
+    with open(path, 'wb') as file:
+        file.write(b'not a journal at all')
+    journal = SessionJournal(path)
+    assert journal.last_scene(SCENES) is None
+    journal.record(None, 'intro')
+    journal.close()
+    journal = SessionJournal(path)
+    assert journal.last_scene(SCENES) == 'intro'
+    journal.close()
+
+
+def test_large_journal_is_compacted_to_its_last_records(path):
+    write_session(path, SCENES * 10, keep=8) # 50 records, over twice what is kept
+    journal = SessionJournal(path, keep=8)
+    assert os.path.getsize(path) == HEADER.size + 8 * RECORD.size
+    assert len(journal.history) == 8
+    assert journal.last_scene(SCENES) == 'end'
+    journal.close()
+    assert not os.path.exists(path + '.tmp')
+
+
+def test_journal_under_twice_the_kept_records_is_left_as_is(path):
+    write_session(path, SCENES * 3, keep=8) # 15 records
+    SessionJournal(path, keep=8).close()
+    assert os.path.getsize(path) == HEADER.size + 15 * RECORD.size
+
+
+def test_records_after_close_are_dropped(path):
+    journal = SessionJournal(path)
+    journal.record(None, 'intro')
+    journal.close()
+    journal.record('intro', 'city')
+    assert os.path.getsize(path) == HEADER.size + RECORD.size
@@ -0,0 +1,115 @@
+import os
+
+import pytest
+
+from utils.scene_graph import SceneConfigError
+from utils.session_journal import scene_digest
+from utils.sharded_story import ShardedStory, import_story_nodes, is_sharded_story, write_sharded_story
+
+
+class StoryNode:
+    """Node of a story graph, like the one of new game.py."""
+
+    def __init__(self, text, choices=None):
+        self.text = text
+        self.choices = choices or []
+
+
+def scene(scene_id, *targets):
+    return {
+        'scene_id': scene_id,
+        'media_type': 'image',
+        'media_source': 'image.jpg',
+        'audio_source': None,
+        'has_text': False,
+        'button_config': [{'text': f'To {target}', 'target_scene_id': target} for target in targets],
+    }
+
+
+def chain(length):
+    """Return a story of scenes s0 to s<length - 1> played one after another."""
+    return [scene(f's{i}', f's{i + 1}') for i in range(length - 1)] + [scene(f's{length - 1}')]
+
+
+@pytest.fixture
+def story_dir(assets, tmp_path):
+    """Write a chain of 12 scenes in shards of 2, with all their assets."""
+    scenes_data = chain(12)
+    for data in scenes_data:
+        assets(data['scene_id'], 'image.jpg')
+    directory = str(tmp_path / 'story')
+    written = write_sharded_story(scenes_data, directory, 's0', shard_size=2)
+    assert written == {'scenes': 12, 'shards': 6, 'warnings': 0}
+    return directory
+
+
+def test_lookup_loads_only_the_shard_of_the_scene(story_dir):
+    story = ShardedStory(story_dir)
+    assert is_sharded_story(story_dir)
+    assert story.start_id == 's0' and len(story) == 12
+    assert story.get('s7').button_config[0].target_scene_id == 's8'
+    assert story.loaded_shards() == [3]
+    assert story.get('nowhere') is None
+    assert 's11' in story and 'nowhere' not in story
+    assert story.loaded_shards() == [3] # Membership is answered by the index
+    story.close()
+
+
+def test_shards_far_from_the_player_are_evicted(story_dir):
+    story = ShardedStory(story_dir, max_shards=2, radius=1)
+    for i in range(12):
+        story.visit(f's{i}')
+        assert len(story.loaded_shards()) <= 2 or i == 0
+    assert 5 in story.loaded_shards() # The shard of the last scene stays
+    assert story.get('s0').scene_id == 's0' # Evicted shards are parsed again on demand
+    assert story.shard_loads > 6
+    story.close()
+
+
+def test_shards_near_the_player_are_kept_over_the_limit(story_dir):
+    story = ShardedStory(story_dir, max_shards=1, radius=3)
+    story.visit('s0') # s0 to s3 are within 3 choices, in shards 0 and 1
+    assert sorted(story.loaded_shards()) == [0, 1]
+    story.close()
+
+
+def test_journal_digests_resolve_to_their_shard(story_dir):
+    story = ShardedStory(story_dir)
+    assert story.ids_for_digests([scene_digest('s5'), scene_digest('nowhere')]) == ['s4', 's5']
+    assert [spec.scene_id for spec in story] == [f's{i}' for i in range(12)]
+    assert story.loaded_shards() == [2] # Iterating does not keep the shards
+    story.close()
+
+
+def test_invalid_story_is_not_written(assets, tmp_path):
+    with pytest.raises(SceneConfigError):
+        write_sharded_story([scene('s0', 'nowhere')], str(tmp_path / 'story'), 's0')
+    assert not os.path.exists(tmp_path / 'story')
+
+
+def test_missing_assets_are_counted(assets, tmp_path):
+    written = write_sharded_story(chain(3), str(tmp_path / 'story'), 's0')
+    assert written['warnings'] == 3
+
+
+def test_imported_nodes_are_validated_against_their_asset_root(assets, tmp_path):
+    end = StoryNode('The end')
+    start = StoryNode('Start', [('Left', StoryNode('Left room', [('Go on', end)])), ('Right', end)])
+    image = tmp_path / 'cover.jpg'
+    image.write_bytes(b'jpg')
+    output = str(tmp_path / 'story')
+
+    written = import_story_nodes(start, output, str(image))
+    assert written == {'scenes': 3, 'shards': 1, 'warnings': 0} # Written under story/assets, not assets/
+    assert not os.path.exists('assets')
+    with open(os.path.join(output, 'assets', 'node_0', 'subtitle.txt'), encoding='utf-8') as file:
+        assert file.read() == 'Start'
+
+    story = ShardedStory(output)
+    assert [button.text for button in story.get('node_0').button_config] == ['Left', 'Right']
+    story.close()
+
+
+def test_import_needs_an_existing_image(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        import_story_nodes(StoryNode('Start'), str(tmp_path / 'story'), str(tmp_path / 'missing.jpg'))
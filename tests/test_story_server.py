@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+
+from utils.story_server import MAX_HEADER_LINES, StoryError, StoryServer, parse_range
+
+AUDIO = bytes(range(256)) * 4
+
+
+def scene(scene_id, *targets, last_scene_id=None, audio_source=None):
+    return {
+        'scene_id': scene_id,
+        'media_type': 'image',
+        'media_source': f'{scene_id}.jpg',
+        'audio_source': audio_source,
+        'has_text': False,
+        'button_config': [{'text': f'To {target}', 'target_scene_id': target} for target in targets],
+        'last_scene_id': last_scene_id,
+    }
+
+
+@pytest.fixture
+def server(assets, tmp_path):
+    """Create a server for a story of an intro with two choices, a scene advancing to the end, and the end."""
+    story = [scene('intro', 'hall', 'end', audio_source='intro.mp3'), scene('hall', last_scene_id='end'), scene('end')]
+    for data in story:
+        assets(data['scene_id'], data['media_source'], b'image')
+    assets('intro', 'intro.mp3', AUDIO)
+    config = tmp_path / 'scenes.json'
+    config.write_text(json.dumps(story))
+    return StoryServer.from_config(str(config), str(tmp_path / 'missing.bundle'))
+
+
+async def fetch(port, method, target, headers=()):
+    """Send one request on a new connection and return the status, the headers and the body."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(''.join([f'{method} {target} HTTP/1.1\r\nConnection: close\r\n', *headers, '\r\n']).encode('latin-1'))
+    response = await reader.read()
+    writer.close()
+    head, _, body = response.partition(b'\r\n\r\n')
+    status_line, *lines = head.decode('latin-1').split('\r\n')
+    return int(status_line.split(' ')[1]), dict(line.split(': ', 1) for line in lines), body
+
+
+def run(server, scenario):
+    """Run a scenario against the server listening on a free port, then stop it."""
+    async def main():
+        listener = await server.start('127.0.0.1', 0)
+        try:
+            return await scenario(listener.sockets[0].getsockname()[1])
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, None),
+    ('bytes=0-9', (0, 9)),
+    ('bytes=10-', (10, 99)),
+    ('bytes=-10', (90, 99)),
+    ('bytes=-500', (0, 99)),
+    ('bytes=90-500', (90, 99)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize('header, size', [
+    ('bytes=100-', 100),
+    ('bytes=5-2', 100),
+    ('bytes=-0', 100),
+    ('bytes=0-1,5-6', 100),
+    ('items=0-1', 100),
+    ('bytes=-5', 0),
+])
+def test_unsatisfiable_ranges_give_the_size(header, size):
+    with pytest.raises(StoryError) as error:
+        parse_range(header, size)
+    assert error.value.status == 416
+    assert error.value.headers == f'Content-Range: bytes */{size}\r\n'
+
+
+def test_session_routes(server):
+    async def scenario(port):
+        status, _, body = await fetch(port, 'POST', '/sessions')
+        assert status == 201
+        document = json.loads(body)
+        session = document['session']
+        assert document['scene']['scene_id'] == 'intro'
+        assert document['scene']['choices'] == ['To hall', 'To end']
+
+        assert (await fetch(port, 'POST', f'/sessions/{session}/advance'))[0] == 409 # The intro waits for a choice
+        assert (await fetch(port, 'POST', f'/sessions/{session}/choices/5'))[0] == 409
+        status, _, body = await fetch(port, 'POST', f'/sessions/{session}/choices/0')
+        assert status == 200 and json.loads(body)['scene']['scene_id'] == 'hall'
+        status, _, body = await fetch(port, 'POST', f'/sessions/{session}/advance')
+        assert json.loads(body)['scene']['scene_id'] == 'end' and json.loads(body)['steps'] == 2
+        assert json.loads(body)['scene']['ending']
+
+        status, _, body = await fetch(port, 'GET', '/stats')
+        assert json.loads(body)['sessions'] == 1 and json.loads(body)['transitions'] == 2
+        assert (await fetch(port, 'DELETE', f'/sessions/{session}'))[0] == 204
+        assert (await fetch(port, 'GET', f'/sessions/{session}'))[0] == 404
+        assert (await fetch(port, 'GET', '/nowhere'))[0] == 404
+
+    run(server, scenario)
+
+
+def test_asset_routes(server):
+    async def scenario(port):
+        status, headers, body = await fetch(port, 'GET', '/assets/intro/intro.mp3')
+        assert status == 200 and body == AUDIO and headers['Accept-Ranges'] == 'bytes'
+
+        status, headers, body = await fetch(port, 'GET', '/assets/intro/intro.mp3', ['Range: bytes=10-19\r\n'])
+        assert status == 206 and body == AUDIO[10:20]
+        assert headers['Content-Range'] == f'bytes 10-19/{len(AUDIO)}'
+
+        status, headers, _ = await fetch(port, 'GET', '/assets/intro/intro.mp3', ['Range: bytes=5000-\r\n'])
+        assert status == 416 and headers['Content-Range'] == f'bytes */{len(AUDIO)}'
+
+        status, headers, body = await fetch(port, 'HEAD', '/assets/intro/intro.mp3')
+        assert status == 200 and headers['Content-Length'] == str(len(AUDIO)) and body == b''
+
+        assert (await fetch(port, 'GET', '/assets/intro/subtitle.txt'))[0] == 404 # Not referenced by the scene
+        assert (await fetch(port, 'GET', '/assets/nowhere/intro.mp3'))[0] == 404
+
+    run(server, scenario)
+
+
+def test_too_many_header_lines_are_refused(server):
+    async def scenario(port):
+        headers = [f'X-Filler-{i}: {i}\r\n' for i in range(MAX_HEADER_LINES + 1)]
+        status, _, _ = await fetch(port, 'GET', '/stats', headers)
+        assert status == 431
+        status, _, _ = await fetch(port, 'GET', '/stats', headers[:MAX_HEADER_LINES - 1]) # With Connection: close
+        assert status == 200
+
+    run(server, scenario)
+
+
+def test_stop_ends_the_reaper(server):
+    async def main():
+        await server.start('127.0.0.1', 0)
+        reaper = server._reaper
+        await server.stop()
+        return reaper
+
+    reaper = asyncio.run(main())
+    assert reaper.cancelled()
+    assert server._reaper is None
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from utils.bundle import AssetBundle, build_bundle
+from utils.scene_spec import SceneRegistry, SceneSpec
+from utils.subtitle_store import DEFAULT_TRACK, SubtitleStore, track_name
+
+
+def scene(scene_id, has_text=True):
+    return {
+        'scene_id': scene_id,
+        'media_type': 'image',
+        'media_source': f'{scene_id}.jpg',
+        'audio_source': None,
+        'has_text': has_text,
+        'button_config': [],
+    }
+
+
+def registry(*scenes_data):
+    return SceneRegistry([SceneSpec.from_data(scene_data) for scene_data in scenes_data])
+
+
+@pytest.fixture
+def subtitles(assets):
+    """Write an intro with a default and a French track, and a silent scene that has a subtitle file anyway."""
+    assets('intro', 'subtitle.txt', 'Welcome')
+    assets('intro', 'subtitle.fr.txt', 'Bienvenue')
+    assets('intro', 'notes.txt', 'not a subtitle')
+    assets('silent', 'subtitle.txt', 'never shown')
+    return registry(scene('intro'), scene('silent', has_text=False), scene('bare'))
+
+
+@pytest.mark.parametrize('file_name, track', [
+    ('subtitle.txt', DEFAULT_TRACK),
+    ('subtitle.fr.txt', 'fr'),
+    ('subtitle..txt', None),
+    ('subtitles.txt', None),
+    ('intro.jpg', None),
+])
+def test_track_name(file_name, track):
+    assert track_name(file_name) == track
+
+
+def test_tracks_are_read_at_startup(subtitles):
+    store = SubtitleStore(subtitles)
+    assert store.tracks('intro') == ['default', 'fr']
+    assert store.get('intro') == 'Welcome'
+    assert store.get('intro', 'fr') == 'Bienvenue'
+
+
+def test_missing_track_falls_back_to_the_default_track(subtitles):
+    store = SubtitleStore(subtitles)
+    assert store.get('intro', 'de') == 'Welcome'
+
+
+def test_scenes_without_text_have_no_subtitle(subtitles):
+    store = SubtitleStore(subtitles)
+    assert store.get('silent') is None
+    assert store.get('bare') is None # No folder at all
+    assert store.tracks('silent') == []
+
+
+def test_lazy_store_reads_a_scene_on_first_use(subtitles, assets):
+    store = SubtitleStore(subtitles, lazy=True)
+    assert store.tracks('intro') == []
+    assets('intro', 'subtitle.txt', 'Edited before first use')
+    assert store.get('intro', 'de') == 'Edited before first use'
+    assert store.tracks('intro') == ['default', 'fr']
+
+
+def test_reload_reads_the_edited_files(subtitles, assets):
+    store = SubtitleStore(subtitles)
+    assets('intro', 'subtitle.txt', 'Edited')
+    store.reload([subtitles.get('intro')])
+    assert store.get('intro') == 'Edited'
+
+
+def test_bundled_subtitles_are_decoded_on_use(subtitles, tmp_path):
+    config = tmp_path / 'scenes.json'
+    config.write_text(json.dumps([scene('intro'), scene('silent', has_text=False)]))
+    build_bundle(str(config), str(tmp_path / 'assets.bundle'))
+    bundle = AssetBundle(str(tmp_path / 'assets.bundle'))
+    try:
+        store = SubtitleStore(subtitles, bundle)
+        assert store.get('intro', 'fr') == 'Bienvenue'
+        assert store.get('intro', 'de') == 'Welcome'
+        assert store.get('silent') is None
+    finally:
+        bundle.close()
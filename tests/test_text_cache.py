@@ -0,0 +1,87 @@
+from utils.text_cache import TextTextureCache, text_key
+
+
+class Texture:
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+
+
+class Rendered:
+    """Rendered text stand-in, like a Kivy core label with its texture."""
+
+    def __init__(self, width, height=1):
+        self.texture = Texture(width, height)
+        self.is_shortened = False
+
+
+class Label:
+    """Label stand-in with a few of the font properties of a Kivy label."""
+
+    _font_properties = ('text', 'font_size', 'color', 'padding', 'text_size')
+
+    def __init__(self, text, **properties):
+        self.text = text
+        self.font_size = 15
+        self.color = [1, 1, 1, 1]
+        self.padding = [0, 0, 0, 0]
+        self.text_size = [None, None]
+        self.font_style = 'Body1'
+        self.disabled = False
+        for name, value in properties.items():
+            setattr(self, name, value)
+
+
+def test_hits_and_misses_are_counted():
+    cache = TextTextureCache(byte_budget=1000)
+    rendered = Rendered(10)
+    assert cache.get('a') is None
+    cache.put('a', rendered)
+    assert cache.get('a') is rendered
+    assert cache.stats() == {'entries': 1, 'used_bytes': 40, 'byte_budget': 1000, 'hits': 1, 'misses': 1}
+
+
+def test_least_recently_used_text_is_evicted_over_the_budget():
+    cache = TextTextureCache(byte_budget=100) # 25 one-pixel-high columns of RGBA
+    cache.put('a', Rendered(10))
+    cache.put('b', Rendered(10))
+    cache.get('a') # b is now the least recently used
+    cache.put('c', Rendered(10))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['used_bytes'] == 80
+
+
+def test_replaced_entry_is_counted_once():
+    cache = TextTextureCache(byte_budget=100)
+    cache.put('a', Rendered(10))
+    replacement = Rendered(5)
+    cache.put('a', replacement)
+    assert cache.get('a') is replacement
+    assert cache.stats()['entries'] == 1 and cache.stats()['used_bytes'] == 20
+
+
+def test_text_over_the_budget_is_not_cached():
+    cache = TextTextureCache(byte_budget=100)
+    cache.put('a', Rendered(10))
+    cache.put('huge', Rendered(30))
+    assert cache.get('huge') is None
+    assert cache.get('a') is not None # Nothing was evicted for it
+
+
+def test_clear_drops_every_entry():
+    cache = TextTextureCache(byte_budget=100)
+    cache.put('a', Rendered(10))
+    cache.clear()
+    assert cache.get('a') is None and cache.stats()['used_bytes'] == 0
+
+
+def test_key_covers_the_text_and_its_font_properties():
+    key = text_key(Label('Run'))
+    assert key == text_key(Label('Run'))
+    assert key != text_key(Label('Hide'))
+    assert key != text_key(Label('Run', text_size=[200, None])) # Another wrap width
+    assert key != text_key(Label('Run', color=[1, 0, 0, 1]))
+    assert key != text_key(Label('Run', font_style='H6'))
+    assert key != text_key(Label('Run', disabled=True))
+    hash(key) # Lists are frozen into tuples
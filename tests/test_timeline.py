@@ -0,0 +1,95 @@
+from utils.timeline import ManualClock, Timeline
+
+
+def test_manual_clock_runs_callbacks_in_time_order():
+    clock = ManualClock()
+    calls = []
+    clock.call_later(2, lambda late: calls.append(('b', clock.now())))
+    clock.call_later(1, lambda late: calls.append(('a', clock.now())))
+    clock.call_later(1, lambda late: calls.append(('a2', clock.now()))) # Same time, run in scheduling order
+    clock.advance(1.5)
+    assert calls == [('a', 1), ('a2', 1)]
+    assert clock.now() == 1.5
+    clock.advance(1)
+    assert calls[-1] == ('b', 2)
+    assert clock.next_due() is None
+
+
+def test_manual_clock_skips_cancelled_callbacks():
+    clock = ManualClock()
+    calls = []
+    handle = clock.call_later(1, calls.append)
+    clock.call_later(3, calls.append)
+    handle.cancel()
+    assert clock.next_due() == 3
+    clock.advance(5)
+    assert calls == [3] # Called with the seconds since the clock last ran a callback
+
+
+def test_events_run_once_at_their_time():
+    clock = ManualClock()
+    timeline = Timeline(clock)
+    calls = []
+    timeline.schedule('fallback', 5, lambda late: calls.append(('fallback', clock.now())))
+    timeline.schedule('audio_start', 1, lambda late: calls.append(('audio_start', clock.now())))
+    assert timeline.pending() == ['audio_start', 'fallback']
+    clock.advance(10)
+    assert calls == [('audio_start', 1), ('fallback', 5)]
+    assert timeline.pending() == []
+
+
+def test_scheduling_a_name_again_replaces_the_pending_event():
+    clock = ManualClock()
+    timeline = Timeline(clock)
+    calls = []
+    timeline.schedule('fallback', 1, lambda late: calls.append('first'))
+    timeline.schedule('fallback', 3, lambda late: calls.append('second'))
+    clock.advance(2)
+    assert calls == []
+    clock.advance(2)
+    assert calls == ['second']
+
+
+def test_cancel_and_cancel_all():
+    clock = ManualClock()
+    timeline = Timeline(clock)
+    calls = []
+    timeline.schedule('a', 1, lambda late: calls.append('a'))
+    timeline.schedule('b', 2, lambda late: calls.append('b'))
+    timeline.cancel('a')
+    timeline.cancel('unknown')
+    clock.advance(3)
+    assert calls == ['b']
+
+    timeline.schedule('c', 1, lambda late: calls.append('c'))
+    timeline.schedule_interval('countdown', 0.5, lambda late: calls.append('tick'))
+    timeline.cancel_all()
+    assert clock.next_due() is None # The clock entry is dropped too
+    clock.advance(5)
+    assert calls == ['b']
+
+
+def test_interval_repeats_until_it_cancels_itself():
+    clock = ManualClock()
+    timeline = Timeline(clock)
+    ticks = []
+
+    def tick(late):
+        ticks.append(clock.now())
+        if len(ticks) == 3:
+            timeline.cancel('countdown')
+
+    timeline.schedule_interval('countdown', 1, tick)
+    clock.advance(10)
+    assert ticks == [1, 2, 3]
+    assert timeline.pending() == []
+
+
+def test_timeline_holds_one_clock_entry():
+    clock = ManualClock()
+    timeline = Timeline(clock)
+    for i in range(10):
+        timeline.schedule(f'event_{i}', 10 - i, lambda late: None)
+    assert len([entry for entry in clock._queue if not entry[2].cancelled]) == 1
+    assert clock.next_due() == 1
+
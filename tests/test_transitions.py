@@ -0,0 +1,207 @@
+import pytest
+
+import utils.transitions
+from utils.prefetcher import PrefetchedAssets
+from utils.scene_spec import SceneRegistry, SceneSpec
+from utils.timeline import ManualClock
+from utils.transitions import TransitionController
+
+
+class Handle:
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FrameClock:
+    """Clock running what was scheduled for the next frame, one frame per call to frame()."""
+
+    def __init__(self):
+        self.queued = []
+
+    def call_later(self, delay, callback):
+        handle = Handle()
+        self.queued.append((handle, callback))
+        return handle
+
+    def frame(self, count=1):
+        for _ in range(count):
+            queued, self.queued = self.queued, []
+            for handle, callback in queued:
+                if not handle.cancelled:
+                    callback(0)
+
+
+class Store:
+    def __init__(self):
+        self.released = []
+
+    def release(self, key):
+        self.released.append(key)
+
+
+class Prefetcher:
+    def take(self, scene_id):
+        return None # Nothing was loaded ahead
+
+
+class Subtitles:
+    def __init__(self):
+        self.read = []
+
+    def get(self, scene_id):
+        self.read.append(scene_id)
+
+
+class Recorder:
+    def __init__(self):
+        self.choices = []
+
+    def choice(self, scene_id, index, target):
+        self.choices.append((scene_id, index, target))
+
+
+class App:
+    """The parts of the game App the transition controller uses."""
+
+    def __init__(self, specs):
+        self.scenes = SceneRegistry(specs)
+        self.booted = True
+        self.prefetcher = Prefetcher()
+        self.asset_store = Store()
+        self.subtitles = Subtitles()
+        self.recorder = None
+        self.image_lod = None
+        self.current_scene_id = 'intro'
+        self.switches = []
+
+    def acquire_audio(self, store, scene_id, file_name):
+        return f'{scene_id}/{file_name}', f'sound of {scene_id}'
+
+    def switch_to_scene(self, scene_id, prefetched=None):
+        self.switches.append((scene_id, prefetched))
+        self.current_scene_id = scene_id
+
+
+def spec(scene_id, media_type='image', audio_source='audio.mp3', has_text=True):
+    return SceneSpec(scene_id, 'image.jpg', media_type, audio_source, has_text=has_text)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    """Return an app in the intro, loading images as 'image of <scene>' without decoding anything."""
+    monkeypatch.setattr(utils.transitions, 'acquire_image',
+                        lambda store, scene_id, file_name, lod: (f'{scene_id}/{file_name}', f'image of {scene_id}'))
+    return App([spec('intro'), spec('hall'), spec('end')])
+
+
+def test_switch_is_prepared_over_frames_then_swapped_at_once(app):
+    clock = FrameClock()
+    transitions = TransitionController(app, clock, frame_budget_ms=0) # One step per frame
+    assert transitions.request('hall', choice_index=0)
+    assert transitions.busy and app.switches == []
+    clock.frame(4) # Look-up, image, audio and subtitle
+    assert app.switches == [] and app.subtitles.read == ['hall']
+    clock.frame()
+    assert app.switches == [('hall', PrefetchedAssets('image of hall', 'sound of hall', ('hall/image.jpg', 'hall/audio.mp3')))]
+    assert not transitions.busy
+    assert transitions.stats()['frames'] == 5 and transitions.stats()['swaps'] == 1
+
+
+def test_steps_fitting_the_frame_budget_run_in_one_frame(app):
+    clock = ManualClock()
+    transitions = TransitionController(app, clock, frame_budget_ms=1000)
+    transitions.request('hall')
+    clock.advance(0)
+    assert [scene_id for scene_id, _ in app.switches] == ['hall']
+    assert transitions.stats()['frames'] == 1
+
+
+def test_repeated_target_is_coalesced(app):
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    assert transitions.request('hall')
+    assert not transitions.request('hall') # A double tap
+    clock.advance(0)
+    assert [scene_id for scene_id, _ in app.switches] == ['hall']
+    assert transitions.stats()['requests'] == 2 and transitions.stats()['coalesced'] == 1
+
+
+def test_latest_choice_replaces_the_pending_one(app):
+    clock = FrameClock()
+    transitions = TransitionController(app, clock, frame_budget_ms=0)
+    transitions.request('hall')
+    clock.frame(2) # The image of the hall is loaded
+    assert transitions.request('end')
+    assert app.asset_store.released == ['hall/image.jpg']
+    clock.frame(5)
+    assert [scene_id for scene_id, _ in app.switches] == ['end']
+
+
+def test_auto_advance_does_not_replace_a_choice(app):
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('hall')
+    assert not transitions.request('end', user=False) # The audio of the intro ended after the tap
+    clock.advance(0)
+    assert [scene_id for scene_id, _ in app.switches] == ['hall']
+
+
+def test_choice_replaces_a_pending_auto_advance(app):
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('end', user=False)
+    assert transitions.request('hall')
+    clock.advance(0)
+    assert [scene_id for scene_id, _ in app.switches] == ['hall']
+
+
+def test_unknown_scene_is_dropped(app):
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('nowhere')
+    clock.advance(0)
+    assert app.switches == [] and not transitions.busy
+
+
+def test_scene_loaded_by_the_boot_is_found(app):
+    app.booted = False
+    app.finish_boot = lambda: app.scenes.add(spec('basement'))
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('basement')
+    clock.advance(0)
+    assert [scene_id for scene_id, _ in app.switches] == ['basement']
+
+
+def test_switch_from_a_scene_already_left_is_dropped(app):
+    clock = FrameClock()
+    transitions = TransitionController(app, clock, frame_budget_ms=0)
+    transitions.request('hall')
+    clock.frame(4)
+    app.current_scene_id = 'end' # Switched meanwhile without the controller, such as by the hot reload
+    clock.frame()
+    assert app.switches == [] and not transitions.busy
+    assert app.asset_store.released == ['hall/image.jpg', 'hall/audio.mp3']
+
+
+def test_empty_assets_are_passed_to_the_switch(app):
+    app.scenes.add(spec('credits', media_type='video', audio_source=None, has_text=False))
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('credits')
+    clock.advance(0)
+    assert app.switches == [('credits', PrefetchedAssets(None, None, ()))] # Not None, the prefetcher is not asked again
+    assert app.subtitles.read == []
+
+
+def test_winning_choice_is_recorded(app):
+    app.recorder = Recorder()
+    clock = ManualClock()
+    transitions = TransitionController(app, clock)
+    transitions.request('hall', choice_index=0)
+    transitions.request('end', choice_index=1)
+    clock.advance(0)
+    assert app.recorder.choices == [('intro', 1, 'end')]
@@ -0,0 +1,228 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+
+from configs.constants import DEFAULTS
+from utils.bundle import AssetBundle
+from utils.helper import asset_path
+
+
+class _Entry:
+    """A decoded asset held by the store."""
+
+    __slots__ = ('value', 'size', 'refs')
+
+    def __init__(self, value: Any, size: int):
+        self.value = value
+        self.size = size
+        self.refs = 0
+
+
+class AssetStore:
+    """Content-addressed, reference-counted cache of decoded assets.
+
+    Every (scene_id, file_name) is mapped to a key derived from the hash of the file
+    content, so identical files used by several scenes are decoded once and shared.
+    Entries that are no longer referenced stay cached until the byte budget is
+    exceeded, then the least recently used ones are evicted. When a bundle is given,
+    packed assets are decoded from it instead of the loose files.
+    """
+
+    def __init__(self, byte_budget: int = DEFAULTS['ASSET_CACHE_BYTES'], bundle: Optional[AssetBundle] = None):
+        self.byte_budget = byte_budget
+        self.bundle = bundle
+        self.used_bytes = 0
+        self.decodes = 0
+        self.shared = 0
+        self._lock = threading.Lock()
+        self._hashes: Dict[str, Tuple[int, int, str]] = {} # path -> (size, mtime, content key)
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._loading: Dict[str, threading.Event] = {}
+        self._disposers: Dict[str, Callable[[Any], None]] = {}
+        self._loose: Set[str] = set() # Paths edited since the bundle was built, read from their files
+        self._stale: Set[str] = set() # Keys of edited content still in use, dropped once released
+
+    # Method to map an asset file to the key of its content
+    def content_key(self, scene_id: str, file_name: str) -> str:
+        """Return the content key of a scene asset, hashing the file only when it changed.
+
+        Args:
+            scene_id (str): scene id owning the asset
+            file_name (str): asset file name
+
+        Returns:
+            str: hex digest of the file content
+        """
+        path = asset_path(scene_id, file_name)
+        if self.bundle and path not in self._loose:
+            key = self.bundle.content_key(scene_id, file_name) # Hashed when the bundle was built
+            if key:
+                return key
+
+        stat = os.stat(path)
+        with self._lock:
+            known = self._hashes.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1 << 20), b''):
+                digest.update(chunk)
+        key = digest.hexdigest()
+        with self._lock:
+            self._hashes[path] = (stat.st_size, stat.st_mtime_ns, key)
+        return key
+
+    def acquire(self, scene_id: str, file_name: str, loader: Callable[[str, Optional[memoryview]], Any],
+                dispose: Optional[Callable[[Any], None]] = None,
+                sizer: Optional[Callable[[Any], int]] = None, variant: str = '') -> Tuple[str, Any]:
+        """Return the decoded asset for a scene file and take a reference on it.
+
+        The asset is decoded with loader only if no file with the same content was
+        decoded before. Each call must be matched by a call to release.
+
+        Args:
+            scene_id (str): scene id owning the asset
+            file_name (str): asset file name
+            loader (Callable[[str, Optional[memoryview]], Any]): decodes the asset from its path, or from
+                its packed bytes when they are in the bundle
+            dispose (Optional[Callable[[Any], None]]): frees the asset when it is evicted
+            sizer (Optional[Callable[[Any], int]]): bytes used by the decoded asset, the file size by default
+            variant (str): name of a derived version of the content, such as a downscaled image, cached apart
+
+        Returns:
+            Tuple[str, Any]: the content key and the decoded asset
+        """
+        key = self.content_key(scene_id, file_name)
+        if variant:
+            key = f'{key}@{variant}'
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.refs += 1
+                    self._entries.move_to_end(key)
+                    self.shared += 1
+                    return key, entry.value
+                event = self._loading.get(key)
+                if event is None: # Nobody is decoding this content yet, this thread does it
+                    event = self._loading[key] = threading.Event()
+                    break
+            event.wait() # Another thread is decoding the same content, waiting for its result
+
+        try:
+            path = asset_path(scene_id, file_name)
+            data = self.bundle.get(scene_id, file_name) if self.bundle and path not in self._loose else None
+            value = loader(path, data)
+            if sizer:
+                size = sizer(value)
+            else:
+                size = len(data) if data is not None else os.path.getsize(path)
+        except BaseException:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+            raise
+
+        with self._lock:
+            entry = self._entries[key] = _Entry(value, size)
+            entry.refs = 1
+            self.used_bytes += size
+            self.decodes += 1
+            if dispose:
+                self._disposers[key] = dispose
+            del self._loading[key]
+            evicted = self._evict()
+        event.set()
+        self._dispose(evicted)
+        return key, value
+
+    def release(self, key: str) -> None:
+        """Drop a reference taken by acquire.
+
+        Args:
+            key (str): content key returned by acquire
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.refs == 0:
+                return
+            entry.refs -= 1
+            if not entry.refs and key in self._stale: # Edited content, nobody will ask for it again
+                evicted = [self._remove(key)]
+            else:
+                evicted = self._evict()
+        self._dispose(evicted)
+
+    # Method to forget an asset file edited on disk, used by the hot reload
+    def invalidate(self, scene_id: str, file_name: str) -> None:
+        """Forget the content of an asset file that changed, so the next acquire decodes the new file.
+
+        The file is read from disk from now on, even if an older version is in the bundle.
+        Its decoded content is dropped now if unused, or as soon as it is released.
+
+        Args:
+            scene_id (str): scene id owning the asset
+            file_name (str): asset file name
+        """
+        path = asset_path(scene_id, file_name)
+        keys = {self.bundle.content_key(scene_id, file_name)} if self.bundle and path not in self._loose else set()
+        evicted = []
+        with self._lock:
+            known = self._hashes.pop(path, None)
+            if known:
+                keys.add(known[2])
+            self._loose.add(path)
+            for key in [key for key in self._entries if key.partition('@')[0] in keys]: # The content and its variants
+                entry = self._entries[key]
+                if entry.refs:
+                    self._stale.add(key)
+                else:
+                    evicted.append(self._remove(key))
+        self._dispose(evicted)
+
+    def _remove(self, key: str) -> Tuple[Optional[Callable[[Any], None]], Any]:
+        """Remove an entry and return its disposer and value. Called with the lock held."""
+        entry = self._entries.pop(key)
+        self.used_bytes -= entry.size
+        self._stale.discard(key)
+        return self._disposers.pop(key, None), entry.value
+
+    def _evict(self) -> list:
+        """Remove unreferenced entries, least recently used first, until the budget is met. Called with the lock held."""
+        evicted = []
+        if self.used_bytes <= self.byte_budget:
+            return evicted
+        for key in list(self._entries):
+            entry = self._entries[key]
+            if entry.refs:
+                continue
+            evicted.append(self._remove(key))
+            if self.used_bytes <= self.byte_budget:
+                break
+        return evicted
+
+    @staticmethod
+    def _dispose(evicted: list) -> None:
+        """Free evicted assets outside of the lock."""
+        for dispose, value in evicted:
+            if dispose:
+                dispose(value)
+
+    def stats(self) -> Dict[str, int]:
+        """Return the store counters.
+
+        Returns:
+            Dict[str, int]: entries, used bytes, budget, decodes and shared hits
+        """
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'used_bytes': self.used_bytes,
+                'byte_budget': self.byte_budget,
+                'decodes': self.decodes,
+                'shared': self.shared,
+            }
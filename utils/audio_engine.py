@@ -0,0 +1,257 @@
+import threading
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
+
+from configs.constants import DEFAULTS
+from utils.asset_store import AssetStore
+from utils.tracing import tracer
+
+if TYPE_CHECKING: # numpy is imported on first decode or mix, the game imports this module at startup
+    import numpy as np
+
+
+class PcmBuffer:
+    """Decoded audio as interleaved 16-bit samples, shared read-only by every voice playing it."""
+
+    __slots__ = ('samples', 'channels', 'sample_rate')
+
+    def __init__(self, samples: 'np.ndarray', channels: int, sample_rate: int):
+        self.samples = samples
+        self.channels = channels
+        self.sample_rate = sample_rate
+
+    @property
+    def frames(self) -> int:
+        """Number of sample frames, one sample per channel each."""
+        return len(self.samples) // self.channels
+
+    @property
+    def duration(self) -> float:
+        """Length in seconds."""
+        return self.frames / self.sample_rate
+
+
+# Function to decode an audio file once into PCM samples
+def decode_pcm(path: str, data: Optional[memoryview] = None, sample_rate: int = DEFAULTS['AUDIO_SAMPLE_RATE'],
+               channels: int = 2) -> PcmBuffer:
+    """Decode an mp3, wav, ogg or flac file to the output format of the engine.
+
+    Args:
+        path (str): path of the audio file
+        data (Optional[memoryview]): encoded bytes from the asset bundle, decoded instead of the file
+        sample_rate (int): output sample rate, the audio is resampled to it
+        channels (int): output channels
+
+    Returns:
+        PcmBuffer: the decoded samples
+    """
+    import miniaudio # Optional dependency, checked by AudioEngine.create
+    import numpy as np
+
+    with tracer.span('decode_pcm', path=path):
+        if data is not None:
+            decoded = miniaudio.decode(bytes(data), nchannels=channels, sample_rate=sample_rate)
+        else:
+            decoded = miniaudio.decode_file(path, nchannels=channels, sample_rate=sample_rate)
+    return PcmBuffer(np.frombuffer(decoded.samples, dtype=np.int16), channels, sample_rate)
+
+
+# Function to turn the repeat and backoff settings of a scene into the start times of its plays
+def repeat_cues(buffer: PcmBuffer, repeat_count: int, backoff_seconds: float) -> List[int]:
+    """Return the sample frames at which each play of the audio starts, relative to the first.
+
+    The audio plays repeat_count times, with backoff_seconds of silence between the end of
+    a play and the start of the next, like Scene.on_audio_stop does with the Kivy Clock.
+    A backoff of 0 gives gapless repeats.
+
+    Args:
+        buffer (PcmBuffer): the audio
+        repeat_count (int): number of plays
+        backoff_seconds (float): silence between plays
+
+    Returns:
+        List[int]: start frame of every play
+    """
+    step = buffer.frames + int(round(backoff_seconds * buffer.sample_rate))
+    return [i * step for i in range(max(repeat_count, 1))]
+
+
+class Voice:
+    """A buffer played at a list of cues, in frames of the mixer clock."""
+
+    __slots__ = ('buffer', 'cues', 'on_finished', 'stopped')
+
+    def __init__(self, buffer: PcmBuffer, cues: List[int], on_finished: Optional[Callable[['Voice'], None]]):
+        self.buffer = buffer
+        self.cues = cues
+        self.on_finished = on_finished
+        self.stopped = False
+
+    @property
+    def end(self) -> int:
+        """Mixer frame at which the last play ends."""
+        return self.cues[-1] + self.buffer.frames
+
+
+class AudioEngine:
+    """Mixes pre-decoded audio on the thread of the audio device.
+
+    Every audio file is decoded once into a PcmBuffer kept by the asset store, so a
+    repeat or a return to a scene replays the same memory. The repeats of a scene are a
+    cue list on the sample clock of the mixer, so they start on the exact frame and need
+    no timer. on_finished is dispatched to the UI thread when the last play ends.
+    """
+
+    def __init__(self, sample_rate: int = DEFAULTS['AUDIO_SAMPLE_RATE'], channels: int = 2,
+                 block_ms: int = DEFAULTS['AUDIO_BLOCK_MS'], dispatch: Optional[Callable[[Callable[[], None]], None]] = None,
+                 device: Any = None):
+        """Start the mixer.
+
+        Args:
+            sample_rate (int): output sample rate
+            channels (int): output channels
+            block_ms (int): length of the blocks mixed at once, the latency of the output
+            dispatch (Optional[Callable[[Callable[[], None]], None]]): runs a callback on the UI thread, the Kivy Clock by default
+            device (Any): output device started with the mixer generator, a miniaudio PlaybackDevice by default
+        """
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame = 0 # Frames mixed since the engine started, the clock of the cues
+        self.underruns = 0
+        self._voices: List[Voice] = []
+        self._lock = threading.Lock()
+        self._mix: Optional['np.ndarray'] = None
+        self._dispatch = dispatch or self._clock_dispatch
+        if device is None:
+            import miniaudio
+            device = miniaudio.PlaybackDevice(output_format=miniaudio.SampleFormat.SIGNED16, nchannels=channels,
+                                              sample_rate=sample_rate, buffersize_msec=block_ms)
+        self.device = device
+        stream = self.stream()
+        next(stream) # Generators handed to miniaudio must be started
+        self.device.start(stream)
+
+    @classmethod
+    def create(cls) -> Optional['AudioEngine']:
+        """Return the engine, or None when miniaudio or numpy is not installed or no audio device can be opened."""
+        try:
+            import miniaudio # noqa: F401
+            import numpy # noqa: F401
+        except ImportError:
+            return None
+        try:
+            return cls()
+        except Exception as e:
+            print(f"Error starting the audio engine, using SoundLoader: {e}")
+            return None
+
+    @staticmethod
+    def _clock_dispatch(callback: Callable[[], None]) -> None:
+        """Run a callback on the UI thread through the Kivy Clock, which is safe to call from any thread."""
+        from kivy.clock import Clock
+        Clock.schedule_once(lambda _: callback())
+
+    def acquire(self, store: AssetStore, scene_id: str, file_name: str) -> Tuple[str, PcmBuffer]:
+        """Get the shared decoded samples of a scene audio file, decoding it on first use.
+
+        Args:
+            store (AssetStore): the asset store
+            scene_id (str): scene id owning the audio
+            file_name (str): audio file name
+
+        Returns:
+            Tuple[str, PcmBuffer]: the content key to release and the samples
+        """
+        return store.acquire(scene_id, file_name,
+                             lambda path, data: decode_pcm(path, data, self.sample_rate, self.channels),
+                             sizer=lambda buffer: buffer.samples.nbytes)
+
+    def play(self, buffer: PcmBuffer, cues: List[int], on_finished: Optional[Callable[[Voice], None]] = None) -> Voice:
+        """Play a buffer at each cue, starting with the next mixed block.
+
+        Args:
+            buffer (PcmBuffer): samples to play
+            cues (List[int]): start frame of every play relative to the first, see repeat_cues
+            on_finished (Optional[Callable[[Voice], None]]): called on the UI thread once the last play ended
+
+        Returns:
+            Voice: the playing voice, to stop it
+        """
+        with self._lock:
+            voice = Voice(buffer, [self.frame + cue for cue in cues], on_finished)
+            self._voices.append(voice)
+        return voice
+
+    @property
+    def voices(self) -> int:
+        """Number of voices playing or waiting for a cue."""
+        with self._lock:
+            return len(self._voices)
+
+    def stop(self, voice: Voice) -> None:
+        """Stop a voice right away, its on_finished is not called."""
+        voice.stopped = True
+        with self._lock:
+            if voice in self._voices:
+                self._voices.remove(voice)
+
+    def stream(self):
+        """Generator feeding the audio device, it receives a frame count and returns the mixed samples."""
+        frames = yield b''
+        while True:
+            frames = yield self.render(frames)
+
+    # Method run on the audio device thread
+    def render(self, frames: int) -> bytes:
+        """Mix the next frames of every voice.
+
+        Args:
+            frames (int): number of frames asked for by the device
+
+        Returns:
+            bytes: interleaved 16-bit samples
+        """
+        import numpy as np # Already loaded by the first decode, a lookup in sys.modules
+
+        size = frames * self.channels
+        if self._mix is None or len(self._mix) != size: # The mix buffer is reused while the block size stays the same
+            self._mix = np.zeros(size, dtype=np.int32)
+        mix = self._mix
+        mix.fill(0)
+        with self._lock:
+            voices = list(self._voices)
+            start = self.frame
+            self.frame += frames
+        end = start + frames
+
+        finished = []
+        for voice in voices:
+            samples = voice.buffer.samples
+            length = voice.buffer.frames
+            for cue in voice.cues:
+                if cue >= end:
+                    break
+                offset = start - cue # Position in the buffer at the start of the block, negative before the cue
+                if offset >= length:
+                    continue
+                source = max(offset, 0)
+                target = max(-offset, 0)
+                count = min(length - source, frames - target)
+                mix[target * self.channels:(target + count) * self.channels] += \
+                    samples[source * self.channels:(source + count) * self.channels]
+            if voice.end <= end:
+                finished.append(voice)
+
+        if finished:
+            with self._lock:
+                self._voices = [voice for voice in self._voices if voice not in finished]
+            for voice in finished:
+                if voice.on_finished and not voice.stopped:
+                    self._dispatch(lambda voice=voice: voice.on_finished(voice))
+        np.clip(mix, -32768, 32767, out=mix)
+        return mix.astype(np.int16).tobytes()
+
+    def close(self) -> None:
+        """Stop the audio device."""
+        with self._lock:
+            self._voices = []
+        self.device.close()
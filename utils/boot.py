@@ -0,0 +1,191 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from configs.constants import BUNDLE_PATH, INTRO_SCENE_ID
+from utils.bundle import AssetBundle
+from utils.scene_graph import CompiledSceneGraph, load_scene_graph
+from utils.scene_spec import SceneSpec
+from utils.subtitle_store import SubtitleStore
+
+# Stages run on the boot thread, with the share of the progress each one stands for
+BOOT_STAGES = (('open asset bundle', 0.1), ('load scenes', 0.6), ('load subtitles', 0.25), ('warm fonts', 0.05))
+
+
+# Function to read the scenes of a json config one at a time
+def iter_scenes_data(config_path: str, chunk_size: int = 1 << 16) -> Iterator[Dict]:
+    """Yield the scenes of a json config in file order, reading only as much of the file as needed.
+
+    Args:
+        config_path (str): path of the scenes json config, a list of scene objects
+        chunk_size (int): characters read at once
+
+    Raises:
+        ValueError: when the file is not a json list of objects
+
+    Returns:
+        Iterator[Dict]: the scene objects
+    """
+    decoder = json.JSONDecoder()
+    with open(config_path, 'r', encoding='utf-8') as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{config_path} is not a list of scenes")
+        position = 1
+        eof = False
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position < len(buffer) and buffer[position] == ']':
+                return
+            scene_data = None
+            if position < len(buffer):
+                try:
+                    scene_data, position = decoder.raw_decode(buffer, position)
+                except ValueError: # The scene object goes on in the next chunk
+                    pass
+            if scene_data is not None:
+                yield scene_data
+                continue
+            if eof:
+                raise ValueError(f"{config_path} ends in the middle of a scene")
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+
+# Function to pre-read the font files of the theme, so the first labels do not wait on the disk
+def warm_fonts() -> int:
+    """Read the font files registered by KivyMD into the OS file cache.
+
+    Returns:
+        int: bytes read, 0 when KivyMD is not installed
+    """
+    try:
+        from kivymd.font_definitions import fonts
+    except ImportError:
+        return 0
+    read = 0
+    for font in fonts:
+        for key, path in font.items():
+            if not key.startswith('fn_') or not path:
+                continue
+            try:
+                with open(path, 'rb') as file:
+                    while True:
+                        chunk = file.read(1 << 20)
+                        if not chunk:
+                            break
+                        read += len(chunk)
+            except OSError:
+                pass
+    return read
+
+
+class StagedBoot:
+    """Boots the game in two stages so the first scene shows before the story is loaded.
+
+    first_specs reads the config only up to the scenes shown first, which is usually
+    the first object of the file, so the first frame costs the same whatever the story
+    size. start then loads the rest on a background thread: the asset bundle, the
+    validated and compiled scene graph, every subtitle and the fonts. Progress can be
+    read from any thread through stage, progress and ready.
+    """
+
+    def __init__(self, config_path: str, start_id: str = INTRO_SCENE_ID, bundle_path: str = BUNDLE_PATH):
+        """Set up the boot of a json config.
+
+        Args:
+            config_path (str): path of the scenes json config
+            start_id (str): id of the first scene of a new game
+            bundle_path (str): asset bundle opened in the background when it exists
+        """
+        self.config_path = config_path
+        self.start_id = start_id
+        self.bundle_path = bundle_path
+        self.stage = 'first scene'
+        self.progress = 0.0 # Fraction of the background boot done, from 0 to 1
+        self.timings: List[Tuple[str, float]] = []
+        self.error: Optional[BaseException] = None
+        self.graph: Optional[CompiledSceneGraph] = None
+        self.bundle: Optional[AssetBundle] = None
+        self.subtitles: Optional[SubtitleStore] = None
+        self._done = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the background boot finished, successfully or not."""
+        return self._done.is_set()
+
+    def first_specs(self, resume_digest: Optional[int] = None,
+                    digest: Optional[Callable[[str], int]] = None) -> Tuple[Optional[SceneSpec], Optional[SceneSpec]]:
+        """Find the start scene and the scene to resume, scanning the config only until both are found.
+
+        Args:
+            resume_digest (Optional[int]): digest of the scene the player was last in, from the session journal
+            digest (Optional[Callable[[str], int]]): digest of a scene id, the journal one
+
+        Returns:
+            Tuple[Optional[SceneSpec], Optional[SceneSpec]]: the start scene and the resumed scene, None when not found
+        """
+        start = resume = None
+        for scene_data in iter_scenes_data(self.config_path):
+            scene_id = scene_data.get('scene_id')
+            if scene_id == self.start_id:
+                start = SceneSpec.from_data(scene_data)
+            if resume_digest is not None and resume is None and digest(scene_id) == resume_digest:
+                resume = SceneSpec.from_data(scene_data)
+            if start and (resume or resume_digest is None):
+                break
+        return start, resume
+
+    def start(self, on_ready: Optional[Callable[[], None]] = None) -> None:
+        """Load the rest of the story on a background thread.
+
+        Args:
+            on_ready (Optional[Callable[[], None]]): called on the boot thread once done, even on errors
+        """
+        self._thread = threading.Thread(target=self._run, args=(on_ready,), name='boot', daemon=True)
+        self._thread.start()
+
+    def _run(self, on_ready: Optional[Callable[[], None]]) -> None:
+        """Run the boot stages, keeping the first error to raise it on the UI thread."""
+        steps = {
+            'open asset bundle': lambda: setattr(self, 'bundle', AssetBundle.open_default(self.bundle_path)),
+            'load scenes': lambda: setattr(self, 'graph', load_scene_graph(self.config_path, self.start_id)),
+            'load subtitles': lambda: setattr(self, 'subtitles', SubtitleStore(self.graph.registry, self.bundle)),
+            'warm fonts': warm_fonts,
+        }
+        try:
+            for stage, share in BOOT_STAGES:
+                self.stage = stage
+                start = time.perf_counter()
+                steps[stage]()
+                self.timings.append((stage, time.perf_counter() - start))
+                self.progress = min(self.progress + share, 1.0)
+            self.stage = 'ready'
+        except BaseException as e:
+            self.error = e
+            self.stage = 'failed'
+        self.progress = 1.0
+        self._done.set()
+        if on_ready:
+            on_ready()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the background boot finished.
+
+        Args:
+            timeout (Optional[float]): seconds to wait at most, forever when None
+
+        Returns:
+            bool: True when the boot finished
+        """
+        return self._done.wait(timeout)
+
+    def report(self) -> str:
+        """Return how long every stage of the background boot took."""
+        return '\n'.join(['Background boot:'] + [f"  {stage:<20} {seconds * 1000:8.1f} ms" for stage, seconds in self.timings])
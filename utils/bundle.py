@@ -0,0 +1,224 @@
+import argparse
+import hashlib
+import io
+import json
+import mmap
+import os
+import struct
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from configs.constants import BUNDLE_PATH, CONFIG_PATH, WINDOW_SIZE
+from utils.helper import asset_path
+from utils.tracing import traced
+
+MAGIC = b'SUEB'
+VERSION = 1
+HEADER = struct.Struct('<4sIQQ') # magic, version, index offset, index length
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+
+# Function to list every asset file referenced by the scenes config
+def referenced_assets(scenes_data: List[Dict]) -> Iterator[Tuple[str, str]]:
+    """Yield the (scene_id, file_name) of every asset referenced by the scenes.
+
+    Args:
+        scenes_data (List[Dict]): scenes from the json config
+
+    Returns:
+        Iterator[Tuple[str, str]]: scene id and file name pairs
+    """
+    for scene_data in scenes_data:
+        scene_id = scene_data['scene_id']
+        yield scene_id, scene_data['media_source']
+        if scene_data.get('audio_source'):
+            yield scene_id, scene_data['audio_source']
+        if scene_data.get('has_text', True):
+            yield scene_id, 'subtitle.txt'
+            yield from ((scene_id, track) for track in subtitle_tracks(scene_id))
+
+
+# Function to list the extra subtitle tracks of a scene, stored as subtitle.<track>.txt
+def subtitle_tracks(scene_id: str) -> List[str]:
+    """Return the file names of the extra subtitle tracks of a scene.
+
+    Args:
+        scene_id (str): scene id
+
+    Returns:
+        List[str]: subtitle track file names, without the default subtitle.txt
+    """
+    try:
+        file_names = os.listdir(os.path.dirname(asset_path(scene_id, 'subtitle.txt')))
+    except FileNotFoundError:
+        return []
+    return sorted(name for name in file_names if name.startswith('subtitle.') and name.endswith('.txt') and name != 'subtitle.txt')
+
+
+# Function to shrink an image so it is no larger than the window
+def resize_image(data: bytes, file_name: str, max_size: Tuple[int, int]) -> bytes:
+    """Downscale an encoded image to fit in max_size, keeping its format and aspect ratio.
+
+    Args:
+        data (bytes): encoded image
+        file_name (str): file name, used to pick the output format
+        max_size (Tuple[int, int]): maximum width and height
+
+    Returns:
+        bytes: the encoded, resized image, or the input if it already fits
+    """
+    from PIL import Image as PILImage # Pillow is only needed when building bundles
+
+    with PILImage.open(io.BytesIO(data)) as image:
+        if image.width <= max_size[0] and image.height <= max_size[1]:
+            return data
+        image.thumbnail(max_size, PILImage.LANCZOS)
+        output = io.BytesIO()
+        if file_name.lower().endswith('.png'):
+            image.save(output, format='PNG', optimize=True)
+        else:
+            image.convert('RGB').save(output, format='JPEG', quality=90, optimize=True)
+        return output.getvalue()
+
+
+def build_bundle(config_path: str, output_path: str, max_image_size: Tuple[int, int] = WINDOW_SIZE) -> Dict[str, int]:
+    """Pack every asset referenced by the config into a single bundle file.
+
+    Args:
+        config_path (str): path of the scenes json config
+        output_path (str): path of the bundle to write
+        max_image_size (Tuple[int, int]): images are downscaled to fit in this size
+
+    Returns:
+        Dict[str, int]: number of files, unique blobs and bytes written
+    """
+    with open(config_path, 'r') as file:
+        scenes_data = json.load(file)
+
+    files: Dict[str, str] = {}
+    blobs: Dict[str, List[int]] = {}
+    tmp_path = output_path + '.tmp'
+    with open(tmp_path, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, VERSION, 0, 0)) # Placeholder header, rewritten once the index is known
+        for scene_id, file_name in referenced_assets(scenes_data):
+            path = asset_path(scene_id, file_name)
+            try:
+                with open(path, 'rb') as file:
+                    data = file.read()
+            except OSError as e:
+                print(f"Skipping missing asset {path}: {e}")
+                continue
+            if file_name.lower().endswith(IMAGE_EXTENSIONS):
+                data = resize_image(data, file_name, max_image_size)
+
+            digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+            if digest not in blobs: # Identical content is stored only once
+                blobs[digest] = [output.tell(), len(data)]
+                output.write(data)
+            files[f'{scene_id}/{file_name}'] = digest
+
+        index = json.dumps({'files': files, 'blobs': blobs}).encode('utf-8')
+        index_offset = output.tell()
+        output.write(index)
+        output.seek(0)
+        output.write(HEADER.pack(MAGIC, VERSION, index_offset, len(index)))
+    os.replace(tmp_path, output_path)
+    return {'files': len(files), 'blobs': len(blobs), 'bytes': index_offset + len(index)}
+
+
+class AssetBundle:
+    """Read-only, memory-mapped view of a bundle built by build_bundle.
+
+    Assets are returned as memoryview slices of the mapping, so no data is copied
+    and the whole bundle is served from a single open file.
+    """
+
+    def __init__(self, path: str = BUNDLE_PATH):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._view = memoryview(self._mmap)
+
+        magic, version, index_offset, index_length = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} asset bundle")
+        index = json.loads(bytes(self._view[index_offset:index_offset + index_length]))
+        self._files: Dict[str, str] = index['files']
+        self._blobs: Dict[str, List[int]] = index['blobs']
+
+    @classmethod
+    def open_default(cls, path: str = BUNDLE_PATH) -> Optional['AssetBundle']:
+        """Open the bundle if it was built, otherwise return None.
+
+        Args:
+            path (str): path of the bundle
+
+        Returns:
+            Optional[AssetBundle]: the opened bundle
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            return cls(path)
+        except (OSError, ValueError) as e:
+            print(f"Error opening asset bundle {path}: {e}")
+            return None
+
+    def __contains__(self, item: Tuple[str, str]) -> bool:
+        scene_id, file_name = item
+        return f'{scene_id}/{file_name}' in self._files
+
+    def names(self) -> Iterator[Tuple[str, str]]:
+        """Yield the (scene_id, file_name) of every packed asset."""
+        for name in self._files:
+            scene_id, _, file_name = name.partition('/')
+            yield scene_id, file_name
+
+    def content_key(self, scene_id: str, file_name: str) -> Optional[str]:
+        """Return the content hash of a packed asset, or None if it is not in the bundle."""
+        return self._files.get(f'{scene_id}/{file_name}')
+
+    @traced('AssetBundle.get')
+    def get(self, scene_id: str, file_name: str) -> Optional[memoryview]:
+        """Return a zero-copy slice of a packed asset.
+
+        Args:
+            scene_id (str): scene id owning the asset
+            file_name (str): asset file name
+
+        Returns:
+            Optional[memoryview]: the asset bytes, None if it is not in the bundle
+        """
+        digest = self._files.get(f'{scene_id}/{file_name}')
+        if digest is None:
+            return None
+        offset, length = self._blobs[digest]
+        return self._view[offset:offset + length]
+
+    def read_text(self, scene_id: str, file_name: str) -> Optional[str]:
+        """Return a packed text asset decoded as utf-8, or None if it is not in the bundle."""
+        data = self.get(scene_id, file_name)
+        return None if data is None else str(data, 'utf-8')
+
+    def close(self) -> None:
+        """Unmap the bundle and close its file."""
+        try:
+            self._view.release()
+            self._mmap.close()
+        except BufferError: # Slices handed out are still alive, the mapping is freed with them
+            pass
+        self._file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pack the assets referenced by the scenes config into a bundle.')
+    parser.add_argument('--config', default=CONFIG_PATH, help='path of the scenes json config')
+    parser.add_argument('--output', default=BUNDLE_PATH, help='path of the bundle to write')
+    args = parser.parse_args()
+    result = build_bundle(args.config, args.output)
+    print(f"Packed {result['files']} files ({result['blobs']} unique) into {args.output}, {result['bytes']} bytes")
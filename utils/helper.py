@@ -1,20 +1,12 @@
-def read_file(file_path):
+def asset_path(scene_id, file_name):
     """
-    Read the content of a file and return it as a string.
+    Build the path of an asset file that belongs to a scene.
 
     Parameters:
-        file_path (str): The path to the file.
+        scene_id (str): The id of the scene owning the asset.
+        file_name (str): The name of the asset file.
 
     Returns:
-        str: The content of the file.
+        str: The relative path of the asset file.
     """
-    try:
-        with open(file_path, 'r') as file:
-            content = file.read()
-        return content
-    except FileNotFoundError: # Handle the exception
-        print(f"Error: File not found at path {file_path}")
-        return None
-    except Exception as e: # Handle the exception
-        print(f"Error: {e}") # Print an error message with the details of the exception
-        return None # Return None to indicate an error
\ No newline at end of file
+    return f'assets/{scene_id}/{file_name}'
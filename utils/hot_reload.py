@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from utils.bundle import subtitle_tracks
+from utils.helper import asset_path
+from utils.scene_graph import CompiledSceneGraph, validate_scenes
+from utils.scene_spec import SceneSpec
+from utils.subtitle_store import track_name
+
+WATCH_FLAG = '--watch' # Starts the game with the hot reload of the config and assets
+
+
+# Function to check for the watch flag and remove it so Kivy does not parse it
+def watch_requested(argv: List[str]) -> bool:
+    """Return whether the game was started with --watch, removing the flag from argv.
+
+    Args:
+        argv (List[str]): command line arguments, usually sys.argv
+
+    Returns:
+        bool: True when the hot reload is requested
+    """
+    if WATCH_FLAG in argv:
+        argv.remove(WATCH_FLAG)
+        return True
+    return False
+
+
+# Function to return what tells whether a file changed
+def file_signature(path: str) -> Optional[Tuple[int, int]]:
+    """Return the size and modification time of a file, None when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+# Function to return the part of a spec the compiled graph depends on
+def graph_shape(spec: SceneSpec) -> Tuple[Tuple[str, ...], Optional[str]]:
+    """Return the choice targets and last scene of a spec, the only fields compiled into the adjacency arrays."""
+    return tuple(button.target_scene_id for button in spec.button_config), spec.last_scene_id
+
+
+# Function to list the asset files of a scene
+def scene_files(spec: SceneSpec) -> List[str]:
+    """Return the media, audio and subtitle file names of a scene."""
+    files = [spec.media_source]
+    if spec.audio_source:
+        files.append(spec.audio_source)
+    if spec.has_text:
+        files.append('subtitle.txt')
+        files.extend(subtitle_tracks(spec.scene_id))
+    return files
+
+
+class HotReloader:
+    """Reloads the parts of the running game whose config or asset files were edited.
+
+    The config and the files of the active scene are checked on every poll, the other
+    asset files a slice at a time, so a poll costs the same whatever the story size.
+    Only the scenes whose spec or files changed are invalidated: their cached assets,
+    prefetched assets and subtitles. The active scene is rebuilt in place when it changed.
+    """
+
+    def __init__(self, app: Any, interval: float = 0.5, files_per_poll: int = 256):
+        """Start tracking the files of the game.
+
+        Args:
+            app (Any): the running App
+            interval (float): seconds between polls
+            files_per_poll (int): asset files checked on every poll besides those of the active scene
+        """
+        self.app = app
+        self.interval = interval
+        self.files_per_poll = files_per_poll
+        self.reloads = 0
+        self.config_signature = file_signature(app.config_path)
+        self._signatures: Dict[Tuple[str, str], Optional[Tuple[int, int]]] = {}
+        self._files: List[Tuple[str, str]] = []
+        self._cursor = 0
+        self._event = None
+        self.track_files()
+
+    def track_files(self) -> None:
+        """List the asset files of every scene, keeping the known signatures of files still in the story."""
+        self._files = [(spec.scene_id, file_name) for spec in self.app.scenes for file_name in scene_files(spec)]
+        known = self._signatures
+        self._signatures = {
+            item: known[item] if item in known else file_signature(asset_path(*item)) for item in self._files
+        }
+        self._cursor = 0
+
+    def start(self) -> None:
+        """Poll on the Kivy Clock."""
+        from kivy.clock import Clock # Imported here so reloads can be driven headless
+
+        self._event = Clock.schedule_interval(self.poll, self.interval)
+
+    def stop(self) -> None:
+        """Stop polling."""
+        if self._event is not None:
+            self._event.cancel()
+            self._event = None
+
+    def poll(self, _=None) -> Set[str]:
+        """Check the watched files and apply the changes found.
+
+        Returns:
+            Set[str]: ids of the scenes that were reloaded
+        """
+        start = time.perf_counter()
+        changed: Set[str] = set()
+        edited_files: Set[Tuple[str, str]] = set()
+
+        signature = file_signature(self.app.config_path)
+        if signature != self.config_signature:
+            self.config_signature = signature
+            changed |= self.reload_config()
+
+        active = self.app.scenes.get(self.app.current_scene_id)
+        batch = [(active.scene_id, file_name) for file_name in scene_files(active)] if active else []
+        if self._files:
+            end = self._cursor + self.files_per_poll
+            batch.extend(self._files[self._cursor:end])
+            if end > len(self._files):
+                batch.extend(self._files[:end - len(self._files)])
+            self._cursor = end % len(self._files)
+        for item in batch:
+            signature = file_signature(asset_path(*item))
+            if signature != self._signatures.get(item):
+                self._signatures[item] = signature
+                edited_files.add(item)
+
+        for scene_id, file_name in edited_files:
+            if track_name(file_name):
+                spec = self.app.scenes.get(scene_id)
+                if spec is None: # Removed from the story since its files were listed
+                    continue
+                self.app.subtitles.reload([spec])
+            else:
+                self.app.asset_store.invalidate(scene_id, file_name)
+            changed.add(scene_id)
+
+        if changed:
+            self.apply(changed)
+            print(f"Reloaded {len(changed)} scenes in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return changed
+
+    def reload_config(self) -> Set[str]:
+        """Diff the edited config against the loaded scenes and swap in the changed specs.
+
+        The compiled graph is patched in place when no choice or last scene changed,
+        and compiled again otherwise. An invalid config is reported and ignored.
+
+        Returns:
+            Set[str]: ids of the added, removed and changed scenes
+        """
+        app = self.app
+        try:
+            with open(app.config_path, 'r') as file:
+                scenes_data = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error reloading {app.config_path}: {e}")
+            return set()
+        errors, _ = validate_scenes(scenes_data, app.start_scene_id)
+        if errors:
+            print('Invalid scenes config, keeping the loaded scenes:\n' + '\n'.join(errors))
+            return set()
+
+        graph = app.scene_graph
+        specs = [SceneSpec.from_data(scene_data) for scene_data in scenes_data]
+        changed = [spec for spec in specs if app.scenes.get(spec.scene_id) != spec]
+        new_ids = {spec.scene_id for spec in specs}
+        removed = {scene_id for scene_id in graph.ids if scene_id not in new_ids}
+        if not changed and not removed:
+            return set()
+
+        same_shape = (
+            not removed and len(specs) == len(graph.ids)
+            and all(spec.scene_id == scene_id for spec, scene_id in zip(specs, graph.ids))
+            and all(graph_shape(spec) == graph_shape(app.scenes.get(spec.scene_id)) for spec in changed)
+        )
+        old_specs = {spec.scene_id: app.scenes.get(spec.scene_id) for spec in changed}
+        if same_shape: # Only media, text or timing changed, the adjacency arrays stay valid
+            for spec in changed:
+                i = graph.index[spec.scene_id]
+                graph.registry.add(spec)
+                graph.media_paths[i] = asset_path(spec.scene_id, spec.media_source)
+                graph.audio_paths[i] = asset_path(spec.scene_id, spec.audio_source) if spec.audio_source else None
+                graph.subtitle_paths[i] = asset_path(spec.scene_id, 'subtitle.txt') if spec.has_text else None
+        else:
+            graph = app.scene_graph = CompiledSceneGraph(specs, app.start_scene_id)
+            app.scenes = app.prefetcher.scenes = graph.registry
+
+        for spec in changed: # Only a scene pointed at other files holds assets that are no longer current
+            old = old_specs[spec.scene_id]
+            if old is None: # A new scene, nothing of it is cached yet
+                continue
+            for new_file, old_file in ((spec.media_source, old.media_source), (spec.audio_source, old.audio_source)):
+                if new_file != old_file:
+                    for file_name in filter(None, (new_file, old_file)):
+                        app.asset_store.invalidate(spec.scene_id, file_name)
+        app.subtitles.reload(changed)
+        self.track_files()
+        return {spec.scene_id for spec in changed} | removed
+
+    def apply(self, changed: Set[str]) -> None:
+        """Drop the prefetched assets of the changed scenes and rebuild the active scene if it changed.
+
+        Args:
+            changed (Set[str]): ids of the reloaded scenes
+        """
+        app = self.app
+        self.reloads += 1
+        app.prefetcher.invalidate(changed)
+        app.transitions.invalidate(changed)
+        if app.current_scene_id not in changed:
+            return
+        spec = app.scenes.get(app.current_scene_id)
+        if spec is None: # The active scene was removed from the story, the game goes back to its start
+            app.switch_to_scene(app.start_scene_id)
+            return
+        app.current_scene.on_exit()
+        app.current_scene.load_spec(spec, None)
+        app.prefetcher.prefetch_neighbours(spec)
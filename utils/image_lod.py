@@ -0,0 +1,149 @@
+import argparse
+import json
+import os
+import threading
+from typing import Dict, Optional, Sequence, Set, Tuple
+
+from configs.constants import CONFIG_PATH, DEFAULTS, LOD_CACHE_DIR, WINDOW_SIZE
+from utils.bundle import IMAGE_EXTENSIONS, resize_image
+from utils.tracing import tracer
+
+
+# Function to name a level in the keys of the asset store and the variant files
+def level_name(level: Tuple[int, int]) -> str:
+    """Return the name of a level, such as '960x540'."""
+    return f'{level[0]}x{level[1]}'
+
+
+class ImageLod:
+    """Downscaled variants of the scene images, picked for the size they are shown at.
+
+    Each image has one variant per level of the ladder, the image shrunk to fit in the
+    level size. The smallest level covering the display is used, so the decode time and
+    texture memory follow the window rather than the source art. Variants are encoded
+    once and cached on disk, named after the content key of the source, so an edited
+    image gets new variants and the cache never serves stale pixels.
+    """
+
+    def __init__(self, cache_dir: str = LOD_CACHE_DIR, levels: Sequence[Tuple[int, int]] = DEFAULTS['IMAGE_LOD_LEVELS'],
+                 target: Tuple[int, int] = WINDOW_SIZE):
+        """Set up the variant cache.
+
+        Args:
+            cache_dir (str): directory of the encoded variants
+            levels (Sequence[Tuple[int, int]]): maximum width and height of each level
+            target (Tuple[int, int]): size the images are shown at, updated when the window is resized
+        """
+        self.cache_dir = cache_dir
+        self.levels = sorted((tuple(level) for level in levels), key=lambda level: level[0] * level[1])
+        self.target = tuple(target)
+        self.builds = 0
+        self.available = True # Cleared when Pillow is missing, the source images are used then
+        self._native: Set[Tuple[str, str]] = set() # (content key, level) of sources already smaller than the level
+        self._lock = threading.Lock()
+
+    # Method to pick the level to show an image at
+    def level_for(self, size: Optional[Tuple[float, float]] = None) -> Optional[Tuple[int, int]]:
+        """Return the smallest level covering a size.
+
+        Args:
+            size (Optional[Tuple[float, float]]): width and height the image is shown at, the target by default
+
+        Returns:
+            Optional[Tuple[int, int]]: the level, None when the source image should be used
+        """
+        if not self.available:
+            return None
+        width, height = size or self.target
+        for level in self.levels:
+            if level[0] >= width and level[1] >= height:
+                return level
+        return None # Larger than every level, only the source has enough pixels
+
+    def variant_path(self, key: str, level: Tuple[int, int], path: str) -> str:
+        """Return the path of the variant of an image content at a level, keeping the extension of the source."""
+        return os.path.join(self.cache_dir, f'{key}_{level_name(level)}{os.path.splitext(path)[1].lower()}')
+
+    # Method to get the encoded variant of an image, building it on first use
+    def load_variant(self, key: str, level: Tuple[int, int], path: str, data: Optional[memoryview] = None) -> Optional[bytes]:
+        """Return the encoded image shrunk to fit a level. Safe to call from a worker thread.
+
+        Args:
+            key (str): content key of the source image
+            level (Tuple[int, int]): level of the variant
+            path (str): path of the source image
+            data (Optional[memoryview]): source bytes from the asset bundle, read instead of the file
+
+        Returns:
+            Optional[bytes]: the variant, None when the source should be decoded as it is
+        """
+        if (key, level_name(level)) in self._native:
+            return None
+        variant_path = self.variant_path(key, level, path)
+        try:
+            with open(variant_path, 'rb') as file:
+                return file.read()
+        except OSError:
+            pass
+
+        if data is None:
+            with open(path, 'rb') as file:
+                data = file.read()
+        try:
+            with tracer.span('ImageLod.build', path=path, level=level_name(level)):
+                variant = resize_image(data, path, level)
+        except ImportError: # Pillow is missing, every image is shown from its source
+            self.available = False
+            return None
+        if variant is data: # The source already fits in the level
+            with self._lock:
+                self._native.add((key, level_name(level)))
+            return None
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{variant_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(variant)
+        os.replace(tmp_path, variant_path) # Readers never see a partly written variant
+        with self._lock:
+            self.builds += 1
+        return variant
+
+
+# Function to encode the variants of every image of a story ahead of time
+def build_variants(config_path: str, lod: ImageLod) -> Dict[str, int]:
+    """Build the variants of every image referenced by the config at every level.
+
+    Args:
+        config_path (str): path of the scenes json config
+        lod (ImageLod): the variant cache to fill
+
+    Returns:
+        Dict[str, int]: number of images and variants built
+    """
+    from utils.asset_store import AssetStore # The store hashes the images the same way the game does
+    from utils.helper import asset_path
+
+    with open(config_path, 'r') as file:
+        scenes_data = json.load(file)
+    store = AssetStore()
+    images = {}
+    for scene_data in scenes_data:
+        file_name = scene_data['media_source']
+        if file_name.lower().endswith(IMAGE_EXTENSIONS):
+            try:
+                images.setdefault(store.content_key(scene_data['scene_id'], file_name), asset_path(scene_data['scene_id'], file_name))
+            except OSError as e:
+                print(f"Skipping missing image {asset_path(scene_data['scene_id'], file_name)}: {e}")
+    for key, path in images.items():
+        for level in lod.levels:
+            lod.load_variant(key, level, path)
+    return {'images': len(images), 'variants': lod.builds}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the downscaled variants of the scene images.')
+    parser.add_argument('--config', default=CONFIG_PATH, help='path of the scenes json config')
+    parser.add_argument('--cache', default=LOD_CACHE_DIR, help='directory of the variants')
+    args = parser.parse_args()
+    print(build_variants(args.config, ImageLod(args.cache)))
@@ -0,0 +1,115 @@
+import json
+from typing import Any, Dict, List, Optional, Set
+
+RECORD_FLAG = '--record' # Records the player input, as --record or --record=<path>
+DEFAULT_RECORD_PATH = 'input_trace.jsonl'
+TRACE_VERSION = 1
+
+
+# Function to check for the record flag and remove it so Kivy does not parse it
+def record_requested(argv: List[str]) -> Optional[str]:
+    """Return the path of the input trace to record, removing the flag from argv.
+
+    Args:
+        argv (List[str]): command line arguments, usually sys.argv
+
+    Returns:
+        Optional[str]: the trace path, None when the game was started without --record
+    """
+    path = None
+    for argument in list(argv):
+        if argument == RECORD_FLAG or argument.startswith(RECORD_FLAG + '='):
+            argv.remove(argument)
+            path = argument.partition('=')[2] or DEFAULT_RECORD_PATH
+    return path
+
+
+# Function to read an input trace back
+def load_trace(path: str) -> List[Dict[str, Any]]:
+    """Read the events of an input trace, skipping a line cut short by a crash.
+
+    Args:
+        path (str): path of the trace
+
+    Raises:
+        ValueError: when the file is not a version TRACE_VERSION input trace
+
+    Returns:
+        List[Dict[str, Any]]: the events in recording order
+    """
+    events = []
+    with open(path, 'r', encoding='utf-8') as file:
+        for line in file:
+            try:
+                events.append(json.loads(line))
+            except ValueError: # Only the last line can be torn
+                break
+    if not events or events[0].get('event') != 'start' or events[0].get('version') != TRACE_VERSION:
+        raise ValueError(f"{path} is not a version {TRACE_VERSION} input trace")
+    return events
+
+
+class InputRecorder:
+    """Writes what a replay needs to play a session again to a json lines trace.
+
+    The trace holds the choices of the player, the scenes shown, and the length of
+    every sound played, all timed in seconds of the timeline clock since the recording
+    started. Timers are not recorded: a replay on a virtual clock runs them again. Each
+    event is written as one line when it happens, so a crash loses at most that line.
+    """
+
+    def __init__(self, path: str, clock: Any):
+        """Start a trace.
+
+        Args:
+            path (str): path of the trace, overwritten
+            clock (Any): timeline clock the events are timed with, a KivyClock or a ManualClock
+        """
+        self.path = path
+        self.clock = clock
+        self.origin = clock.now()
+        self._sounds: Set[str] = set()
+        self._file = open(path, 'w', encoding='utf-8', buffering=1) # Line buffered, every event reaches the OS at once
+
+    def write(self, event: str, **fields: Any) -> None:
+        """Append an event to the trace.
+
+        Args:
+            event (str): event type, such as 'choice'
+            fields (Any): json values stored with the event
+        """
+        if self._file.closed:
+            return
+        record = {'event': event, 'time': round(self.clock.now() - self.origin, 6)}
+        record.update(fields)
+        self._file.write(json.dumps(record) + '\n')
+
+    def start(self, config_path: str) -> None:
+        """Write the header of the trace."""
+        self.write('start', version=TRACE_VERSION, config=config_path)
+
+    def scene(self, scene_id: str) -> None:
+        """Record that a scene was shown, after a choice or a timer."""
+        self.write('scene', scene=scene_id)
+
+    def choice(self, scene_id: str, index: int, target_scene_id: str) -> None:
+        """Record a choice button pressed by the player.
+
+        Args:
+            scene_id (str): scene the choice was made in
+            index (int): position of the pressed button
+            target_scene_id (str): scene the button leads to
+        """
+        self.write('choice', scene=scene_id, index=index, target=target_scene_id)
+
+    def sound(self, path: str, length: float) -> None:
+        """Record the length of a sound the first time it plays, replays play it for as long."""
+        if path not in self._sounds:
+            self._sounds.add(path)
+            self.write('sound', path=path, length=round(length, 6))
+
+    def close(self) -> None:
+        """Record the end of the session and close the trace."""
+        if not self._file.closed:
+            self.write('end')
+            self._file.close()
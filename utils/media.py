@@ -0,0 +1,89 @@
+import io
+import os
+from typing import TYPE_CHECKING, Any, Optional, Tuple
+
+from utils.asset_store import AssetStore
+from utils.image_lod import ImageLod, level_name
+from utils.tracing import tracer
+
+if TYPE_CHECKING:
+    from kivy.core.image import Image as CoreImage
+
+
+# Function to decode an image without registering it in the Kivy image cache
+def load_image(path: str, data: Optional[memoryview] = None) -> 'CoreImage':
+    """Decode an image from its packed bytes, or from its file.
+
+    Args:
+        path (str): path of the image file
+        data (Optional[memoryview]): encoded image bytes from the asset bundle
+
+    Returns:
+        CoreImage: the decoded image
+    """
+    from kivy.core.image import Image as CoreImage # Imported on first use, the image providers are slow to load
+
+    with tracer.span('CoreImage', path=path):
+        if data is not None:
+            extension = os.path.splitext(path)[1][1:].lower()
+            return CoreImage(io.BytesIO(data), ext=extension, filename=path, keep_data=True, nocache=True)
+        return CoreImage(path, keep_data=True, nocache=True)
+
+
+# Function to load a sound, which Kivy can only do from a file
+def load_sound(path: str, data: Optional[memoryview] = None) -> Optional[Any]:
+    """Load a sound from its file. Packed bytes are ignored as SoundLoader only reads files."""
+    from kivy.core.audio import SoundLoader # Imported on first use, the audio providers are slow to load
+
+    with tracer.span('SoundLoader.load', path=path):
+        return SoundLoader.load(path)
+
+
+# Function to estimate the memory used by a decoded image
+def image_size(image: 'CoreImage') -> int:
+    """Return the bytes used by the RGBA pixels of a decoded image."""
+    return int(image.width * image.height * 4)
+
+
+# Function to free a sound when it is evicted from the store
+def unload_sound(sound: Optional[Any]) -> None:
+    """Unload a sound returned by SoundLoader, which is None for unsupported files."""
+    if sound is not None:
+        sound.unload()
+
+
+def acquire_image(store: AssetStore, scene_id: str, file_name: str, lod: Optional[ImageLod] = None,
+                  size: Optional[Tuple[float, float]] = None) -> Tuple[str, 'CoreImage']:
+    """Get the shared decoded image of a scene file, downscaled for the size it is shown at.
+
+    Args:
+        store (AssetStore): the asset store
+        scene_id (str): scene id owning the image
+        file_name (str): image file name
+        lod (Optional[ImageLod]): variant cache picking the resolution, None decodes the source image
+        size (Optional[Tuple[float, float]]): size the image is shown at, the window size by default
+
+    Returns:
+        Tuple[str, CoreImage]: the content key to release and the image
+    """
+    level = lod.level_for(size) if lod else None
+    if level is None:
+        return store.acquire(scene_id, file_name, load_image, sizer=image_size)
+    key = store.content_key(scene_id, file_name)
+    return store.acquire(scene_id, file_name, lambda path, data: load_image(path, lod.load_variant(key, level, path, data) or data),
+                         sizer=image_size, variant=level_name(level))
+
+
+def acquire_sound(store: AssetStore, scene_id: str, file_name: str) -> Tuple[str, Optional[Any]]:
+    """Get the shared sound of a scene file.
+
+    Args:
+        store (AssetStore): the asset store
+        scene_id (str): scene id owning the audio
+        file_name (str): audio file name
+
+    Returns:
+        Tuple[str, Optional[Any]]: the content key to release and the sound, None if it can not be played
+    """
+    return store.acquire(scene_id, file_name, load_sound, dispose=unload_sound)
+
@@ -0,0 +1,206 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from utils.asset_store import AssetStore
+from utils.image_lod import ImageLod
+from utils.media import acquire_image, acquire_sound
+from utils.scene_spec import SceneRegistry, SceneSpec
+
+
+class PrefetchedAssets(NamedTuple):
+    """Assets of a scene loaded ahead of time and ready to be used on the UI thread."""
+
+    image: Optional[Any] # Decoded kivy.core.image.Image
+    sound: Optional[Any] # Kivy sound, or PcmBuffer when the audio engine is used
+    keys: Tuple[str, ...] # Content keys held in the asset store, released by whoever ends up owning the assets
+
+
+def load_scene_assets(spec: SceneSpec, store: AssetStore,
+                      acquire_audio: Callable[[AssetStore, str, str], Tuple[str, Any]] = acquire_sound,
+                      image_lod: Optional[ImageLod] = None) -> PrefetchedAssets:
+    """Load the image and audio of a scene. Safe to call from a worker thread.
+
+    Args:
+        spec (SceneSpec): scene spec whose assets are loaded
+        store (AssetStore): shared store the image and audio are acquired from
+        acquire_audio (Callable[[AssetStore, str, str], Tuple[str, Any]]): loads the audio, as a Kivy sound or as PCM samples
+        image_lod (Optional[ImageLod]): picks the image variant for the window size, None loads the source image
+
+    Returns:
+        PrefetchedAssets: the loaded assets, missing ones are None
+    """
+    keys = []
+    image = None
+    if spec.media_type == 'image': # Videos are streamed by the Video widget, only images are decoded ahead
+        try:
+            key, image = acquire_image(store, spec.scene_id, spec.media_source, image_lod)
+            keys.append(key)
+        except Exception as e:
+            print(f"Error prefetching image for {spec.scene_id}: {e}")
+
+    sound = None
+    if spec.audio_source:
+        try:
+            key, sound = acquire_audio(store, spec.scene_id, spec.audio_source)
+            keys.append(key)
+        except Exception as e: # OSError from SoundLoader, decoding errors from the audio engine
+            print(f"Error prefetching audio for {spec.scene_id}: {e}")
+
+    return PrefetchedAssets(image, sound, tuple(keys))
+
+
+def release_assets(assets: PrefetchedAssets, store: AssetStore) -> None:
+    """Release the store references of prefetched assets that will not be used.
+
+    Args:
+        assets (PrefetchedAssets): assets to release
+        store (AssetStore): the store the assets were acquired from
+    """
+    for key in assets.keys:
+        store.release(key)
+
+
+class AssetPrefetcher:
+    """Loads the images and audio of the scenes reachable from the active scene on worker threads.
+
+    Loaded assets are handed over to the UI thread through the Kivy Clock, and taken
+    by the next scene when it is built. Hit and miss counters tell how often a scene
+    switch found its assets already loaded.
+    """
+
+    def __init__(self, scenes: SceneRegistry, store: AssetStore, max_workers: int = 2,
+                 acquire_audio: Callable[[AssetStore, str, str], Tuple[str, Any]] = acquire_sound,
+                 image_lod: Optional[ImageLod] = None):
+        self.scenes = scenes
+        self.store = store
+        self.acquire_audio = acquire_audio
+        self.image_lod = image_lod
+        self.hits = 0
+        self.misses = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._lock = threading.Lock()
+        self._ready: Dict[str, PrefetchedAssets] = {}
+        self._pending: Set[str] = set()
+        self._wanted: Set[str] = set()
+        self._warm: Set[str] = set() # Scenes kept prefetched until they are taken, such as recently visited ones
+
+    # Method to prefetch every scene reachable from the given scene in a single step
+    def prefetch_neighbours(self, spec: SceneSpec) -> None:
+        """Start loading the assets of every target scene of the given scene.
+
+        Assets prefetched for scenes that are no longer reachable are dropped.
+
+        Args:
+            spec (SceneSpec): the scene that just became active
+        """
+        wanted = {button.target_scene_id for button in spec.button_config}
+        if spec.last_scene_id:
+            wanted.add(spec.last_scene_id)
+        wanted.update(self._warm)
+        wanted.discard(spec.scene_id)
+
+        with self._lock:
+            self._wanted = wanted
+            dropped = [self._ready.pop(scene_id) for scene_id in list(self._ready) if scene_id not in wanted]
+            to_load = [scene_id for scene_id in wanted if scene_id not in self._ready and scene_id not in self._pending]
+            self._pending.update(to_load)
+
+        for assets in dropped:
+            release_assets(assets, self.store)
+
+        for scene_id in to_load:
+            target = self.scenes.get(scene_id)
+            if target is None:
+                with self._lock:
+                    self._pending.discard(scene_id)
+                continue
+            self._executor.submit(self._load, target)
+
+    # Method to keep scenes prefetched beyond the neighbours of the active scene
+    def warm(self, scene_ids: Iterable[str], active: SceneSpec) -> None:
+        """Start loading the assets of the given scenes, and keep them until they are taken.
+
+        Args:
+            scene_ids (Iterable[str]): scenes to prefetch, such as the recent history of the player
+            active (SceneSpec): the active scene, whose neighbours stay prefetched too
+        """
+        self._warm = set(scene_ids)
+        self.prefetch_neighbours(active)
+
+    # Method run on a worker thread to load the assets of a scene
+    def _load(self, spec: SceneSpec) -> None:
+        """Load the assets of a scene and hand them over to the UI thread."""
+        from kivy.clock import Clock # Imported here so the prefetched assets can be used headless, by the transitions
+        try:
+            assets = load_scene_assets(spec, self.store, self.acquire_audio, self.image_lod)
+        except Exception as e:
+            print(f"Error prefetching scene {spec.scene_id}: {e}")
+            assets = None
+        Clock.schedule_once(lambda _: self._deliver(spec.scene_id, assets))
+
+    # Method run on the UI thread to store loaded assets
+    def _deliver(self, scene_id: str, assets: Optional[PrefetchedAssets]) -> None:
+        """Store the assets loaded for a scene if the scene is still wanted."""
+        with self._lock:
+            self._pending.discard(scene_id)
+            wanted = assets is not None and scene_id in self._wanted
+            if wanted:
+                self._ready[scene_id] = assets
+        if not wanted:
+            if assets is not None:
+                release_assets(assets, self.store)
+            return
+        if assets.image is not None:
+            assets.image.texture # Creating the texture here so it is uploaded on the UI thread before use
+
+    def take(self, scene_id: str) -> Optional[PrefetchedAssets]:
+        """Take the prefetched assets of a scene, counting a hit or a miss.
+
+        Args:
+            scene_id (str): scene id that is about to be built
+
+        Returns:
+            Optional[PrefetchedAssets]: the prefetched assets, or None on a miss
+        """
+        with self._lock:
+            assets = self._ready.pop(scene_id, None)
+        self._warm.discard(scene_id)
+        if assets is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return assets
+
+    # Method to drop the prefetched assets of scenes that were edited, used by the hot reload
+    def invalidate(self, scene_ids: Iterable[str]) -> None:
+        """Drop the prefetched assets of the given scenes, they are loaded again when next wanted.
+
+        Args:
+            scene_ids (Iterable[str]): edited scenes
+        """
+        scene_ids = set(scene_ids)
+        with self._lock:
+            dropped = [self._ready.pop(scene_id) for scene_id in scene_ids if scene_id in self._ready]
+            self._wanted -= scene_ids # Loads still running for these scenes are released when delivered
+        for assets in dropped:
+            release_assets(assets, self.store)
+
+    def stats(self) -> Dict[str, float]:
+        """Return the prefetch hit and miss counters.
+
+        Returns:
+            Dict[str, float]: hits, misses and hit rate
+        """
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.0}
+
+    def shutdown(self) -> None:
+        """Stop the worker threads and drop every prefetched asset."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            dropped = list(self._ready.values())
+            self._ready.clear()
+            self._pending.clear()
+        for assets in dropped:
+            release_assets(assets, self.store)
@@ -0,0 +1,373 @@
+import hashlib
+import json
+import os
+import struct
+import sys
+from array import array
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from configs.constants import CONFIG_PATH, INTRO_SCENE_ID
+from utils.helper import asset_path
+from utils.scene_spec import ButtonSpec, SceneRegistry, SceneSpec
+
+GRAPH_VERSION = 2 # Bump when the compiled layout changes so old caches are rebuilt
+GRAPH_MAGIC = b'SUEG'
+GRAPH_HEADER = struct.Struct('<4sII') # Magic, version, length of the json metadata that follows
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg')
+NO_SCENE = -1
+
+
+class SceneConfigError(ValueError):
+    """Raised when the scenes config can not be compiled into a playable graph."""
+
+
+class CompiledSceneGraph:
+    """Scene graph compiled from the json config.
+
+    Scene ids are interned and numbered by their position in the config. Choices are
+    stored as integer adjacency arrays in compressed row form: the targets of scene i
+    are targets[offsets[i]:offsets[i + 1]]. Asset paths are resolved once at compile time.
+    """
+
+    def __init__(self, specs: List[SceneSpec], start_id: str = INTRO_SCENE_ID,
+                 arrays: Optional[Tuple[array, array, array]] = None):
+        """Compile the specs, or take the adjacency arrays read from a cache.
+
+        Args:
+            specs (List[SceneSpec]): scenes in config order
+            start_id (str): id of the first scene
+            arrays (Optional[Tuple[array, array, array]]): offsets, targets and last_scene compiled before
+
+        Raises:
+            ValueError: when the given arrays do not fit the specs
+        """
+        self.ids: List[str] = [sys.intern(spec.scene_id) for spec in specs]
+        self.index: Dict[str, int] = {scene_id: i for i, scene_id in enumerate(self.ids)}
+        self.start = self.index.get(start_id, NO_SCENE)
+        self.registry = SceneRegistry(specs)
+
+        if arrays is not None:
+            self.offsets, self.targets, self.last_scene = arrays
+            self._check_arrays()
+        else:
+            self.offsets = array('i', [0])
+            self.targets = array('i')
+            self.last_scene = array('i')
+            for spec in specs:
+                self.targets.extend(self.index.get(button.target_scene_id, NO_SCENE) for button in spec.button_config)
+                self.offsets.append(len(self.targets))
+                self.last_scene.append(self.index.get(spec.last_scene_id, NO_SCENE) if spec.last_scene_id else NO_SCENE)
+
+        self.media_paths: List[str] = [asset_path(spec.scene_id, spec.media_source) for spec in specs]
+        self.audio_paths: List[Optional[str]] = [
+            asset_path(spec.scene_id, spec.audio_source) if spec.audio_source else None for spec in specs
+        ]
+        self.subtitle_paths: List[Optional[str]] = [
+            asset_path(spec.scene_id, 'subtitle.txt') if spec.has_text else None for spec in specs
+        ]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _check_arrays(self) -> None:
+        """Raise ValueError unless the adjacency arrays are well formed for the scenes."""
+        count = len(self.ids)
+        if len(self.offsets) != count + 1 or len(self.last_scene) != count or self.offsets[0] != 0 \
+                or self.offsets[-1] != len(self.targets):
+            raise ValueError('compiled arrays do not match the scenes')
+        if any(self.offsets[i] > self.offsets[i + 1] for i in range(count)) \
+                or any(not NO_SCENE <= target < count for target in self.targets) \
+                or any(not NO_SCENE <= target < count for target in self.last_scene):
+            raise ValueError('compiled arrays point outside the scenes')
+
+    def successors(self, scene: int) -> List[int]:
+        """Return the scenes reachable in one step from a scene: its choices, or its last scene.
+
+        Args:
+            scene (int): scene index
+
+        Returns:
+            List[int]: indexes of the next scenes
+        """
+        choices = list(self.targets[self.offsets[scene]:self.offsets[scene + 1]])
+        if self.last_scene[scene] != NO_SCENE:
+            choices.append(self.last_scene[scene])
+        return choices
+
+    def reachable(self) -> List[bool]:
+        """Return, for every scene, whether it can be reached from the start scene."""
+        seen = [False] * len(self.ids)
+        if self.start == NO_SCENE:
+            return seen
+        seen[self.start] = True
+        queue = deque([self.start])
+        while queue:
+            for target in self.successors(queue.popleft()):
+                if target != NO_SCENE and not seen[target]:
+                    seen[target] = True
+                    queue.append(target)
+        return seen
+
+    def can_finish(self) -> List[bool]:
+        """Return, for every scene, whether an ending (a scene with nothing after it) can be reached from it."""
+        predecessors: List[List[int]] = [[] for _ in self.ids]
+        queue = deque()
+        finishing = [False] * len(self.ids)
+        for scene in range(len(self.ids)):
+            successors = self.successors(scene)
+            if not successors:
+                finishing[scene] = True
+                queue.append(scene)
+            for target in successors:
+                predecessors[target].append(scene)
+        while queue:
+            for source in predecessors[queue.popleft()]:
+                if not finishing[source]:
+                    finishing[source] = True
+                    queue.append(source)
+        return finishing
+
+
+# Function to check the scenes data and collect the problems found
+def validate_scenes(scenes_data: List[Dict], start_id: str = INTRO_SCENE_ID,
+                    asset_root: Optional[str] = None) -> Tuple[List[str], List[str]]:
+    """Validate the scenes of the json config.
+
+    Errors make the story unplayable: duplicate or unknown scene ids and a missing start
+    scene. Warnings are problems the game survives: missing assets, audio sources that are
+    not audio files, unreachable scenes and dead ends.
+
+    Args:
+        scenes_data (List[Dict]): scenes from the json config
+        start_id (str): id of the first scene
+        asset_root (Optional[str]): directory holding the asset folders of the scenes, the game's assets folder by default
+
+    Returns:
+        Tuple[List[str], List[str]]: the errors and the warnings
+    """
+    errors, warnings, _ = check_scenes(scenes_data, start_id, asset_root)
+    return errors, warnings
+
+
+# Function to validate the scenes data and keep the graph compiled for the checks
+def check_scenes(scenes_data: List[Dict], start_id: str = INTRO_SCENE_ID,
+                 asset_root: Optional[str] = None) -> Tuple[List[str], List[str], Optional[CompiledSceneGraph]]:
+    """Validate the scenes like validate_scenes, also returning the graph compiled to find unreachable scenes.
+
+    Returns:
+        Tuple[List[str], List[str], Optional[CompiledSceneGraph]]: the errors, the warnings, and the graph when there are no errors
+    """
+    errors, warnings = [], []
+    seen = set()
+    for scene_data in scenes_data:
+        missing = [field for field in ('scene_id', 'media_source', 'media_type', 'audio_source') if field not in scene_data]
+        if missing:
+            errors.append(f"Scene {scene_data.get('scene_id', '?')} is missing {', '.join(missing)}")
+            continue
+        if scene_data['scene_id'] in seen:
+            errors.append(f"Duplicate scene id {scene_data['scene_id']}")
+        seen.add(scene_data['scene_id'])
+    if errors:
+        return errors, warnings, None
+    if start_id not in seen:
+        errors.append(f"Start scene {start_id} is not defined")
+
+    for scene_data in scenes_data:
+        scene_id = scene_data['scene_id']
+        for button in scene_data.get('button_config') or ():
+            if button.get('target_scene_id') not in seen:
+                errors.append(f"Scene {scene_id} has a choice to unknown scene {button.get('target_scene_id')}")
+        if scene_data.get('last_scene_id') and scene_data['last_scene_id'] not in seen:
+            errors.append(f"Scene {scene_id} continues to unknown scene {scene_data['last_scene_id']}")
+
+        assets = [scene_data['media_source']]
+        if scene_data['audio_source']:
+            assets.append(scene_data['audio_source'])
+            if not scene_data['audio_source'].lower().endswith(AUDIO_EXTENSIONS):
+                warnings.append(f"Scene {scene_id} uses {scene_data['audio_source']} as audio, which is not an audio file")
+        if scene_data.get('has_text', True):
+            assets.append('subtitle.txt')
+        for file_name in dict.fromkeys(assets): # Reporting a file used twice by the scene once
+            path = asset_path(scene_id, file_name) if asset_root is None else os.path.join(asset_root, scene_id, file_name)
+            if not os.path.isfile(path):
+                warnings.append(f"Scene {scene_id} references missing asset {path}")
+
+    if errors:
+        return errors, warnings, None
+
+    graph = CompiledSceneGraph([SceneSpec.from_data(scene_data) for scene_data in scenes_data], start_id)
+    reachable = graph.reachable()
+    finishing = graph.can_finish()
+    for i, scene_id in enumerate(graph.ids):
+        if not reachable[i]:
+            warnings.append(f"Scene {scene_id} can not be reached from {start_id}")
+        elif not finishing[i]:
+            warnings.append(f"Scene {scene_id} is a dead end: no ending can be reached from it")
+    return errors, warnings, graph
+
+
+def compile_scene_graph(scenes_data: List[Dict], start_id: str = INTRO_SCENE_ID) -> CompiledSceneGraph:
+    """Validate the scenes data and compile it.
+
+    Args:
+        scenes_data (List[Dict]): scenes from the json config
+        start_id (str): id of the first scene
+
+    Raises:
+        SceneConfigError: when the config has errors
+
+    Returns:
+        CompiledSceneGraph: the compiled graph
+    """
+    errors, warnings, graph = check_scenes(scenes_data, start_id)
+    for warning in warnings:
+        print(f"Warning: {warning}")
+    if errors:
+        raise SceneConfigError('Invalid scenes config:\n' + '\n'.join(errors))
+    return graph # Compiled once, by the reachability checks of the validation
+
+
+def cache_path_for(config_path: str) -> str:
+    """Return the path of the compiled graph cache of a config file."""
+    directory, file_name = os.path.split(config_path)
+    return os.path.join(directory, f'.{file_name}.compiled')
+
+
+# Function to turn a spec into json values
+def _spec_row(spec: SceneSpec) -> List[Any]:
+    """Return the fields of a spec as a json list, the buttons as [text, target] pairs."""
+    row = list(spec)
+    row[SceneSpec._fields.index('button_config')] = [list(button) for button in spec.button_config]
+    return row
+
+
+# Function to turn json values back into a spec
+def _spec_from_row(row: List[Any]) -> SceneSpec:
+    """Return the spec written by _spec_row."""
+    values = dict(zip(SceneSpec._fields, row))
+    values['button_config'] = tuple(ButtonSpec(text, target) for text, target in values['button_config'])
+    values['bg_color'] = tuple(values['bg_color'])
+    return SceneSpec(**values)
+
+
+# Function to save a compiled graph
+def write_graph_cache(path: str, graph: CompiledSceneGraph, start_id: str, source: Dict[str, Any]) -> None:
+    """Write a compiled graph as data only: a header, json metadata and specs, then the int32 adjacency arrays.
+
+    The file is replaced atomically, so a crash never leaves a half written cache.
+
+    Args:
+        path (str): cache file path
+        graph (CompiledSceneGraph): the compiled graph
+        start_id (str): id of the first scene
+        source (Dict[str, Any]): size, mtime and hash of the config the graph was compiled from
+    """
+    arrays = [array('i', values) for values in (graph.offsets, graph.targets, graph.last_scene)]
+    if sys.byteorder == 'big': # Written little endian whatever the machine
+        for values in arrays:
+            values.byteswap()
+    metadata = json.dumps(dict(source, start_id=start_id, lengths=[len(values) for values in arrays],
+                               scenes=[_spec_row(spec) for spec in graph.registry]),
+                          separators=(',', ':')).encode('utf-8')
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, GRAPH_VERSION, len(metadata)))
+        file.write(metadata)
+        for values in arrays:
+            file.write(values.tobytes())
+    os.replace(temp_path, path)
+
+
+# Function to read a compiled graph saved by write_graph_cache
+def read_graph_cache(path: str) -> Tuple[Dict[str, Any], CompiledSceneGraph]:
+    """Read a cache written by write_graph_cache. Nothing in it is executed, it only holds data.
+
+    Args:
+        path (str): cache file path
+
+    Raises:
+        ValueError: when the file is not a graph cache of the current version, or is damaged
+        OSError: when the file can not be read
+
+    Returns:
+        Tuple[Dict[str, Any], CompiledSceneGraph]: the metadata and the graph
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < GRAPH_HEADER.size:
+        raise ValueError('truncated graph cache')
+    magic, version, length = GRAPH_HEADER.unpack_from(data)
+    if magic != GRAPH_MAGIC or version != GRAPH_VERSION:
+        raise ValueError('not a graph cache of this version')
+    metadata = json.loads(data[GRAPH_HEADER.size:GRAPH_HEADER.size + length])
+    position = GRAPH_HEADER.size + length
+    arrays = []
+    for count in metadata['lengths']:
+        values = array('i')
+        end = position + count * values.itemsize
+        if end > len(data):
+            raise ValueError('truncated graph cache')
+        values.frombytes(data[position:end])
+        if sys.byteorder == 'big':
+            values.byteswap()
+        arrays.append(values)
+        position = end
+    specs = [_spec_from_row(row) for row in metadata.pop('scenes')]
+    return metadata, CompiledSceneGraph(specs, metadata['start_id'], tuple(arrays))
+
+
+def load_scene_graph(config_path: str = CONFIG_PATH, start_id: str = INTRO_SCENE_ID) -> CompiledSceneGraph:
+    """Load the compiled scene graph, compiling the config only when it changed.
+
+    The cache is valid when the config has the same size and modification time, or
+    failing that the same content hash, as when the cache was written. A cache that can
+    not be parsed is compiled again and rewritten.
+
+    Args:
+        config_path (str): path of the scenes json config
+        start_id (str): id of the first scene
+
+    Raises:
+        SceneConfigError: when the config has errors
+
+    Returns:
+        CompiledSceneGraph: the compiled graph
+    """
+    stat = os.stat(config_path)
+    cache_path = cache_path_for(config_path)
+    cached, graph = {}, None
+    try:
+        cached, graph = read_graph_cache(cache_path)
+    except Exception: # No cache yet, one of an older version or a damaged one, the config is compiled again
+        pass
+
+    if graph is not None and cached.get('start_id') == start_id:
+        if cached.get('size') == stat.st_size and cached.get('mtime') == stat.st_mtime_ns:
+            return graph
+    else:
+        graph = None
+
+    with open(config_path, 'rb') as file:
+        source = file.read()
+    digest = hashlib.blake2b(source, digest_size=16).hexdigest()
+    if graph is None or cached.get('hash') != digest: # Otherwise touched but unchanged, only the modification time is refreshed
+        graph = compile_scene_graph(json.loads(source), start_id)
+
+    try:
+        write_graph_cache(cache_path, graph, start_id, {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'hash': digest})
+    except OSError as e:
+        print(f"Error writing compiled scene graph {cache_path}: {e}")
+    return graph
+
+
+if __name__ == '__main__':
+    # Validates the config and reports every problem, for content authors
+    path = sys.argv[1] if len(sys.argv) > 1 else CONFIG_PATH
+    with open(path, 'r') as config_file:
+        found_errors, found_warnings = validate_scenes(json.load(config_file))
+    for message in found_warnings:
+        print(f"Warning: {message}")
+    for message in found_errors:
+        print(f"Error: {message}")
+    sys.exit(1 if found_errors else 0)
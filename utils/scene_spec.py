@@ -0,0 +1,101 @@
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from configs.constants import DEFAULTS
+
+
+class ButtonSpec(NamedTuple):
+    """Immutable description of a single choice button in a scene."""
+
+    text: str
+    target_scene_id: str
+
+
+class SceneSpec(NamedTuple):
+    """Immutable, tuple-backed description of a scene.
+
+    Holds only the data needed to build a Scene widget, so the whole story can be kept
+    in memory without allocating any Kivy widgets or property bindings.
+    """
+
+    scene_id: str
+    media_source: str
+    media_type: str
+    audio_source: Optional[str]
+    button_config: Tuple[ButtonSpec, ...] = ()
+    text_style: Optional[Dict[str, Union[str, Tuple[float, float, float, float]]]] = None
+    bg_color: Tuple[float, float, float, float] = DEFAULTS['BG_COLOR']
+    audio_repeat_count: int = DEFAULTS['AUDIO_REPEAT']
+    backoff_rate: int = DEFAULTS['BACKOFF_RATE']
+    has_text: bool = True
+    last_scene_id: Optional[str] = None
+
+    @classmethod
+    def from_data(cls, scene_data: Dict[str, Union[str, int]]) -> 'SceneSpec':
+        """Create a SceneSpec from a scene entry of the json config.
+
+        Args:
+            scene_data (Dict[str, Union[str, int]]): scene data from the json file
+
+        Returns:
+            SceneSpec: immutable scene spec
+        """
+        buttons = scene_data.get('button_config') or ()
+        return cls(
+            scene_id=scene_data['scene_id'],
+            media_source=scene_data['media_source'],
+            media_type=scene_data['media_type'],
+            audio_source=scene_data['audio_source'],
+            button_config=tuple(ButtonSpec(button['text'], button['target_scene_id']) for button in buttons),
+            text_style=scene_data.get('text_style', None),
+            bg_color=tuple(scene_data.get('bg_color', DEFAULTS['BG_COLOR'])),
+            audio_repeat_count=scene_data.get('audio_repeat_count', DEFAULTS['AUDIO_REPEAT']),
+            backoff_rate=scene_data.get('backoff_rate', DEFAULTS['BACKOFF_RATE']),
+            has_text=scene_data.get('has_text', True),
+            last_scene_id=scene_data.get('last_scene_id', None),
+        )
+
+
+class SceneRegistry:
+    """Registry of scene specs indexed by scene id for O(1) lookup."""
+
+    __slots__ = ('_specs',)
+
+    def __init__(self, specs: Optional[List[SceneSpec]] = None):
+        self._specs: Dict[str, SceneSpec] = {}
+        for spec in specs or ():
+            self.add(spec)
+
+    def add(self, spec: SceneSpec) -> None:
+        """Add or replace a scene spec in the registry.
+
+        Args:
+            spec (SceneSpec): scene spec to register
+        """
+        self._specs[spec.scene_id] = spec
+
+    def get(self, scene_id: str) -> Optional[SceneSpec]:
+        """Return the spec for the given scene id, or None if it is unknown.
+
+        Args:
+            scene_id (str): scene id to look up
+
+        Returns:
+            Optional[SceneSpec]: matching scene spec
+        """
+        return self._specs.get(scene_id)
+
+    def visit(self, scene_id: str) -> None:
+        """Record the scene the player entered. Every spec stays in memory, so there is nothing to evict.
+
+        Args:
+            scene_id (str): scene id the player is in
+        """
+
+    def __contains__(self, scene_id: str) -> bool:
+        return scene_id in self._specs
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def __iter__(self) -> Iterator[SceneSpec]:
+        return iter(self._specs.values())
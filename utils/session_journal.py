@@ -0,0 +1,202 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, Iterable, List, Optional
+
+HEADER = struct.Struct('<4sHH') # Magic, version, record size
+RECORD = struct.Struct('<dQQ') # Wall clock time, digest of the scene left, digest of the scene entered
+MAGIC = b'SUEJ'
+JOURNAL_VERSION = 1
+NO_SCENE_DIGEST = 0 # Digest recorded as the scene left by the first scene of a run
+
+
+# Function to return the fixed-size digest a scene id is journaled as
+def scene_digest(scene_id: str) -> int:
+    """Return the 64-bit digest of a scene id, so every record has the same size whatever the id length."""
+    return int.from_bytes(hashlib.blake2b(scene_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class SessionJournal:
+    """Append-only journal of the scene transitions of the player.
+
+    Every transition is a fixed-size record appended to a buffered file. The file is
+    flushed and fsynced by a background thread in batches, so recording a transition
+    never waits on the disk. A torn last record, left by a crash, is ignored on read,
+    and the journal is compacted to its most recent records when it is opened.
+    """
+
+    def __init__(self, path: str, sync_every: int = 16, sync_interval: float = 2.0, keep: int = 4096):
+        """Open the journal, creating it when missing.
+
+        Args:
+            path (str): journal file path
+            sync_every (int): records appended before the background thread is woken up to sync
+            sync_interval (float): longest time in seconds a record waits before it is synced
+            keep (int): records kept when the journal is compacted
+        """
+        self.path = path
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        tail = self._read_tail(keep)
+        self.history: Deque[int] = deque((entered for _, _, entered in RECORD.iter_unpack(tail)), maxlen=keep) # Entered scenes, oldest first
+        self._compact(tail, keep)
+        self._digests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(HEADER.pack(MAGIC, JOURNAL_VERSION, RECORD.size))
+        self._unsynced = 0
+        self._wake = threading.Event()
+        self._closed = False
+        self._syncer = threading.Thread(target=self._sync_loop, name='journal-sync', daemon=True)
+        self._syncer.start()
+
+    def _read_tail(self, count: int) -> bytes:
+        """Return the last complete records of the journal, empty for a missing or foreign file."""
+        try:
+            with open(self.path, 'rb') as file:
+                header = file.read(HEADER.size)
+                if len(header) < HEADER.size or HEADER.unpack(header) != (MAGIC, JOURNAL_VERSION, RECORD.size):
+                    return b''
+                records = (os.fstat(file.fileno()).st_size - HEADER.size) // RECORD.size # A torn last record is left out
+                first = max(records - count, 0)
+                file.seek(HEADER.size + first * RECORD.size)
+                return file.read((records - first) * RECORD.size)
+        except OSError:
+            return b''
+
+    def _compact(self, tail: bytes, keep: int) -> None:
+        """Rewrite the journal with its last records when it grew too large, has a torn record or is not a journal.
+
+        The new file replaces the old one atomically, so a crash never loses the journal.
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return # No journal yet, it is created empty
+        if size == HEADER.size + len(tail) or (size <= HEADER.size + 2 * keep * RECORD.size
+                                               and tail and (size - HEADER.size) % RECORD.size == 0):
+            return
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'wb') as file:
+            file.write(HEADER.pack(MAGIC, JOURNAL_VERSION, RECORD.size))
+            file.write(tail)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, self.path)
+
+    def digest(self, scene_id: str) -> int:
+        """Return the digest of a scene id, memoized."""
+        digest = self._digests.get(scene_id)
+        if digest is None:
+            digest = self._digests[scene_id] = scene_digest(scene_id)
+        return digest
+
+    # Method called on every scene switch, it only packs and buffers a record
+    def record(self, left_id: Optional[str], entered_id: str) -> None:
+        """Append a transition.
+
+        Args:
+            left_id (Optional[str]): scene the player left, None for the first scene of a run
+            entered_id (str): scene the player entered
+        """
+        entered = self.digest(entered_id)
+        packed = RECORD.pack(time.time(), self.digest(left_id) if left_id else NO_SCENE_DIGEST, entered)
+        with self._lock:
+            if self._closed:
+                return
+            self._file.write(packed)
+            self._unsynced += 1
+            wake = self._unsynced >= self.sync_every
+        self.history.append(entered)
+        if wake:
+            self._wake.set()
+
+    def sync(self) -> None:
+        """Flush the buffered records and fsync them to disk."""
+        with self._lock:
+            if self._closed or not self._unsynced:
+                return
+            self._file.flush()
+            self._unsynced = 0
+            fileno = self._file.fileno()
+            os.fsync(fileno) # Under the lock so close can not release the descriptor meanwhile
+
+    # Method run on the background thread syncing the journal
+    def _sync_loop(self) -> None:
+        """Sync when enough records are waiting, or when the oldest one waited long enough."""
+        while not self._closed:
+            self._wake.wait(self.sync_interval)
+            self._wake.clear()
+            try:
+                self.sync()
+            except OSError as e:
+                print(f"Error syncing session journal {self.path}: {e}")
+
+    def close(self) -> None:
+        """Sync the remaining records and close the journal."""
+        self.sync()
+        with self._lock:
+            self._closed = True
+            self._file.close()
+        self._wake.set()
+
+    def resolve(self, scene_ids: Iterable[str], digests: List[int]) -> List[Optional[str]]:
+        """Map journaled digests back to scene ids.
+
+        Args:
+            scene_ids (Iterable[str]): ids of the current story, scanned until every digest is found
+            digests (List[int]): digests to resolve
+
+        Returns:
+            List[Optional[str]]: the scene id of every digest, None for scenes no longer in the story
+        """
+        missing = set(digests)
+        found: Dict[int, str] = {}
+        for scene_id in scene_ids:
+            if not missing:
+                break
+            digest = self.digest(scene_id)
+            if digest in missing:
+                found[digest] = scene_id
+                missing.discard(digest)
+        return [found.get(digest) for digest in digests]
+
+    def last_scene(self, scene_ids: Iterable[str]) -> Optional[str]:
+        """Return the scene the player was in when the game last closed.
+
+        Args:
+            scene_ids (Iterable[str]): ids of the current story
+
+        Returns:
+            Optional[str]: the scene id, None when the journal is empty or the scene was removed
+        """
+        if not self.history:
+            return None
+        return self.resolve(scene_ids, [self.history[-1]])[0]
+
+    def recent_digests(self, count: int) -> List[int]:
+        """Return the digests of the most recently entered distinct scenes, newest first."""
+        digests = []
+        for digest in reversed(self.history):
+            if digest not in digests:
+                digests.append(digest)
+                if len(digests) == count:
+                    break
+        return digests
+
+    def recent(self, scene_ids: Iterable[str], count: int) -> List[str]:
+        """Return the most recently entered distinct scenes, newest first.
+
+        Args:
+            scene_ids (Iterable[str]): ids of the current story
+            count (int): number of scenes returned at most
+
+        Returns:
+            List[str]: the scene ids
+        """
+        digests = self.recent_digests(count)
+        return [scene_id for scene_id in self.resolve(scene_ids, digests) if scene_id is not None]
@@ -0,0 +1,368 @@
+import argparse
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from configs.constants import CONFIG_PATH, DEFAULTS, INTRO_SCENE_ID
+from utils.scene_graph import SceneConfigError, validate_scenes
+from utils.scene_spec import SceneSpec
+from utils.session_journal import scene_digest
+from utils.story_engine import StoryEngine
+
+MANIFEST_NAME = 'story.json'
+INDEX_NAME = 'index.bin'
+STORY_VERSION = 1
+INDEX_HEADER = struct.Struct('<4sII') # Magic, version, number of scenes
+INDEX_ENTRY = struct.Struct('<QI') # Digest of a scene id, shard number, entries are sorted by digest
+INDEX_MAGIC = b'SUES'
+
+
+# Function to order scenes so the scenes played together end up in the same shard
+def chapter_order(scenes_data: List[Dict], start_id: str) -> List[Dict]:
+    """Return the scenes in breadth first order from the start scene, then the unreachable ones.
+
+    Args:
+        scenes_data (List[Dict]): scenes from the json config
+        start_id (str): id of the first scene
+
+    Returns:
+        List[Dict]: the same scenes, reordered
+    """
+    by_id = {scene['scene_id']: scene for scene in scenes_data}
+    seen = {start_id}
+    queue = deque([start_id] if start_id in by_id else [])
+    ordered = []
+    while queue:
+        scene = by_id[queue.popleft()]
+        ordered.append(scene)
+        targets = [button['target_scene_id'] for button in scene.get('button_config') or ()]
+        if scene.get('last_scene_id'):
+            targets.append(scene['last_scene_id'])
+        for target in targets:
+            if target in by_id and target not in seen:
+                seen.add(target)
+                queue.append(target)
+    ordered.extend(scene for scene in scenes_data if scene['scene_id'] not in seen)
+    return ordered
+
+
+def write_sharded_story(scenes_data: List[Dict], output_dir: str, start_id: str = INTRO_SCENE_ID,
+                        shard_size: int = DEFAULTS['SHARD_SCENES'], asset_root: Optional[str] = None) -> Dict[str, int]:
+    """Validate a story and write it as shards of scenes, a manifest and an id to shard index.
+
+    Warnings, such as missing assets, are printed and counted, the story is still written.
+
+    Args:
+        scenes_data (List[Dict]): scenes in the json config schema
+        output_dir (str): directory the story is written to
+        start_id (str): id of the first scene
+        shard_size (int): scenes per shard, consecutive in breadth first order like chapters
+        asset_root (Optional[str]): directory holding the asset folders of the scenes, the game's assets folder by default
+
+    Raises:
+        SceneConfigError: when the story has errors, or two scene ids share a digest
+
+    Returns:
+        Dict[str, int]: number of scenes, shards written and validation warnings
+    """
+    errors, warnings = validate_scenes(scenes_data, start_id, asset_root)
+    if errors:
+        raise SceneConfigError('Invalid story:\n' + '\n'.join(errors))
+    for warning in warnings:
+        print(f"Warning: {warning}")
+
+    os.makedirs(output_dir, exist_ok=True)
+    ordered = chapter_order(scenes_data, start_id)
+    shard_names = []
+    entries = {}
+    for shard, first in enumerate(range(0, len(ordered), shard_size)):
+        chapter = ordered[first:first + shard_size]
+        shard_names.append(f'shard_{shard:05d}.json')
+        with open(os.path.join(output_dir, shard_names[-1]), 'w') as file:
+            json.dump(chapter, file, separators=(',', ':'))
+        for scene in chapter:
+            digest = scene_digest(scene['scene_id'])
+            if digest in entries:
+                raise SceneConfigError(f"Scene id {scene['scene_id']} has the same digest as another scene, rename it")
+            entries[digest] = shard
+
+    with open(os.path.join(output_dir, INDEX_NAME), 'wb') as file:
+        file.write(INDEX_HEADER.pack(INDEX_MAGIC, STORY_VERSION, len(entries)))
+        for digest in sorted(entries):
+            file.write(INDEX_ENTRY.pack(digest, entries[digest]))
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as file:
+        json.dump({'version': STORY_VERSION, 'start': start_id, 'scenes': len(ordered), 'shards': shard_names}, file)
+    return {'scenes': len(ordered), 'shards': len(shard_names), 'warnings': len(warnings)}
+
+
+def import_config(config_path: str, output_dir: str, start_id: str = INTRO_SCENE_ID,
+                  shard_size: int = DEFAULTS['SHARD_SCENES']) -> Dict[str, int]:
+    """Convert a scenes json config into a sharded story.
+
+    Args:
+        config_path (str): path of the scenes json config
+        output_dir (str): directory the story is written to
+        start_id (str): id of the first scene
+        shard_size (int): scenes per shard
+
+    Returns:
+        Dict[str, int]: number of scenes, shards written and validation warnings
+    """
+    with open(config_path, 'r') as file:
+        return write_sharded_story(json.load(file), output_dir, start_id, shard_size)
+
+
+def import_story_nodes(start_node: Any, output_dir: str, media_path: str, asset_root: Optional[str] = None,
+                       shard_size: int = DEFAULTS['SHARD_SCENES'], write_subtitles: bool = True) -> Dict[str, int]:
+    """Convert a StoryNode graph, like the one of new game.py, into a sharded story.
+
+    Nodes are named node_<number> in breadth first order, the first node being the start
+    scene. Every scene shows the image at media_path, linked into its asset folder, and
+    the text of its node becomes its subtitle.txt. The asset folders are written under
+    asset_root; the game reads them from its assets folder, so pass 'assets' to play the
+    story at once, or copy them there.
+
+    Args:
+        start_node (Any): first StoryNode, nodes need text and a choices list of (choice_text, next_node) pairs
+        output_dir (str): directory the story is written to
+        media_path (str): existing image shown by every scene
+        asset_root (Optional[str]): directory the asset folders of the scenes are written to, output_dir/assets by default
+        shard_size (int): scenes per shard
+        write_subtitles (bool): write the node texts to the asset folders of the scenes
+
+    The story is validated against the asset folders written under asset_root.
+
+    Raises:
+        FileNotFoundError: when media_path is not a file
+        SceneConfigError: when the story has errors
+
+    Returns:
+        Dict[str, int]: number of scenes, shards written and validation warnings
+    """
+    if not os.path.isfile(media_path):
+        raise FileNotFoundError(f"Scene image {media_path} does not exist")
+    asset_root = asset_root if asset_root is not None else os.path.join(output_dir, 'assets')
+    media_source = os.path.basename(media_path)
+    engine = StoryEngine.from_story_nodes(start_node)
+    nodes = [start_node]
+    seen = {id(start_node)}
+    queue = deque([start_node])
+    while queue: # Same breadth first numbering as StoryEngine.from_story_nodes, to pair nodes with scene ids
+        for _, next_node in queue.popleft().choices:
+            if id(next_node) not in seen:
+                seen.add(id(next_node))
+                nodes.append(next_node)
+                queue.append(next_node)
+
+    scenes_data = []
+    for i, scene_id in enumerate(engine.ids):
+        scenes_data.append({
+            'scene_id': scene_id,
+            'media_source': media_source,
+            'media_type': 'image',
+            'audio_source': None,
+            'button_config': [{'text': text, 'target_scene_id': engine.ids[target]}
+                              for text, target in engine.choices(i)],
+            'has_text': write_subtitles,
+        })
+        folder = os.path.join(asset_root, scene_id)
+        os.makedirs(folder, exist_ok=True)
+        link_asset(media_path, os.path.join(folder, media_source))
+        if write_subtitles:
+            with open(os.path.join(folder, 'subtitle.txt'), 'w', encoding='utf-8') as file:
+                file.write(nodes[i].text)
+    return write_sharded_story(scenes_data, output_dir, engine.ids[0], shard_size, asset_root)
+
+
+# Function to put a shared asset file into the asset folder of a scene
+def link_asset(source: str, target: str) -> None:
+    """Hard link source to target, copying it when the file system has no hard links. An existing target is replaced."""
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+# Function to tell a sharded story from a json config
+def is_sharded_story(path: str) -> bool:
+    """Return whether a path is a sharded story directory."""
+    return os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+
+class ShardedStory:
+    """Scene registry reading a sharded story on demand.
+
+    Scene ids are found in a memory-mapped index of id digests sorted for binary search,
+    so opening a story costs the same whatever its size. A shard is parsed the first
+    time one of its scenes is asked for. Shards are evicted, least recently used first,
+    once more than max_shards are loaded and they are further than radius choices from
+    the scene the player is in. Used from the UI thread only.
+    """
+
+    def __init__(self, directory: str, max_shards: int = DEFAULTS['LOADED_SHARDS'], radius: int = 2):
+        """Open a sharded story.
+
+        Args:
+            directory (str): story directory written by write_sharded_story
+            max_shards (int): shards kept in memory when they are far from the player
+            radius (int): number of choices from the current scene within which shards are kept
+
+        Raises:
+            SceneConfigError: when the directory is not a sharded story of a supported version
+        """
+        self.directory = directory
+        self.max_shards = max_shards
+        self.radius = radius
+        with open(os.path.join(directory, MANIFEST_NAME), 'r') as file:
+            manifest = json.load(file)
+        if manifest.get('version') != STORY_VERSION:
+            raise SceneConfigError(f"Unsupported sharded story version in {directory}")
+        self.start_id: str = manifest['start']
+        self.shard_names: List[str] = manifest['shards']
+        self.shard_loads = 0
+        self._index_file = open(os.path.join(directory, INDEX_NAME), 'rb')
+        self._index = mmap.mmap(self._index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self._count = INDEX_HEADER.unpack_from(self._index, 0)
+        if magic != INDEX_MAGIC or version != STORY_VERSION:
+            raise SceneConfigError(f"Invalid index in {directory}")
+        self._shards: 'OrderedDict[int, Dict[str, SceneSpec]]' = OrderedDict()
+        self._shard_of: Dict[str, int] = {} # Ids of the loaded shards
+
+    def shard_for_digest(self, digest: int) -> Optional[int]:
+        """Return the shard holding the scene id with the given digest, by binary search in the index."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            found, shard = INDEX_ENTRY.unpack_from(self._index, INDEX_HEADER.size + middle * INDEX_ENTRY.size)
+            if found == digest:
+                return shard
+            if found < digest:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _load(self, shard: int) -> Dict[str, SceneSpec]:
+        """Return the specs of a shard, parsing it on first use."""
+        specs = self._shards.get(shard)
+        if specs is not None:
+            self._shards.move_to_end(shard)
+            return specs
+        with open(os.path.join(self.directory, self.shard_names[shard]), 'r') as file:
+            specs = {scene['scene_id']: SceneSpec.from_data(scene) for scene in json.load(file)}
+        self._shards[shard] = specs
+        self._shard_of.update(dict.fromkeys(specs, shard))
+        self.shard_loads += 1
+        return specs
+
+    def get(self, scene_id: str) -> Optional[SceneSpec]:
+        """Return the spec for the given scene id, loading its shard when needed, or None if it is unknown.
+
+        Args:
+            scene_id (str): scene id to look up
+
+        Returns:
+            Optional[SceneSpec]: matching scene spec
+        """
+        shard = self._shard_of.get(scene_id)
+        if shard is None:
+            shard = self.shard_for_digest(scene_digest(scene_id))
+            if shard is None:
+                return None
+        return self._load(shard).get(scene_id)
+
+    def visit(self, scene_id: str) -> None:
+        """Record the scene the player entered, and evict the shards far from it.
+
+        Args:
+            scene_id (str): scene id the player is in
+        """
+        near = set()
+        seen = {scene_id}
+        frontier = [scene_id]
+        for depth in range(self.radius + 1): # Breadth first walk of the scenes within radius choices
+            next_frontier = []
+            for current in frontier:
+                spec = self.get(current)
+                if spec is None:
+                    continue
+                near.add(self._shard_of[current])
+                if depth == self.radius:
+                    continue
+                targets = [button.target_scene_id for button in spec.button_config]
+                if spec.last_scene_id:
+                    targets.append(spec.last_scene_id)
+                for target in targets:
+                    if target not in seen:
+                        seen.add(target)
+                        next_frontier.append(target)
+            frontier = next_frontier
+        for shard in list(self._shards):
+            if len(self._shards) <= self.max_shards:
+                break
+            if shard not in near:
+                for evicted_id in self._shards.pop(shard):
+                    del self._shard_of[evicted_id]
+
+    def ids_for_digests(self, digests: Iterable[int]) -> List[str]:
+        """Load the shards holding the given scene id digests and return their scene ids.
+
+        Used to resolve the session journal without listing every scene of the story.
+
+        Args:
+            digests (Iterable[int]): scene id digests
+
+        Returns:
+            List[str]: ids of the scenes in those shards
+        """
+        ids = []
+        for shard in dict.fromkeys(self.shard_for_digest(digest) for digest in digests):
+            if shard is not None:
+                ids.extend(self._load(shard))
+        return ids
+
+    def loaded_shards(self) -> List[int]:
+        """Return the shards in memory, least recently used first."""
+        return list(self._shards)
+
+    def __contains__(self, scene_id: str) -> bool:
+        return self.shard_for_digest(scene_digest(scene_id)) is not None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[SceneSpec]:
+        """Iterate over every scene, parsing every shard without keeping them, for tools only."""
+        for shard in range(len(self.shard_names)):
+            specs = self._shards.get(shard)
+            if specs is None:
+                with open(os.path.join(self.directory, self.shard_names[shard]), 'r') as file:
+                    specs = {scene['scene_id']: SceneSpec.from_data(scene) for scene in json.load(file)}
+            yield from specs.values()
+
+    def close(self) -> None:
+        """Release the memory mapping of the index."""
+        self._index.close()
+        self._index_file.close()
+
+
+if __name__ == '__main__':
+    # Converts the scenes json config into a sharded story
+    parser = argparse.ArgumentParser(description='Convert the scenes json config into a sharded story.')
+    parser.add_argument('--config', default=CONFIG_PATH, help='path of the scenes json config')
+    parser.add_argument('--output', required=True, help='directory the sharded story is written to')
+    parser.add_argument('--shard-size', type=int, default=DEFAULTS['SHARD_SCENES'], help='scenes per shard')
+    args = parser.parse_args()
+    try:
+        written = import_config(args.config, args.output, shard_size=args.shard_size)
+    except SceneConfigError as error:
+        print(error)
+        sys.exit(1)
+    print(f"Wrote {written['scenes']} scenes in {written['shards']} shards to {args.output}, {written['warnings']} warnings")
@@ -0,0 +1,152 @@
+import argparse
+from typing import Dict, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from configs.constants import CONFIG_PATH
+from utils.story_engine import StoryEngine
+
+
+class SimulationResult(NamedTuple):
+    """Statistics of a batch of simulated playthroughs."""
+
+    runs: int
+    ending_counts: Dict[str, int] # Number of playthroughs that ended on each ending scene
+    unfinished: int # Playthroughs still running after max_steps, such as ones stuck in a loop
+    path_lengths: np.ndarray # path_lengths[k] is the number of finished playthroughs that showed k scenes
+    visits: Dict[str, float] # Mean number of times each scene is shown in a playthrough
+
+
+# Function to create the policy picking every choice with the same probability
+def uniform_policy(engine: StoryEngine) -> np.ndarray:
+    """Return the choice probabilities of a player picking choices at random.
+
+    Args:
+        engine (StoryEngine): the story
+
+    Returns:
+        np.ndarray: probabilities of shape (scenes, max choices), rows sum to 1 over the valid choices
+    """
+    _, counts = engine.transition_table()
+    counts = np.asarray(counts)
+    width = max(int(counts.max(initial=0)), 1)
+    valid = np.arange(width)[None, :] < counts[:, None]
+    return valid / np.maximum(counts, 1)[:, None]
+
+
+# Function to create a policy from per scene choice weights
+def weighted_policy(engine: StoryEngine, weights: Dict[str, Sequence[float]]) -> np.ndarray:
+    """Return choice probabilities from relative weights, scenes without weights pick at random.
+
+    Args:
+        engine (StoryEngine): the story
+        weights (Dict[str, Sequence[float]]): weight of every choice, by scene id
+
+    Returns:
+        np.ndarray: probabilities of shape (scenes, max choices)
+    """
+    policy = uniform_policy(engine)
+    for scene_id, scene_weights in weights.items():
+        row = np.zeros(policy.shape[1])
+        row[:len(scene_weights)] = scene_weights
+        row[policy[engine.index[scene_id]] == 0] = 0 # Ignoring weights of choices the scene does not have
+        if row.sum() > 0:
+            policy[engine.index[scene_id]] = row / row.sum()
+    return policy
+
+
+def simulate(engine: StoryEngine, runs: int, policy: Optional[np.ndarray] = None, max_steps: int = 1000,
+             seed: Optional[int] = None, batch_size: int = 1_000_000) -> SimulationResult:
+    """Play the story many times at once, advancing every playthrough of a batch with array operations.
+
+    Args:
+        engine (StoryEngine): the story
+        runs (int): number of playthroughs
+        policy (Optional[np.ndarray]): choice probabilities per scene, uniform_policy by default
+        max_steps (int): playthroughs longer than this are counted as unfinished
+        seed (Optional[int]): seed of the random generator, for reproducible results
+        batch_size (int): playthroughs simulated together, bounds the memory used
+
+    Returns:
+        SimulationResult: ending distribution, path length histogram and visit frequencies
+    """
+    table, counts = engine.transition_table()
+    targets = np.asarray(table, dtype=np.int64)
+    counts = np.asarray(counts, dtype=np.int64)
+    if policy is None:
+        policy = uniform_policy(engine)
+    cumulative = np.cumsum(policy, axis=1)
+    scenes = len(engine)
+    rng = np.random.default_rng(seed)
+
+    ending_counts = np.zeros(scenes, dtype=np.int64)
+    visits = np.zeros(scenes, dtype=np.int64)
+    path_lengths = np.zeros(max_steps + 2, dtype=np.int64)
+    unfinished = 0
+
+    for batch_start in range(0, runs, batch_size):
+        size = min(batch_size, runs - batch_start)
+        state = np.full(size, engine.start, dtype=np.int64)
+        length = np.ones(size, dtype=np.int64)
+        active = np.arange(size)
+        visits += np.bincount(state, minlength=scenes)
+
+        for _ in range(max_steps):
+            current = state[active]
+            ended = counts[current] == 0
+            if ended.any(): # Recording the playthroughs that reached an ending
+                ending_counts += np.bincount(current[ended], minlength=scenes)
+                path_lengths += np.bincount(length[active[ended]], minlength=path_lengths.size)[:path_lengths.size]
+                active = active[~ended]
+                current = current[~ended]
+            if not active.size:
+                break
+
+            # Picking a choice for every running playthrough by inverting the cumulative probabilities
+            draws = rng.random(active.size)
+            picks = (draws[:, None] >= cumulative[current]).sum(axis=1)
+            picks = np.minimum(picks, counts[current] - 1)
+            state[active] = targets[current, picks]
+            length[active] += 1
+            visits += np.bincount(state[active], minlength=scenes)
+        unfinished += active.size
+
+    return SimulationResult(
+        runs=runs,
+        ending_counts={engine.ids[i]: int(count) for i, count in enumerate(ending_counts) if count},
+        unfinished=int(unfinished),
+        path_lengths=np.trim_zeros(path_lengths, 'b'),
+        visits={scene_id: visits[i] / runs if runs else 0.0 for i, scene_id in enumerate(engine.ids)},
+    )
+
+
+def format_report(result: SimulationResult) -> str:
+    """Format a simulation result as a readable report.
+
+    Args:
+        result (SimulationResult): the simulation result
+
+    Returns:
+        str: the report
+    """
+    lines = [f"Playthroughs: {result.runs}, unfinished: {result.unfinished}", "Endings:"]
+    for scene_id, count in sorted(result.ending_counts.items(), key=lambda item: -item[1]):
+        lines.append(f"  {scene_id:<24} {count / result.runs:8.2%}")
+    lines.append("Path lengths:")
+    for length, count in enumerate(result.path_lengths):
+        if count:
+            lines.append(f"  {length:>4} scenes {count / result.runs:8.2%}")
+    lines.append("Mean visits per playthrough:")
+    for scene_id, mean in sorted(result.visits.items(), key=lambda item: -item[1]):
+        lines.append(f"  {scene_id:<24} {mean:8.3f}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Simulate random playthroughs of the story.')
+    parser.add_argument('--config', default=CONFIG_PATH, help='path of the scenes json config')
+    parser.add_argument('--runs', type=int, default=1_000_000, help='number of playthroughs')
+    parser.add_argument('--max-steps', type=int, default=1000, help='longest playthrough simulated')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the random generator')
+    args = parser.parse_args()
+    print(format_report(simulate(StoryEngine.from_config(args.config), args.runs, max_steps=args.max_steps, seed=args.seed)))
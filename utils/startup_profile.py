@@ -0,0 +1,100 @@
+import builtins
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+PROFILE_FLAG = '--profile-startup'
+
+
+class StartupProfiler:
+    """Records how long the imports and build phases of the game take until the first frame.
+
+    When disabled, phases are no-ops so the profiler can stay in the startup code.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        self.imports: Dict[str, float] = {}
+        self.phases: List[Tuple[str, float]] = []
+        self._original_import = None
+        self._depth = 0
+
+    @classmethod
+    def from_argv(cls, argv: List[str]) -> 'StartupProfiler':
+        """Create the profiler, enabled when the flag is in argv. The flag is removed so Kivy does not parse it.
+
+        Args:
+            argv (List[str]): command line arguments, usually sys.argv
+
+        Returns:
+            StartupProfiler: the profiler, already timing imports when enabled
+        """
+        enabled = PROFILE_FLAG in argv
+        if enabled:
+            argv.remove(PROFILE_FLAG)
+        profiler = cls(enabled)
+        if enabled:
+            profiler.start_imports()
+        return profiler
+
+    # Method to start timing the modules imported for the first time
+    def start_imports(self) -> None:
+        """Wrap the import statement to time every module that is not imported yet."""
+        self._original_import = original_import = builtins.__import__
+
+        def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+            if level or name in sys.modules: # Relative and already loaded modules cost nothing worth reporting
+                return original_import(name, globals, locals, fromlist, level)
+            self._depth += 1
+            start = time.perf_counter()
+            try:
+                return original_import(name, globals, locals, fromlist, level)
+            finally:
+                self._depth -= 1
+                if self._depth == 0: # Only top level imports are recorded, their time includes nested imports
+                    self.imports[name] = self.imports.get(name, 0.0) + time.perf_counter() - start
+
+        builtins.__import__ = timed_import
+
+    def stop_imports(self) -> None:
+        """Restore the import statement and record the import phase."""
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+            self.phases.append(('imports', time.perf_counter() - self.started))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time a block of the startup.
+
+        Args:
+            name (str): name of the phase in the report
+        """
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, time.perf_counter() - start))
+
+    def report(self, top: int = 15) -> str:
+        """Return the startup breakdown.
+
+        Args:
+            top (int): number of slowest imports listed
+
+        Returns:
+            str: the report
+        """
+        lines = ['Startup profile', 'Slowest imports:']
+        for name, seconds in sorted(self.imports.items(), key=lambda item: -item[1])[:top]:
+            lines.append(f"  {name:<40} {seconds * 1000:9.1f} ms")
+        lines.append('Phases:')
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<40} {seconds * 1000:9.1f} ms")
+        lines.append(f"  {'time to first frame':<40} {(time.perf_counter() - self.started) * 1000:9.1f} ms")
+        return '\n'.join(lines)
@@ -0,0 +1,131 @@
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from configs.constants import CONFIG_PATH, INTRO_SCENE_ID
+from utils.scene_graph import NO_SCENE, CompiledSceneGraph, load_scene_graph
+
+
+class StoryEngine:
+    """UI-free branching logic of a story.
+
+    Scenes are numbered from 0. A scene with choices waits for the player to pick one,
+    a scene without choices but with a last scene moves on by itself once its audio
+    ends, and a scene with neither is an ending. This mirrors ButtonBar and
+    Scene.on_audio_stop without any widget.
+    """
+
+    def __init__(self, ids: List[str], choice_texts: List[List[str]], choice_targets: List[List[int]],
+                 auto_next: List[int], start: int = 0):
+        self.ids = ids
+        self.index: Dict[str, int] = {scene_id: i for i, scene_id in enumerate(ids)}
+        self.choice_texts = choice_texts
+        self.choice_targets = choice_targets
+        self.auto_next = auto_next
+        self.start = start
+
+    @classmethod
+    def from_graph(cls, graph: CompiledSceneGraph) -> 'StoryEngine':
+        """Create the engine from a compiled scene graph.
+
+        Args:
+            graph (CompiledSceneGraph): compiled scenes config
+
+        Returns:
+            StoryEngine: the engine
+        """
+        choice_texts, choice_targets = [], []
+        for i, scene_id in enumerate(graph.ids):
+            choice_texts.append([button.text for button in graph.registry.get(scene_id).button_config])
+            choice_targets.append(list(graph.targets[graph.offsets[i]:graph.offsets[i + 1]]))
+        return cls(list(graph.ids), choice_texts, choice_targets, list(graph.last_scene), graph.start)
+
+    @classmethod
+    def from_config(cls, config_path: str = CONFIG_PATH, start_id: str = INTRO_SCENE_ID) -> 'StoryEngine':
+        """Create the engine from a scenes json config, through the compiled graph cache.
+
+        Args:
+            config_path (str): path of the scenes json config
+            start_id (str): id of the first scene
+
+        Returns:
+            StoryEngine: the engine
+        """
+        return cls.from_graph(load_scene_graph(config_path, start_id))
+
+    @classmethod
+    def from_story_nodes(cls, start_node: Any) -> 'StoryEngine':
+        """Create the engine from a StoryNode graph like the one of new game.py.
+
+        Nodes need a choices list of (choice_text, next_node) pairs. They are numbered in
+        breadth first order from the start node and named node_<number>.
+
+        Args:
+            start_node (Any): first StoryNode of the story
+
+        Returns:
+            StoryEngine: the engine
+        """
+        nodes = [start_node]
+        numbers = {id(start_node): 0}
+        queue = deque([start_node])
+        while queue:
+            for _, next_node in queue.popleft().choices:
+                if id(next_node) not in numbers:
+                    numbers[id(next_node)] = len(nodes)
+                    nodes.append(next_node)
+                    queue.append(next_node)
+
+        ids = [f'node_{i}' for i in range(len(nodes))]
+        choice_texts = [[text for text, _ in node.choices] for node in nodes]
+        choice_targets = [[numbers[id(next_node)] for _, next_node in node.choices] for node in nodes]
+        return cls(ids, choice_texts, choice_targets, [NO_SCENE] * len(nodes), 0)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def choices(self, scene: int) -> List[Tuple[str, int]]:
+        """Return the (text, target scene) choices of a scene.
+
+        Args:
+            scene (int): scene index
+
+        Returns:
+            List[Tuple[str, int]]: the choices offered to the player
+        """
+        return list(zip(self.choice_texts[scene], self.choice_targets[scene]))
+
+    def is_ending(self, scene: int) -> bool:
+        """Return whether the story ends on a scene."""
+        return not self.choice_targets[scene] and self.auto_next[scene] == NO_SCENE
+
+    def next_scene(self, scene: int, choice: Optional[int] = None) -> int:
+        """Return the scene shown after a scene.
+
+        Args:
+            scene (int): current scene index
+            choice (Optional[int]): index of the choice picked, None for scenes that move on by themselves
+
+        Raises:
+            IndexError: when the choice does not exist
+
+        Returns:
+            int: the next scene index, NO_SCENE when the story has ended
+        """
+        if self.choice_targets[scene]:
+            if choice is None or not 0 <= choice < len(self.choice_targets[scene]):
+                raise IndexError(f"Scene {self.ids[scene]} has no choice {choice}")
+            return self.choice_targets[scene][choice]
+        return self.auto_next[scene]
+
+    def transition_table(self) -> Tuple[List[List[int]], List[int]]:
+        """Return the transitions as a table padded with NO_SCENE and the number of choices of every scene.
+
+        Scenes that move on by themselves have a single transition to their last scene.
+
+        Returns:
+            Tuple[List[List[int]], List[int]]: the padded target table and the choice counts
+        """
+        rows = [targets if targets else ([auto] if auto != NO_SCENE else [])
+                for targets, auto in zip(self.choice_targets, self.auto_next)]
+        width = max((len(row) for row in rows), default=0) or 1
+        return [row + [NO_SCENE] * (width - len(row)) for row in rows], [len(row) for row in rows]
@@ -0,0 +1,517 @@
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import re
+import secrets
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, unquote
+
+from configs.constants import BUNDLE_PATH, CONFIG_PATH, INTRO_SCENE_ID
+from utils.asset_store import AssetStore
+from utils.bundle import AssetBundle
+from utils.scene_graph import NO_SCENE, load_scene_graph
+from utils.scene_spec import SceneRegistry
+from utils.story_engine import StoryEngine
+from utils.subtitle_store import SubtitleStore
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+MAX_MESSAGE_BYTES = 64 * 1024 # Largest websocket message or request header line accepted
+MAX_HEADER_LINES = 100 # Header lines accepted in a request, more are answered with 431
+STREAM_CHUNK_BYTES = 256 * 1024 # Asset bytes written before waiting for the client to drain them
+RANGE_PATTERN = re.compile(r'bytes=(\d*)-(\d*)$')
+STATUS_TEXT = {
+    101: 'Switching Protocols', 200: 'OK', 201: 'Created', 204: 'No Content', 206: 'Partial Content',
+    400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+    416: 'Range Not Satisfiable', 431: 'Request Header Fields Too Large', 500: 'Internal Server Error',
+}
+
+
+class Session:
+    """State of one remote player: where they are in the story and when they were last seen."""
+
+    __slots__ = ('scene', 'steps', 'last_active')
+
+    def __init__(self, scene: int):
+        self.scene = scene
+        self.steps = 0
+        self.last_active = time.monotonic()
+
+
+class StoryError(Exception):
+    """Raised when a request can not be applied to a session, carries the HTTP status."""
+
+    def __init__(self, status: int, message: str, headers: str = ''):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers # Header lines sent with the error response, each ending with \r\n
+
+
+# Function to parse a Range header against a resource size
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Return the first and last byte of a single byte range request.
+
+    Args:
+        header (Optional[str]): value of the Range header
+        size (int): size of the resource
+
+    Raises:
+        StoryError: 416 when the range can not be served, with the Content-Range header giving the size
+
+    Returns:
+        Optional[Tuple[int, int]]: inclusive byte positions, None to send the whole resource
+    """
+    if not header:
+        return None
+    unsatisfiable = f'Content-Range: bytes */{size}\r\n' # Tells the client the size it can ask ranges of
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or not (match.group(1) or match.group(2)):
+        raise StoryError(416, f"Unsupported range {header}", unsatisfiable) # Multiple ranges are not supported
+    if not size:
+        raise StoryError(416, f"Range {header} of an empty resource", unsatisfiable)
+    if not match.group(1): # Suffix range, the last n bytes
+        length = int(match.group(2))
+        if not length:
+            raise StoryError(416, f"Empty range {header}", unsatisfiable)
+        return max(size - length, 0), size - 1
+    first = int(match.group(1))
+    last = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+    if first >= size or first > last:
+        raise StoryError(416, f"Range {header} outside of {size} bytes", unsatisfiable)
+    return first, last
+
+
+# Function to read the header block of an HTTP request
+async def read_headers(reader: asyncio.StreamReader) -> Dict[str, str]:
+    """Read the header lines of a request, up to the empty line ending them.
+
+    Raises:
+        StoryError: 431 when there are more than MAX_HEADER_LINES lines, or one is longer than MAX_MESSAGE_BYTES
+
+    Returns:
+        Dict[str, str]: header values keyed by lowercase name
+    """
+    headers = {}
+    for _ in range(MAX_HEADER_LINES + 1):
+        try:
+            line = (await reader.readuntil(b'\r\n')).decode('latin-1')
+        except asyncio.LimitOverrunError:
+            raise StoryError(431, f"Header line longer than {MAX_MESSAGE_BYTES} bytes")
+        if line == '\r\n':
+            return headers
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    raise StoryError(431, f"More than {MAX_HEADER_LINES} header lines")
+
+
+# Function to unmask the payload of a websocket frame sent by a client
+def unmask(payload: bytes, mask: bytes) -> bytes:
+    """XOR a payload with its 4 byte mask, as one big integer operation instead of a loop over bytes."""
+    if not payload:
+        return payload
+    key = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    return (int.from_bytes(payload, 'little') ^ int.from_bytes(key, 'little')).to_bytes(len(payload), 'little')
+
+
+# Function to encode an unfragmented websocket frame sent by the server
+def websocket_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Return a final, unmasked websocket frame."""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 1 << 16:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+async def read_websocket_frame(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    """Read one websocket frame.
+
+    Raises:
+        StoryError: 400 for fragmented or oversized messages
+
+    Returns:
+        Tuple[int, bytes]: the opcode and the unmasked payload
+    """
+    first, second = await reader.readexactly(2)
+    if not first & 0x80:
+        raise StoryError(400, 'Fragmented websocket messages are not supported')
+    length = second & 0x7f
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > MAX_MESSAGE_BYTES:
+        raise StoryError(400, f"Websocket message of {length} bytes is too large")
+    mask = await reader.readexactly(4) if second & 0x80 else b''
+    payload = await reader.readexactly(length)
+    return first & 0x0f, unmask(payload, mask) if mask else payload
+
+
+class StoryServer:
+    """Serves the story to many concurrent remote players from a single asyncio loop.
+
+    The scene graph, scene views, subtitles and asset cache are built once and shared
+    read-only by every session, a session only holds its scene index, its step count
+    and when it was last active. Players use either HTTP:
+
+        POST   /sessions                      start a session, returns the first scene
+        GET    /sessions/<id>                 current scene of a session
+        POST   /sessions/<id>/choices/<n>     pick choice n, like pressing a ButtonBar button
+        POST   /sessions/<id>/advance         move on from a scene without choices once its audio ended
+        DELETE /sessions/<id>                 end a session
+        GET    /assets/<scene_id>/<file>      asset bytes, with single range requests
+        GET    /stats                         session, transition and asset cache counters
+
+    or a websocket on /ws, sending {"op": "start"}, {"op": "choose", "choice": n} and
+    {"op": "advance"} messages and receiving the same scene documents.
+    """
+
+    def __init__(self, engine: StoryEngine, registry: SceneRegistry, subtitles: SubtitleStore, store: AssetStore,
+                 session_ttl: float = 15 * 60):
+        self.engine = engine
+        self.registry = registry
+        self.subtitles = subtitles
+        self.store = store
+        self.session_ttl = session_ttl
+        self.sessions: Dict[int, Session] = {}
+        self.transitions = 0
+        self._views: List[Optional[bytes]] = [None] * len(engine)
+        self._reaper: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.AbstractServer] = None
+
+    @classmethod
+    def from_config(cls, config_path: str = CONFIG_PATH, bundle_path: str = BUNDLE_PATH,
+                    start_id: str = INTRO_SCENE_ID) -> 'StoryServer':
+        """Create the server from the scenes config, serving assets from the bundle when it exists.
+
+        Args:
+            config_path (str): path of the scenes json config
+            bundle_path (str): path of the asset bundle
+            start_id (str): id of the first scene
+
+        Returns:
+            StoryServer: the server
+        """
+        graph = load_scene_graph(config_path, start_id)
+        bundle = AssetBundle.open_default(bundle_path)
+        return cls(StoryEngine.from_graph(graph), graph.registry, SubtitleStore(graph.registry, bundle),
+                   AssetStore(bundle=bundle))
+
+    # Method to return the shared, pre-encoded document of a scene
+    def view(self, scene: int) -> bytes:
+        """Return the json document of a scene, encoded once and shared by every session.
+
+        Args:
+            scene (int): scene index
+
+        Returns:
+            bytes: the encoded document
+        """
+        view = self._views[scene]
+        if view is None:
+            scene_id = self.engine.ids[scene]
+            spec = self.registry.get(scene_id)
+            view = self._views[scene] = json.dumps({
+                'scene_id': scene_id,
+                'media_type': spec.media_type,
+                'media': f'/assets/{quote(scene_id)}/{quote(spec.media_source)}',
+                'audio': f'/assets/{quote(scene_id)}/{quote(spec.audio_source)}' if spec.audio_source else None,
+                'subtitle': self.subtitles.get(scene_id) if spec.has_text else None,
+                'text_style': spec.text_style,
+                'bg_color': spec.bg_color,
+                'choices': self.engine.choice_texts[scene],
+                'advances': not self.engine.choice_targets[scene] and self.engine.auto_next[scene] != NO_SCENE,
+                'ending': self.engine.is_ending(scene),
+            }).encode('utf-8')
+        return view
+
+    def session_document(self, session_id: int, session: Session) -> bytes:
+        """Return the document sent to a player, the shared scene view wrapped with the session state."""
+        return b'{"session":"%x","steps":%d,"scene":%s}' % (session_id, session.steps, self.view(session.scene))
+
+    def start_session(self) -> Tuple[int, Session]:
+        """Create a session on the first scene of the story."""
+        session_id = secrets.randbits(63) # Unguessable, so players can not drive each other's sessions
+        session = self.sessions[session_id] = Session(self.engine.start)
+        return session_id, session
+
+    def find_session(self, session_id: str) -> Tuple[int, Session]:
+        """Return a session from its hex id.
+
+        Raises:
+            StoryError: 404 when the session does not exist or expired
+        """
+        try:
+            number = int(session_id, 16)
+        except ValueError:
+            number = -1
+        session = self.sessions.get(number)
+        if session is None:
+            raise StoryError(404, f"No session {session_id}")
+        session.last_active = time.monotonic()
+        return number, session
+
+    def move(self, session: Session, choice: Optional[int]) -> None:
+        """Move a session to its next scene, with the semantics of the ButtonBar and Scene.on_audio_stop.
+
+        Args:
+            session (Session): the session
+            choice (Optional[int]): choice picked, None to move on from a scene without choices
+
+        Raises:
+            StoryError: 409 when the scene has no such choice, or does not move on by itself
+        """
+        engine = self.engine
+        if choice is None and engine.choice_targets[session.scene]:
+            raise StoryError(409, f"Scene {engine.ids[session.scene]} waits for a choice")
+        if choice is not None and not engine.choice_targets[session.scene]:
+            raise StoryError(409, f"Scene {engine.ids[session.scene]} has no choices")
+        try:
+            target = engine.next_scene(session.scene, choice)
+        except IndexError as e:
+            raise StoryError(409, str(e))
+        if target == NO_SCENE:
+            raise StoryError(409, f"Scene {engine.ids[session.scene]} is an ending")
+        session.scene = target
+        session.steps += 1
+        self.transitions += 1
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8080) -> asyncio.AbstractServer:
+        """Start listening and expiring idle sessions.
+
+        Args:
+            host (str): interface to listen on
+            port (int): port to listen on, 0 picks a free one
+
+        Returns:
+            asyncio.AbstractServer: the listening server
+        """
+        self._reaper = asyncio.get_running_loop().create_task(self.expire_sessions())
+        self._listener = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_MESSAGE_BYTES)
+        return self._listener
+
+    async def stop(self) -> None:
+        """Stop listening and stop expiring sessions, waiting for the reaper task to end."""
+        if self._listener is not None:
+            self._listener.close()
+            await self._listener.wait_closed()
+            self._listener = None
+        reaper, self._reaper = self._reaper, None
+        if reaper is not None:
+            reaper.cancel()
+            try:
+                await reaper
+            except asyncio.CancelledError:
+                pass
+
+    async def expire_sessions(self) -> None:
+        """Drop the sessions idle for longer than the session ttl, checking every minute."""
+        while True:
+            await asyncio.sleep(min(self.session_ttl, 60))
+            deadline = time.monotonic() - self.session_ttl
+            for session_id in [key for key, session in self.sessions.items() if session.last_active < deadline]:
+                del self.sessions[session_id]
+
+    # Method run for every client connection, serving its requests one after another
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve the HTTP requests of a keep-alive connection, or its websocket once upgraded."""
+        try:
+            while True:
+                try:
+                    request_line = await reader.readuntil(b'\r\n')
+                except asyncio.IncompleteReadError:
+                    break
+                method, target, version = request_line.decode('latin-1').split(' ', 2)
+                try:
+                    headers = await read_headers(reader)
+                except StoryError as e: # The rest of the request can not be told apart from the next one, the connection is closed
+                    self.respond(writer, e.status, json.dumps({'error': str(e)}).encode('utf-8'), False)
+                    await writer.drain()
+                    break
+                if int(headers.get('content-length', 0)): # Request bodies are not used, they are skipped
+                    await reader.readexactly(int(headers['content-length']))
+
+                if target == '/ws' and headers.get('upgrade', '').lower() == 'websocket':
+                    await self.serve_websocket(reader, writer, headers)
+                    break
+                keep_alive = version.strip() == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                try:
+                    await self.route(method, target, headers, writer, keep_alive)
+                except StoryError as e:
+                    self.respond(writer, e.status, json.dumps({'error': str(e)}).encode('utf-8'), keep_alive, extra=e.headers)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, asyncio.IncompleteReadError, ValueError):
+            pass # Broken or malformed connections are dropped
+        finally:
+            writer.close()
+
+    @staticmethod
+    def respond(writer: asyncio.StreamWriter, status: int, body: bytes = b'', keep_alive: bool = True,
+                content_type: str = 'application/json', extra: str = '') -> None:
+        """Write a complete response."""
+        writer.write((
+            f'HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: {"keep-alive" if keep_alive else "close"}\r\n{extra}\r\n'
+        ).encode('latin-1'))
+        if body:
+            writer.write(body)
+
+    async def route(self, method: str, target: str, headers: Dict[str, str], writer: asyncio.StreamWriter,
+                    keep_alive: bool) -> None:
+        """Dispatch an HTTP request.
+
+        Raises:
+            StoryError: when the request is invalid
+        """
+        parts = [unquote(part) for part in target.split('?', 1)[0].strip('/').split('/')]
+        if parts[0] == 'sessions':
+            if len(parts) == 1 and method == 'POST':
+                session_id, session = self.start_session()
+                self.respond(writer, 201, self.session_document(session_id, session), keep_alive)
+                return
+            if len(parts) < 2:
+                raise StoryError(405, f"{method} /sessions is not supported")
+            session_id, session = self.find_session(parts[1])
+            if len(parts) == 2 and method == 'GET':
+                self.respond(writer, 200, self.session_document(session_id, session), keep_alive)
+            elif len(parts) == 2 and method == 'DELETE':
+                del self.sessions[session_id]
+                self.respond(writer, 204, keep_alive=keep_alive)
+            elif method == 'POST' and len(parts) == 4 and parts[2] == 'choices' and parts[3].isdigit():
+                self.move(session, int(parts[3]))
+                self.respond(writer, 200, self.session_document(session_id, session), keep_alive)
+            elif method == 'POST' and len(parts) == 3 and parts[2] == 'advance':
+                self.move(session, None)
+                self.respond(writer, 200, self.session_document(session_id, session), keep_alive)
+            else:
+                raise StoryError(405, f"{method} {target} is not supported")
+        elif parts[0] == 'assets' and len(parts) == 3 and method in ('GET', 'HEAD'):
+            await self.send_asset(parts[1], parts[2], headers.get('range'), writer, keep_alive, method == 'HEAD')
+        elif parts == ['stats'] and method == 'GET':
+            stats = {'sessions': len(self.sessions), 'transitions': self.transitions, 'assets': self.store.stats()}
+            self.respond(writer, 200, json.dumps(stats).encode('utf-8'), keep_alive)
+        else:
+            raise StoryError(404, f"No route for {method} {target}")
+
+    async def send_asset(self, scene_id: str, file_name: str, range_header: Optional[str],
+                         writer: asyncio.StreamWriter, keep_alive: bool, head_only: bool = False) -> None:
+        """Stream the bytes of a scene asset from the shared cache.
+
+        Only the media and audio referenced by the scene are served, so no other file can be read.
+
+        Raises:
+            StoryError: 404 for unknown assets, 416 for unsatisfiable ranges
+        """
+        spec = self.registry.get(scene_id)
+        if spec is None or file_name not in (spec.media_source, spec.audio_source):
+            raise StoryError(404, f"No asset {scene_id}/{file_name}")
+        loop = asyncio.get_running_loop()
+        try: # Reading or hashing a file for the first time blocks, so it runs on the default executor
+            key, data = await loop.run_in_executor(None, self.store.acquire, scene_id, file_name, read_asset_bytes)
+        except OSError:
+            raise StoryError(404, f"Missing asset {scene_id}/{file_name}")
+        try:
+            size = len(data)
+            byte_range = parse_range(range_header, size)
+            first, last = byte_range if byte_range else (0, size - 1)
+            extra = f'Accept-Ranges: bytes\r\nETag: "{key}"\r\n'
+            if byte_range:
+                extra += f'Content-Range: bytes {first}-{last}/{size}\r\n'
+            writer.write((
+                f'HTTP/1.1 {206 if byte_range else 200} {STATUS_TEXT[206 if byte_range else 200]}\r\n'
+                f'Content-Type: application/octet-stream\r\nContent-Length: {last - first + 1}\r\n'
+                f'Connection: {"keep-alive" if keep_alive else "close"}\r\n{extra}\r\n'
+            ).encode('latin-1'))
+            if not head_only:
+                view = memoryview(data)
+                for start in range(first, last + 1, STREAM_CHUNK_BYTES):
+                    writer.write(view[start:min(start + STREAM_CHUNK_BYTES, last + 1)])
+                    await writer.drain() # Slow clients hold their connection, not the memory of the server
+        finally:
+            self.store.release(key)
+
+    async def serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                              headers: Dict[str, str]) -> None:
+        """Upgrade the connection and serve the story messages of one player."""
+        client_key = headers.get('sec-websocket-key', '').encode('latin-1')
+        accept = base64.b64encode(hashlib.sha1(client_key + WEBSOCKET_GUID).digest()).decode('latin-1')
+        writer.write((
+            'HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'
+        ).encode('latin-1'))
+        session_id, session = None, None
+        try:
+            while True:
+                opcode, payload = await read_websocket_frame(reader)
+                if opcode == 0x8: # Close
+                    writer.write(websocket_frame(payload[:2], 0x8))
+                    break
+                if opcode == 0x9: # Ping
+                    writer.write(websocket_frame(payload, 0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+                try:
+                    message = json.loads(payload)
+                    op = message.get('op')
+                    if op == 'start':
+                        if session_id is not None:
+                            self.sessions.pop(session_id, None)
+                        session_id, session = self.start_session()
+                    elif session is None:
+                        raise StoryError(409, 'Send a start message first')
+                    elif op in ('choose', 'advance'):
+                        session.last_active = time.monotonic()
+                        self.move(session, int(message['choice']) if op == 'choose' else None)
+                    else:
+                        raise StoryError(400, f"Unknown op {op}")
+                    writer.write(websocket_frame(self.session_document(session_id, session)))
+                except (StoryError, ValueError, KeyError, TypeError) as e:
+                    status = e.status if isinstance(e, StoryError) else 400
+                    writer.write(websocket_frame(json.dumps({'error': str(e), 'status': status}).encode('utf-8')))
+                await writer.drain()
+        except StoryError:
+            writer.write(websocket_frame(struct.pack('!H', 1009), 0x8)) # Message too big or fragmented
+        finally:
+            if session_id is not None: # A websocket session lives as long as its connection
+                self.sessions.pop(session_id, None)
+
+
+# Function used as the asset store loader, the server caches raw bytes instead of decoded assets
+def read_asset_bytes(path: str, data: Optional[memoryview] = None):
+    """Return the bytes of an asset: its bundle slice, without a copy, or the content of its file."""
+    if data is not None:
+        return data
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+async def serve(host: str, port: int, config_path: str) -> None:
+    """Run the story server until interrupted."""
+    server = StoryServer.from_config(config_path)
+    listener = await server.start(host, port)
+    print(f"Serving {len(server.engine)} scenes on http://{host}:{listener.sockets[0].getsockname()[1]}")
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve the story to remote players over HTTP and websockets.')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='port to listen on')
+    parser.add_argument('--config', default=CONFIG_PATH, help='path of the scenes json config')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.config))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,134 @@
+import os
+from typing import Dict, Iterable, List, Optional, Union
+
+from configs.constants import DEFAULTS
+from utils.bundle import AssetBundle
+from utils.helper import asset_path
+from utils.scene_spec import SceneRegistry, SceneSpec
+from utils.tracing import traced, tracer
+
+DEFAULT_TRACK = 'default'
+SUBTITLE_PREFIX = 'subtitle'
+SUBTITLE_EXTENSION = '.txt'
+
+
+# Function to map a subtitle file name to its track name
+def track_name(file_name: str) -> Optional[str]:
+    """Return the track of a subtitle file: subtitle.txt is the default track, subtitle.<track>.txt any other.
+
+    Args:
+        file_name (str): name of a file in a scene folder
+
+    Returns:
+        Optional[str]: the track name, None if the file is not a subtitle
+    """
+    if file_name == SUBTITLE_PREFIX + SUBTITLE_EXTENSION:
+        return DEFAULT_TRACK
+    if file_name.startswith(SUBTITLE_PREFIX + '.') and file_name.endswith(SUBTITLE_EXTENSION):
+        return file_name[len(SUBTITLE_PREFIX) + 1:-len(SUBTITLE_EXTENSION)] or None
+    return None
+
+
+class SubtitleStore:
+    """Subtitles of every scene, loaded once at startup.
+
+    When the asset bundle is available, subtitles are kept as slices of its memory
+    mapping and decoded on first use. Otherwise every subtitle file is read once when
+    the store is created. A scene can have several tracks, such as languages or timed
+    cues, stored as subtitle.<track>.txt next to the default subtitle.txt.
+    """
+
+    def __init__(self, scenes: SceneRegistry, bundle: Optional[AssetBundle] = None, lazy: bool = False):
+        self._tracks: Dict[str, Dict[str, Union[str, memoryview]]] = {}
+        self._scenes = scenes
+        self._bundle = bundle
+        self._lazy = lazy # Subtitles are loaded per scene on first use, for sharded stories too large to scan
+        if lazy:
+            return
+        if bundle:
+            self._load_from_bundle(scenes, bundle)
+        else:
+            self._load_from_files(scenes)
+
+    def _load_from_bundle(self, scenes: SceneRegistry, bundle: AssetBundle) -> None:
+        """Index the subtitle slices of the bundle."""
+        for scene_id, file_name in bundle.names():
+            track = track_name(file_name)
+            spec = scenes.get(scene_id)
+            if track and spec and spec.has_text:
+                self._tracks.setdefault(scene_id, {})[track] = bundle.get(scene_id, file_name)
+
+    def _load_from_files(self, scenes: Iterable[SceneSpec]) -> None:
+        """Read the subtitle files of every scene that has text."""
+        for spec in scenes:
+            if not spec.has_text:
+                continue
+            try:
+                file_names = os.listdir(os.path.dirname(asset_path(spec.scene_id, SUBTITLE_PREFIX)))
+            except FileNotFoundError: # Reported by the scene graph validation
+                continue
+            for file_name in file_names:
+                track = track_name(file_name)
+                if track:
+                    path = asset_path(spec.scene_id, file_name)
+                    with tracer.span('read_file', path=path), open(path, 'r', encoding='utf-8') as file:
+                        self._tracks.setdefault(spec.scene_id, {})[track] = file.read()
+
+    @traced('SubtitleStore.load_scene')
+    def _load_scene(self, scene_id: str) -> Dict[str, Union[str, memoryview]]:
+        """Load the subtitles of one scene, from the bundle when it packs them or from the files."""
+        spec = self._scenes.get(scene_id)
+        tracks = self._tracks[scene_id] = {}
+        if spec is None or not spec.has_text:
+            return tracks
+        packed = self._bundle.get(scene_id, SUBTITLE_PREFIX + SUBTITLE_EXTENSION) if self._bundle else None
+        if packed is not None: # Only the default track is looked up, listing the bundle is what lazy loading avoids
+            tracks[DEFAULT_TRACK] = packed
+        else:
+            self._load_from_files([spec])
+        return self._tracks[scene_id]
+
+    # Method to read the subtitles of edited scenes again, used by the hot reload
+    def reload(self, specs: Iterable[SceneSpec]) -> None:
+        """Replace the subtitles of the given scenes with the content of their files.
+
+        Args:
+            specs (Iterable[SceneSpec]): current specs of the scenes whose subtitles changed
+        """
+        specs = list(specs)
+        for spec in specs:
+            self._tracks.pop(spec.scene_id, None)
+        self._load_from_files(specs)
+
+    def get(self, scene_id: str, track: str = DEFAULTS['SUBTITLE_TRACK']) -> Optional[str]:
+        """Return the subtitle of a scene, falling back to the default track.
+
+        Args:
+            scene_id (str): scene id
+            track (str): subtitle track, such as a language
+
+        Returns:
+            Optional[str]: the subtitle text, None if the scene has none
+        """
+        tracks = self._tracks.get(scene_id)
+        if tracks is None and self._lazy:
+            tracks = self._load_scene(scene_id)
+        if not tracks:
+            return None
+        if track not in tracks:
+            track = DEFAULT_TRACK
+        text = tracks.get(track)
+        if isinstance(text, memoryview): # Decoding packed subtitles once, on first use
+            text = tracks[track] = str(text, 'utf-8')
+        return text
+
+    def tracks(self, scene_id: str) -> List[str]:
+        """Return the subtitle tracks available for a scene.
+
+        Args:
+            scene_id (str): scene id
+
+        Returns:
+            List[str]: track names
+        """
+        return sorted(self._tracks.get(scene_id, ()))
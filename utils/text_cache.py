@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from configs.constants import DEFAULTS
+
+
+class TextTextureCache:
+    """Least recently used cache of rendered text, bounded by the pixel bytes of its textures.
+
+    Entries are rendered Kivy core labels, with their texture and is_shortened. Text
+    still shown by a label stays alive after being evicted, the cache only stops
+    handing it out. Used on the UI thread only.
+    """
+
+    def __init__(self, byte_budget: int = DEFAULTS['TEXT_CACHE_BYTES']):
+        self.byte_budget = byte_budget
+        self.used_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict() # key -> rendered text, bytes
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the text rendered for a key, None on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key: Hashable, rendered: Any) -> None:
+        """Cache rendered text, evicting the least recently used entries over the budget.
+
+        Args:
+            key (Hashable): the text and every font property it was rendered with
+            rendered (Any): the Kivy core label that rendered it, with its texture
+        """
+        size = int(rendered.texture.width * rendered.texture.height * 4)
+        if size > self.byte_budget:
+            return
+        old = self._entries.pop(key, None)
+        if old:
+            self.used_bytes -= old[1]
+        self._entries[key] = (rendered, size)
+        self.used_bytes += size
+        while self.used_bytes > self.byte_budget:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.used_bytes -= evicted
+
+    def clear(self) -> None:
+        """Drop every cached text."""
+        self._entries.clear()
+        self.used_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return the cache counters.
+
+        Returns:
+            Dict[str, int]: entries, used bytes, budget, hits and misses
+        """
+        return {
+            'entries': len(self._entries),
+            'used_bytes': self.used_bytes,
+            'byte_budget': self.byte_budget,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+# Function to turn a property value into a hashable part of a cache key
+def _freeze(value: Any) -> Hashable:
+    """Return lists as tuples and dicts as sorted item tuples, other values as they are."""
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Function to build the key of the texture a label renders
+def text_key(label: Any) -> Tuple:
+    """Return the text of a label with every property its texture depends on.
+
+    Kivy lists these properties in Label._font_properties, the ones that trigger a new
+    render when changed: the text, font, size, color, alignment, padding and the
+    text_size that sets the wrap width. The KivyMD font_style is added for readability.
+
+    Args:
+        label (Any): a Kivy or KivyMD label
+
+    Returns:
+        Tuple: the cache key
+    """
+    return (getattr(label, 'font_style', None), label.disabled) + tuple(
+        _freeze(getattr(label, name)) for name in label._font_properties
+    )
@@ -0,0 +1,171 @@
+import heapq
+import itertools
+from typing import Any, Callable, List, Optional, Tuple
+
+
+class KivyClock:
+    """Timeline clock backed by the Kivy Clock."""
+
+    def __init__(self):
+        from kivy.clock import Clock # Imported here so timelines can run headless on a ManualClock
+        self._clock = Clock
+
+    def now(self) -> float:
+        """Return the current time in seconds."""
+        return self._clock.get_boottime()
+
+    def call_later(self, delay: float, callback: Callable[[float], None]) -> Any:
+        """Call callback after delay seconds. The returned handle has a cancel method."""
+        return self._clock.schedule_once(callback, delay)
+
+
+class _ManualHandle:
+    """Handle of a callback scheduled on a ManualClock."""
+
+    __slots__ = ('cancelled',)
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+
+class ManualClock:
+    """Virtual clock that only moves when advanced, for tests, benchmarks and replays."""
+
+    def __init__(self, start: float = 0.0):
+        self.time = start
+        self._queue: List[Tuple[float, int, _ManualHandle, Callable[[float], None]]] = []
+        self._order = itertools.count()
+
+    def now(self) -> float:
+        """Return the current virtual time in seconds."""
+        return self.time
+
+    def call_later(self, delay: float, callback: Callable[[float], None]) -> _ManualHandle:
+        """Call callback once the clock is advanced past delay seconds from now."""
+        handle = _ManualHandle()
+        heapq.heappush(self._queue, (self.time + max(delay, 0.0), next(self._order), handle, callback))
+        return handle
+
+    def next_due(self) -> Optional[float]:
+        """Return the time of the next pending callback, None when nothing is pending."""
+        while self._queue and self._queue[0][2].cancelled:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def advance(self, seconds: float) -> None:
+        """Move the clock forward, running the due callbacks in time order.
+
+        Args:
+            seconds (float): time to move forward
+        """
+        end = self.time + seconds
+        while True:
+            due = self.next_due()
+            if due is None or due > end:
+                break
+            _, _, handle, callback = heapq.heappop(self._queue)
+            elapsed = due - self.time
+            self.time = due
+            callback(elapsed)
+        self.time = end
+
+
+class Timeline:
+    """Timed events of a scene kept in a single priority queue.
+
+    Only the earliest event is registered with the clock, so a scene holds one clock
+    entry at most, and cancel_all drops every pending event at once.
+    """
+
+    def __init__(self, clock: Optional[Any] = None):
+        self.clock = clock if clock is not None else KivyClock()
+        self._events: List[Tuple[float, int, str, Callable[[float], None], Optional[float]]] = []
+        self._order = itertools.count()
+        self._handle = None
+        self._armed_at: Optional[float] = None
+        self._names = set()
+
+    def schedule(self, name: str, delay: float, callback: Callable[[float], None]) -> None:
+        """Run callback once after delay seconds, replacing any pending event with the same name.
+
+        Args:
+            name (str): event name, such as 'audio_start' or 'fallback'
+            delay (float): seconds from now
+            callback (Callable[[float], None]): called with how many seconds late the event runs
+        """
+        self._push(name, delay, callback, None)
+
+    def schedule_interval(self, name: str, interval: float, callback: Callable[[float], None]) -> None:
+        """Run callback every interval seconds until the event is cancelled.
+
+        Args:
+            name (str): event name, such as 'countdown'
+            interval (float): seconds between calls
+            callback (Callable[[float], None]): called with how many seconds late each call runs
+        """
+        self._push(name, interval, callback, interval)
+
+    def cancel(self, name: str) -> None:
+        """Cancel the pending event with the given name."""
+        if name in self._names:
+            self._names.discard(name)
+            self._events = [event for event in self._events if event[2] != name]
+            heapq.heapify(self._events)
+            self._arm()
+
+    def cancel_all(self) -> None:
+        """Cancel every pending event and the clock entry of the timeline."""
+        self._events = []
+        self._names.clear()
+        self._disarm()
+
+    def pending(self) -> List[str]:
+        """Return the names of the pending events in due order."""
+        return [event[2] for event in sorted(self._events)]
+
+    def _push(self, name: str, delay: float, callback: Callable[[float], None], interval: Optional[float]) -> None:
+        """Add an event to the queue and re-arm the clock if it is now the earliest."""
+        if name in self._names:
+            self._events = [event for event in self._events if event[2] != name]
+            heapq.heapify(self._events)
+        self._names.add(name)
+        heapq.heappush(self._events, (self.clock.now() + delay, next(self._order), name, callback, interval))
+        self._arm()
+
+    def _arm(self) -> None:
+        """Register the earliest pending event with the clock."""
+        if not self._events:
+            self._disarm()
+            return
+        due = self._events[0][0]
+        if self._handle is not None and self._armed_at == due:
+            return
+        self._disarm()
+        self._armed_at = due
+        self._handle = self.clock.call_later(max(due - self.clock.now(), 0.0), self._run)
+
+    def _disarm(self) -> None:
+        """Cancel the clock entry of the timeline."""
+        if self._handle is not None:
+            self._handle.cancel()
+        self._handle = None
+        self._armed_at = None
+
+    def _run(self, _) -> None:
+        """Run every due event, then re-arm the clock for the next one."""
+        self._handle = None
+        self._armed_at = None
+        now = self.clock.now()
+        while self._events and self._events[0][0] <= now + 1e-6:
+            due, _, name, callback, interval = heapq.heappop(self._events)
+            if interval is not None: # Repeating events are queued again before running, so they can cancel themselves
+                heapq.heappush(self._events, (due + interval, next(self._order), name, callback, interval))
+            else:
+                self._names.discard(name)
+            callback(now - due)
+            if self._handle is not None: # The callback scheduled something that already re-armed the clock
+                return
+        self._arm()
@@ -0,0 +1,258 @@
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+TRACE_FLAG = '--trace' # Enables tracing, as --trace or --trace=<path>
+TRACE_ENV = 'STARLIGHT_TRACE' # Enables tracing without the flag, its value is the trace path
+DEFAULT_TRACE_PATH = 'trace.json'
+FRAMES_TRACK = 'frames' # Name of the trace track showing the Kivy Clock frames
+
+
+class _NullSpan:
+    """Span returned while tracing is disabled, entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    """Span timing the block of a with statement."""
+
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer: 'Tracer', name: str, args: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+
+class Tracer:
+    """Opt-in recorder of timed spans, exported as a Chrome or Perfetto trace.
+
+    Functions decorated with traced are only wrapped when tracing is enabled at import
+    time, so a disabled tracer adds no call at all to them, and span() returns a shared
+    no-op context manager. Every span is also kept by name to summarize its durations.
+    """
+
+    def __init__(self, enabled: bool = False, path: str = DEFAULT_TRACE_PATH, max_events: int = 1_000_000):
+        self.enabled = enabled
+        self.path = path
+        self.max_events = max_events
+        self.dropped = 0
+        self.events: List[Tuple[str, int, int, int, Optional[Dict[str, Any]]]] = [] # name, start ns, end ns, thread, args
+        self.durations: Dict[str, List[int]] = {}
+        self._origin = time.perf_counter_ns()
+        self._threads: Dict[int, str] = {}
+        self._last_frame: Optional[int] = None
+        self._frame_event = None
+
+    def configure(self, argv: List[str]) -> None:
+        """Enable tracing from the --trace flag or the STARLIGHT_TRACE variable. The flag is removed so Kivy does not parse it.
+
+        Must run before the traced modules are imported, as their functions are wrapped when they are defined.
+
+        Args:
+            argv (List[str]): command line arguments, usually sys.argv
+        """
+        for argument in list(argv):
+            if argument == TRACE_FLAG or argument.startswith(TRACE_FLAG + '='):
+                argv.remove(argument)
+                self.enabled = True
+                self.path = argument.partition('=')[2] or self.path
+        if os.environ.get(TRACE_ENV):
+            self.enabled = True
+            self.path = os.environ[TRACE_ENV]
+
+    def span(self, name: str, **args: Any) -> Any:
+        """Return a context manager timing its block as a span.
+
+        Args:
+            name (str): span name, such as 'Screen.add_widget'
+            args (Any): values shown with the span in the trace viewer
+
+        Returns:
+            Any: the span, or NULL_SPAN when tracing is disabled
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, args)
+
+    def record(self, name: str, start: int, end: int, args: Optional[Dict[str, Any]] = None) -> None:
+        """Record a finished span. Safe to call from any thread.
+
+        Args:
+            name (str): span name
+            start (int): perf_counter_ns when the span started
+            end (int): perf_counter_ns when the span ended
+            args (Optional[Dict[str, Any]]): values shown with the span
+        """
+        if len(self.events) >= self.max_events: # Bounding the memory of long traced sessions
+            self.dropped += 1
+            return
+        thread = threading.get_ident()
+        if thread not in self._threads:
+            self._threads[thread] = threading.current_thread().name
+        self.events.append((name, start, end, thread, args or None)) # list.append is atomic, no lock is needed
+        durations = self.durations.get(name)
+        if durations is None:
+            durations = self.durations.setdefault(name, [])
+        durations.append(end - start)
+
+    # Method to record the frames of the Kivy Clock as spans of their own track
+    def start_frames(self) -> None:
+        """Record the time between Kivy Clock frames while tracing is enabled."""
+        if not self.enabled or self._frame_event is not None:
+            return
+        from kivy.clock import Clock # Imported here so traces can be recorded headless
+
+        self._frame_event = Clock.schedule_interval(self._on_frame, 0)
+
+    def _on_frame(self, _) -> None:
+        """Record the frame that just ended."""
+        now = time.perf_counter_ns()
+        if self._last_frame is not None:
+            self.record('frame', self._last_frame, now, {'track': FRAMES_TRACK})
+        self._last_frame = now
+
+    def stop_frames(self) -> None:
+        """Stop recording frames."""
+        if self._frame_event is not None:
+            self._frame_event.cancel()
+            self._frame_event = None
+            self._last_frame = None
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        """Return the recorded spans in the Chrome trace event format, which Perfetto also opens.
+
+        Returns:
+            Dict[str, Any]: the trace document
+        """
+        pid = os.getpid()
+        tids = {thread: i + 1 for i, thread in enumerate(self._threads)}
+        frames_tid = len(tids) + 1
+        trace_events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'tid': 0, 'args': {'name': 'game'}}]
+        trace_events.extend(
+            {'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tids[thread], 'args': {'name': name}}
+            for thread, name in self._threads.items()
+        )
+        trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': frames_tid, 'args': {'name': FRAMES_TRACK}})
+        for name, start, end, thread, args in self.events:
+            event = {
+                'name': name, 'ph': 'X', 'pid': pid,
+                'tid': frames_tid if args and args.get('track') == FRAMES_TRACK else tids[thread],
+                'ts': (start - self._origin) / 1000, 'dur': (end - start) / 1000, # Microseconds
+            }
+            if args:
+                event['args'] = {key: str(value) for key, value in args.items()}
+            trace_events.append(event)
+        return {'traceEvents': trace_events, 'displayTimeUnit': 'ms'}
+
+    def export(self, path: Optional[str] = None) -> str:
+        """Write the Chrome trace json, to open in chrome://tracing or ui.perfetto.dev.
+
+        Args:
+            path (Optional[str]): output path, the configured trace path by default
+
+        Returns:
+            str: the path written
+        """
+        path = path or self.path
+        with open(path, 'w') as file:
+            json.dump(self.chrome_trace(), file)
+        return path
+
+    def summary(self) -> Dict[str, Dict[str, Any]]:
+        """Return the duration statistics and histogram of every span name.
+
+        The histogram counts spans in power of two microsecond buckets: bucket k holds
+        the spans that took less than 2**k microseconds and at least half of that.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: count, total, mean, p50, p90, p99 and max in milliseconds, and the histogram
+        """
+        result = {}
+        for name, durations in self.durations.items():
+            ordered = sorted(durations)
+            count = len(ordered)
+            histogram: Dict[int, int] = {}
+            for duration in ordered:
+                bucket = (duration // 1000).bit_length()
+                histogram[bucket] = histogram.get(bucket, 0) + 1
+            result[name] = {
+                'count': count,
+                'total_ms': sum(ordered) / 1e6,
+                'mean_ms': sum(ordered) / count / 1e6,
+                'p50_ms': ordered[int(0.50 * (count - 1))] / 1e6,
+                'p90_ms': ordered[int(0.90 * (count - 1))] / 1e6,
+                'p99_ms': ordered[int(0.99 * (count - 1))] / 1e6,
+                'max_ms': ordered[-1] / 1e6,
+                'histogram_us': {f'<{1 << bucket}': histogram[bucket] for bucket in sorted(histogram)},
+            }
+        return result
+
+    def format_summary(self) -> str:
+        """Return the summary as a table, slowest total first."""
+        lines = [f"{'span':<36} {'count':>7} {'total ms':>10} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}"]
+        for name, stats in sorted(self.summary().items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{name:<36} {stats['count']:>7} {stats['total_ms']:>10.2f} {stats['p50_ms']:>9.3f} "
+                         f"{stats['p99_ms']:>9.3f} {stats['max_ms']:>9.3f}")
+        if self.dropped:
+            lines.append(f"{self.dropped} spans were dropped after the first {self.max_events}")
+        return '\n'.join(lines)
+
+    def clear(self) -> None:
+        """Forget every recorded span."""
+        self.events = []
+        self.durations = {}
+        self.dropped = 0
+
+
+tracer = Tracer(bool(os.environ.get(TRACE_ENV)), os.environ.get(TRACE_ENV) or DEFAULT_TRACE_PATH)
+
+
+# Function to trace every call of a function as a span
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorate a function so each call is recorded as a span.
+
+    When tracing is disabled as the function is defined, the function is returned as is.
+
+    Args:
+        name (Optional[str]): span name, the qualified function name by default
+
+    Returns:
+        Callable[[Callable], Callable]: the decorator
+    """
+    def decorate(function: Callable) -> Callable:
+        if not tracer.enabled:
+            return function
+        span_name = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter_ns()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                tracer.record(span_name, start, time.perf_counter_ns())
+        return wrapper
+    return decorate
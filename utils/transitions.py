@@ -0,0 +1,218 @@
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from configs.constants import DEFAULTS
+from utils.media import acquire_image
+from utils.prefetcher import PrefetchedAssets
+from utils.scene_spec import SceneSpec
+from utils.timeline import KivyClock
+from utils.tracing import tracer
+
+
+class PendingTransition:
+    """A requested scene switch and the assets loaded for it so far."""
+
+    def __init__(self, scene_id: str, source_id: Optional[str], user: bool, choice_index: Optional[int]):
+        self.scene_id = scene_id
+        self.source_id = source_id # Scene shown when the switch was requested, the switch is dropped once it is left
+        self.user = user
+        self.choice_index = choice_index # Position of the pressed button, recorded for replays
+        self.spec: Optional[SceneSpec] = None
+        self.image = None
+        self.sound = None
+        self.keys: List[str] = [] # Asset store references, handed over to the scene or released when dropped
+
+
+class TransitionController:
+    """Switches scenes in two phases spread over frames, so a switch never runs inside a touch event.
+
+    A request only records the target. The next scene is then prepared a step at a time
+    on the following frames, looking up its spec, loading its image, audio and subtitle,
+    with as many steps per frame as fit in the frame budget. The pooled scene is then
+    rebound to it in a single step, so the old scene stays on screen, untouched, until
+    the new one is complete.
+
+    Requests arriving before the swap are coalesced: the latest target replaces the
+    pending one and a repeated target is ignored, so a double tap builds one scene. A
+    choice of the player is never replaced by an automatic one, such as the auto-advance
+    at the end of the audio of the leaving scene.
+    """
+
+    def __init__(self, app: Any, clock: Optional[Any] = None,
+                 frame_budget_ms: float = DEFAULTS['TRANSITION_FRAME_MS']):
+        """Set up the transitions of an app.
+
+        Args:
+            app (Any): the game App, whose switch_to_scene performs the swap
+            clock (Optional[Any]): timeline clock the steps are run on, one step frame per call_later(0)
+            frame_budget_ms (float): milliseconds of transition work run per frame
+        """
+        self.app = app
+        self.clock = clock if clock is not None else KivyClock()
+        self.frame_budget = frame_budget_ms / 1000
+        self.pending: Optional[PendingTransition] = None
+        self._steps: List[Tuple[str, Callable[[PendingTransition], None]]] = []
+        self._handle = None
+        self._estimates: Dict[str, float] = {} # Recent duration of every step, to leave steps that do not fit to the next frame
+        self.requests = 0
+        self.coalesced = 0
+        self.swaps = 0
+        self.frames = 0
+        self.max_frame_ms = 0.0
+
+    @property
+    def busy(self) -> bool:
+        """Whether a switch is being prepared."""
+        return self.pending is not None
+
+    def request(self, scene_id: str, user: bool = True, choice_index: Optional[int] = None) -> bool:
+        """Ask for a switch to a scene, coalesced with the switch already pending.
+
+        Args:
+            scene_id (str): scene to show
+            user (bool): True for a choice of the player, False for timers such as the auto-advance
+            choice_index (Optional[int]): position of the pressed button, recorded for replays
+
+        Returns:
+            bool: True when a new switch was started, False when the request was merged into the pending one
+        """
+        self.requests += 1
+        pending = self.pending
+        if pending is not None:
+            if pending.scene_id == scene_id or (pending.user and not user):
+                self.coalesced += 1 # A second tap, or a timer firing after the player already chose
+                return False
+            self.coalesced += 1
+            self.drop()
+        self.pending = PendingTransition(scene_id, self.app.current_scene_id, user, choice_index)
+        self._steps = [
+            ('look_up', self._look_up),
+            ('load_image', self._load_image),
+            ('load_audio', self._load_audio),
+            ('load_subtitle', self._load_subtitle),
+            ('swap', self._swap),
+        ]
+        self._arm()
+        return True
+
+    def drop(self) -> None:
+        """Drop the pending switch, releasing the assets loaded for it."""
+        pending = self.pending
+        self.pending = None
+        self._steps = []
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if pending is not None:
+            for key in pending.keys:
+                self.app.asset_store.release(key)
+
+    def invalidate(self, scene_ids: Iterable[str]) -> None:
+        """Prepare the pending switch again when its scene was edited, used by the hot reload.
+
+        Args:
+            scene_ids (Iterable[str]): edited scenes
+        """
+        pending = self.pending
+        if pending is not None and pending.scene_id in set(scene_ids):
+            self.drop()
+            self.request(pending.scene_id, pending.user, pending.choice_index)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the transition counters.
+
+        Returns:
+            Dict[str, Any]: requests, coalesced requests, swaps, step frames and the longest step frame
+        """
+        return {
+            'requests': self.requests,
+            'coalesced': self.coalesced,
+            'swaps': self.swaps,
+            'frames': self.frames,
+            'max_frame_ms': self.max_frame_ms,
+        }
+
+    def _arm(self) -> None:
+        """Run the next steps on the next frame."""
+        if self._handle is None:
+            self._handle = self.clock.call_later(0, self._run_frame)
+
+    def _run_frame(self, _) -> None:
+        """Run steps until the next one would not fit in the frame budget, at least one per frame."""
+        self._handle = None
+        start = time.perf_counter()
+        ran = 0
+        while self._steps and self.pending is not None:
+            name, step = self._steps[0]
+            elapsed = time.perf_counter() - start
+            if ran and elapsed + self._estimates.get(name, 0.0) > self.frame_budget:
+                break
+            self._steps.pop(0)
+            pending = self.pending
+            step_start = time.perf_counter()
+            with tracer.span(f'Transition.{name}', scene_id=pending.scene_id):
+                step(pending)
+            duration = time.perf_counter() - step_start
+            self._estimates[name] = duration if name not in self._estimates else 0.7 * self._estimates[name] + 0.3 * duration
+            ran += 1
+        self.frames += 1
+        self.max_frame_ms = max(self.max_frame_ms, (time.perf_counter() - start) * 1000)
+        if self._steps and self.pending is not None:
+            self._arm()
+
+    def _look_up(self, pending: PendingTransition) -> None:
+        """Find the spec of the target and take the assets the prefetcher loaded for it."""
+        app = self.app
+        spec = app.scenes.get(pending.scene_id)
+        if spec is None and not app.booted: # Chosen before the boot thread loaded the rest of the story
+            app.finish_boot()
+            spec = app.scenes.get(pending.scene_id)
+        if spec is None:
+            self.drop()
+            return
+        pending.spec = spec
+        prefetched = app.prefetcher.take(pending.scene_id)
+        if prefetched is not None:
+            pending.image, pending.sound = prefetched.image, prefetched.sound
+            pending.keys.extend(prefetched.keys)
+
+    def _load_image(self, pending: PendingTransition) -> None:
+        """Decode the image of the target when the prefetcher had not, videos are opened by the scene."""
+        spec = pending.spec
+        if pending.image is not None or spec.media_type == 'video':
+            return
+        try:
+            key, pending.image = acquire_image(self.app.asset_store, spec.scene_id, spec.media_source, self.app.image_lod)
+            pending.keys.insert(0, key) # The scene expects the image key first, as the prefetcher orders them
+        except Exception as e: # The scene reports it again and falls back to the file source
+            print(f"Error preparing image for {spec.scene_id}: {e}")
+
+    def _load_audio(self, pending: PendingTransition) -> None:
+        """Load the audio of the target when the prefetcher had not."""
+        spec = pending.spec
+        if pending.sound is not None or not spec.audio_source:
+            return
+        try:
+            key, pending.sound = self.app.acquire_audio(self.app.asset_store, spec.scene_id, spec.audio_source)
+            pending.keys.append(key)
+        except Exception as e: # OSError from SoundLoader, decoding errors from the audio engine
+            print(f"Error preparing audio for {spec.scene_id}: {e}")
+
+    def _load_subtitle(self, pending: PendingTransition) -> None:
+        """Read the subtitle of the target, which the subtitle store keeps for the scene to show."""
+        if pending.spec.has_text:
+            self.app.subtitles.get(pending.scene_id)
+
+    def _swap(self, pending: PendingTransition) -> None:
+        """Rebind the pooled scene to the prepared one, unless the scene it was requested from was left meanwhile."""
+        app = self.app
+        self.pending = None
+        if app.current_scene_id != pending.source_id: # Switched without the controller, such as by the hot reload
+            for key in pending.keys:
+                app.asset_store.release(key)
+            return
+        if app.recorder and pending.choice_index is not None: # Recording the choice that won, for replays
+            app.recorder.choice(pending.source_id, pending.choice_index, pending.scene_id)
+        # Passed even when empty, so switch_to_scene does not ask the prefetcher again and count a second miss
+        app.switch_to_scene(pending.scene_id, PrefetchedAssets(pending.image, pending.sound, tuple(pending.keys)))
+        self.swaps += 1
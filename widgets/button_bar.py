@@ -1,60 +1,144 @@
-from typing import List, Dict, Union
+from typing import Sequence
 from kivymd.app import MDApp
+from kivy.lang import Builder
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.anchorlayout import AnchorLayout
-from kivymd.uix.button import MDFillRoundFlatButton
+from kivymd.uix.button.button import BaseButton
+
+from utils.scene_spec import ButtonSpec
+from widgets.cached_label import CachedLabel # noqa: F401, used by the ChoiceButton rule
+
+# The ButtonContentsText rule of KivyMD, with a CachedLabel for the text. Choices are plain text, without markup
+Builder.load_string('''
+<ChoiceButton>
+    lbl_txt: lbl_txt
+    width:
+        max(root._min_width, \\
+        root.padding[0] + lbl_txt.texture_size[0] + root.padding[2])
+    size_hint_min_x:
+        max(root._min_width, \\
+        root.padding[0] + lbl_txt.texture_size[0] + root.padding[2])
+    height:
+        max(root._min_height, \\
+        root.padding[1] + lbl_txt.texture_size[1] + root.padding[3])
+    size_hint_min_y:
+        max(root._min_height, \\
+        root.padding[1] + lbl_txt.texture_size[1] + root.padding[3])
+
+    CachedLabel:
+        id: lbl_txt
+        text: root.text
+        font_size: root.font_size
+        font_style: root.font_style
+        halign: 'center'
+        valign: 'middle'
+        adaptive_size: True
+        -text_size: None, None
+        theme_text_color: root._theme_text_color
+        text_color: root._text_color
+        disabled: root.disabled
+        opposite_colors: root.opposite_colors
+        font_name: root.font_name if root.font_name else self.font_name
+''')
+
+
+class ChoiceButton(BaseButton):
+    """Filled round choice button, like MDFillRoundFlatButton, whose label reuses the textures of text shown before
+
+    Args:
+        BaseButton (_type_): Inherits the KivyMD BaseButton class
+    """
+
+    _default_md_bg_color = None
+    _default_md_bg_color_disabled = None
+    _default_theme_text_color = "Custom"
+    _default_text_color = "PrimaryHue"
+
+    def __init__(self, **kwargs):
+        super(ChoiceButton, self).__init__(**kwargs)
+        self.rounded_button = True
 
 
 class ButtonBar(AnchorLayout):
     """Custom button bar widget. Renders the list of buttons horizontally
 
     Args:
-        AnchorLayout (_type_): Inherits AnchorLayout for positioning the buttons 
+        AnchorLayout (_type_): Inherits AnchorLayout for positioning the buttons
     """
 
-    def __init__(self, buttons: List[Dict[str, Union[str, int]]], app: MDApp, **kwargs):
+    def __init__(self, buttons: Sequence[ButtonSpec], app: MDApp, **kwargs):
         """
         Initialize a ButtonBar object.
 
         Parameters:
-        - buttons: List of dictionaries containing button information.
+        - buttons: Sequence of ButtonSpec entries containing button information.
         - app: Reference to the main application.
         - **kwargs: Additional keyword arguments.
 
         """
         super(ButtonBar, self).__init__(**kwargs)# Call the constructor of the parent class (BoxLayout).
+        self.app = app
+        self.buttons = [] # Pool of buttons, kept alive and relabelled when the bar shows another scene
         if app:# Check if the app reference is provided.
             # Create a horizontal BoxLayout with specified properties.
-            box_layout = BoxLayout(
+            self.box_layout = BoxLayout(
                 orientation='horizontal',  # Set the orientation to horizontal.
                 spacing=30,  # Set the spacing between widgets.
                 size_hint=(None, None),  # Allow explicit control over size.
                 height=150  # Set the height of the BoxLayout.
             )
 
+            self.set_buttons(buttons)
+
+            self.box_layout.bind(minimum_width=self.box_layout.setter('width'))# Bind the minimum width of the box_layout to the width property.
+            self.pos_hint = {'center_y': 0.18}# Set the position hint for the widget to be centered vertically at 18% of the total height.
+            self.add_widget(self.box_layout)# Add the box_layout widget as a child to the current widget.
+
+    # Method to show another set of choices
+    def set_buttons(self, buttons: Sequence[ButtonSpec]) -> None:
+        """
+        Relabel the pooled buttons with the given choices, growing the pool only when more buttons are needed.
+
+        Parameters:
+        - buttons: Sequence of ButtonSpec entries containing button information.
+
+        """
+        # Creating the missing buttons when this scene has more choices than any scene before
+        while len(self.buttons) < len(buttons):
+            self.buttons.append(self.create_button())
+
+        # Iterating through the button specs and rebinding the pooled buttons
+        for button, button_info in zip(self.buttons, buttons):
+            button.text = button_info.text  # Setting the text of the button
+            button.target_scene_id = button_info.target_scene_id  # Setting the scene shown when the button is pressed
+            if not button.parent:
+                self.box_layout.add_widget(button) # Adding the button to the BoxLayout
+
+        # Removing the spare buttons from the BoxLayout, they stay in the pool for later scenes
+        for button in self.buttons[len(buttons):]:
+            if button.parent:
+                self.box_layout.remove_widget(button)
+
+    # Method to create a pooled button
+    def create_button(self) -> ChoiceButton:
+        """Create a choice button. Its text and target scene are set by set_buttons."""
+        button = ChoiceButton(
+            # Create a button with the specified properties
+            on_press=self.on_button_press,  # Switching to the target scene set on the button
+            size_hint=(None, None),  # Allowing explicit control over the button size
+            height=50,  # Setting the height of the button
+            font_style='Subtitle1',  # Setting the font style of the button text
+            line_color=(0.01960784313, 0.85098039215, 0.90980392156, 1),  # Setting the color of the button border
+            line_width=1.1,  # Setting the width of the button border
+            md_bg_color=(1, 0.16470588235, 0.42745098039, 1),  # Setting the background color of the button
 
-            # Iterating through the list of button information dictionaries
-            for button_info in buttons:
-                button = MDFillRoundFlatButton(
-                    # Create a button with the specified properties
-                    text=button_info['text'],  # Setting the text of the button
-                    on_press=lambda _, button_info=button_info: app.switch_to_scene(button_info['target_scene_id']),  # Define on_press behavior using a lambda function to capture button_info
-                    size_hint=(None, None),  # Allowing explicit control over the button size
-                    height=50,  # Setting the height of the button
-                    font_style='Subtitle1',  # Setting the font style of the button text
-                    line_color=(0.01960784313, 0.85098039215, 0.90980392156, 1),  # Setting the color of the button border
-                    line_width=1.1,  # Setting the width of the button border
-                    md_bg_color=(1, 0.16470588235, 0.42745098039, 1),  # Setting the background color of the button
-
-                )
-                button.bind(width=lambda instance, value: setattr(instance, 'text_size', (value, None)))
-                box_layout.add_widget(button) # Adding the button to the BoxLayout
-
-            # box_layout.bind(minimum_width=box_layout.setter('width'))
-            # self.pos_hint = {'center_y': 0.18}
-            # self.add_widget(box_layout)
-                
-            box_layout.bind(minimum_width=box_layout.setter('width'))# Bind the minimum width of the box_layout to the width property.
-            self.pos_hint = {'center_y': 0.18}# Set the position hint for the widget to be centered vertically at 18% of the total height. 
-            self.add_widget(box_layout)# Add the box_layout widget as a child to the current widget.
+        )
+        button.target_scene_id = None
+        button.bind(width=lambda instance, value: setattr(instance, 'text_size', (value, None)))
+        return button
 
+    # Method to handle the press of a choice button
+    def on_button_press(self, button: ChoiceButton) -> None:
+        """Ask for the scene of the pressed button. The switch runs over the next frames, repeated taps are merged into it."""
+        if button.target_scene_id:
+            self.app.transitions.request(button.target_scene_id, choice_index=self.buttons.index(button))
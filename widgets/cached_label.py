@@ -0,0 +1,61 @@
+from typing import Any, Optional
+
+from kivy.core.text import Label as CoreLabel
+from kivymd.app import MDApp
+from kivymd.uix.label import MDLabel
+
+from utils.text_cache import text_key
+
+
+# Function to render the text of a label into a texture of its own
+def render_text(label: MDLabel) -> CoreLabel:
+    """Render the text of a label with a core label no widget renders with again.
+
+    The core label is built from the same properties Kivy builds the core label of a
+    Label from. The fill callback and reload observer it sets on its texture then
+    draw this text only, whatever text the label shows later.
+
+    Args:
+        label (MDLabel): the label whose text is rendered
+
+    Returns:
+        CoreLabel: the rendered core label, with its texture and is_shortened
+    """
+    options = {name: getattr(label, name) for name in label._font_properties}
+    options['usersize'] = label.text_size
+    if label.disabled:
+        options['color'] = label.disabled_color
+        options['outline_color'] = label.disabled_outline_color
+    core = CoreLabel(**options)
+    core.refresh()
+    return core
+
+
+class CachedLabel(MDLabel):
+    """MDLabel reusing the texture of a text it, or another CachedLabel, rendered before.
+
+    Textures are shared through the text_cache of the running app. Markup, which comes
+    with refs and anchors, and blank text are rendered by MDLabel every time.
+    """
+
+    def __init__(self, **kwargs):
+        self.rendered: Optional[CoreLabel] = None # Keeps the reload observer of the shown texture alive after eviction
+        super(CachedLabel, self).__init__(**kwargs)
+
+    # Method to show the cached texture of the label text, or render it and cache it
+    def texture_update(self, *args: Any) -> None:
+        """Show the texture of the label text, rendering it only when no CachedLabel rendered it before."""
+        cache = getattr(MDApp.get_running_app(), 'text_cache', None)
+        if cache is None or self.markup or not self.text.strip():
+            self.rendered = None
+            super(CachedLabel, self).texture_update(*args)
+            return
+        key = text_key(self)
+        rendered = cache.get(key)
+        if rendered is None:
+            rendered = render_text(self)
+            cache.put(key, rendered)
+        self.rendered = rendered
+        self.texture = rendered.texture
+        self.texture_size = list(rendered.texture.size)
+        self.is_shortened = rendered.is_shortened
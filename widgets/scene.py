@@ -1,22 +1,42 @@
-from typing import List, Optional, Dict, Tuple, Union
+from typing import Optional, Dict, Sequence, Tuple, Union
 from kivy.core.window import Window
 from kivy.uix.relativelayout import RelativeLayout
 from kivy.uix.image import Image
-from kivy.uix.video import Video
-from kivy.core.audio import SoundLoader
 from kivymd.uix.label import MDLabel
 from kivymd.app import MDApp
-from kivy.clock import Clock
 
 # Importing constants and helper functions
 from configs.constants import DEFAULTS
-from utils.helper import read_file
+from utils.helper import asset_path
 
 # Importing custom widgets
 from widgets.button_bar import ButtonBar
 from widgets.close_button import CloseButton
 from widgets.subtitle_label import SubtitleLabel
 
+from utils.audio_engine import Voice, repeat_cues
+from utils.image_lod import level_name
+from utils.media import acquire_image
+from utils.prefetcher import PrefetchedAssets
+from utils.scene_spec import ButtonSpec, SceneSpec
+from utils.timeline import Timeline
+from utils.tracing import traced
+
+# Function to import the Video widget on first use, as it pulls in the whole video provider stack
+def load_video_class():
+    """Return the video widget class, importing it when the first video scene is built.
+
+    The threaded ffpyplayer widget is used when ffpyplayer is installed, kivy's Video otherwise.
+    """
+    try:
+        import ffpyplayer # noqa: F401
+    except ImportError:
+        from kivy.uix.video import Video
+        return Video
+    from widgets.video_player import ThreadedVideo
+    return ThreadedVideo
+
+
 # Define a custom scene widget that inherits from RelativeLayout
 class Scene(RelativeLayout):
     """Custom scene widget. Creates a scene for the game.
@@ -26,41 +46,84 @@ class Scene(RelativeLayout):
     """
 
     def __init__(self, app: MDApp, scene_id: str, media_source: str, media_type: str, audio_source: Optional[str],
-                    button_config: Optional[List[Dict[str, Union[str, int]]]], text_style: Optional[Dict[str, Union[str, Tuple[float, float, float, float]]]],
+                    button_config: Optional[Sequence[ButtonSpec]], text_style: Optional[Dict[str, Union[str, Tuple[float, float, float, float]]]],
                     bg_color: Tuple[float, float, float, float] = DEFAULTS['BG_COLOR'], audio_repeat_count: int = DEFAULTS['AUDIO_REPEAT'],
-                    backoff_rate: int = DEFAULTS['BACKOFF_RATE'], has_text: bool = True, last_scene_id: str = None, **kwargs):
+                    backoff_rate: int = DEFAULTS['BACKOFF_RATE'], has_text: bool = True, last_scene_id: str = None,
+                    prefetched: Optional[PrefetchedAssets] = None, **kwargs):
          # Initialize the Scene object with the provided parameters and default values.
         super(Scene, self).__init__(**kwargs)
-    
-        # Store references to the application, scene ID, background color, media source, media type, audio source, etc.
+
+        # Store references to the application and the pooled widgets, created once by build and reused by every scene shown.
         self.app = app
+        self.media_player = None
+        self.image_player = None
+        self.video_player = None
+        self.subtitle_label = None
+        self.button_bar = None
+        self.timer_label = None
+        self.timeline = Timeline(app.timeline_clock) # Every timed event of the scene: audio start and repeat, fallback, countdown, auto-advance
+
+        self.assign(scene_id, media_source, media_type, audio_source, button_config, text_style, bg_color,
+                    audio_repeat_count, backoff_rate, has_text, last_scene_id, prefetched)
+
+        # Bind the redraw method to position and size changes.
+        self.bind(pos=self.redraw)
+        self.bind(size=self.redraw)
+
+    # Method to store the data of the scene to show and reset the playback state
+    def assign(self, scene_id: str, media_source: str, media_type: str, audio_source: Optional[str],
+                button_config: Optional[Sequence[ButtonSpec]], text_style: Optional[Dict[str, Union[str, Tuple[float, float, float, float]]]],
+                bg_color: Tuple[float, float, float, float], audio_repeat_count: int, backoff_rate: int, has_text: bool,
+                last_scene_id: Optional[str], prefetched: Optional[PrefetchedAssets]) -> None:
+        """Store the scene data and reset the state related to media playback, audio and timers."""
+        # Store the scene ID, background color, media source, media type, audio source, etc.
         self.scene_id = scene_id
         self.bg_color = bg_color
         self.media_source = media_source
         self.media_type = media_type
         self.audio_source = audio_source
         self.button_config = button_config
-        
+        self.prefetched = prefetched # Assets loaded ahead of time by the prefetcher, if any
+        self.asset_keys = list(prefetched.keys) if prefetched else [] # Asset store references released on exit
+        self.image_key = None # Asset store key of the image shown, swapped for another variant when the widget is resized
+
         # Set text style to the provided value or use the default text style.
         if text_style:
             self.text_style = text_style
         else:
             self.text_style = DEFAULTS['DEFAULT_TEXT_STYLE']
-        
-        # Initialize variables related to media playback, audio, scene state, etc.
-        self.media_player = None
+
+        # Initialize variables related to audio, scene state, etc.
         self.audio = None
+        self.voice = None # Playing voice of the audio engine, which replaces the Kivy sound when available
         self.audio_repeat_count = audio_repeat_count
         self.audio_play_count = 0
         self.scene_ended = False
         self.has_text = has_text
         self.backoff_rate = backoff_rate
         self.last_scene_id = last_scene_id
-        
-        # Set the default timer duration and bind the redraw method to position and size changes.
+
+        # Set the default timer duration.
         self.timer_duration = DEFAULTS['TIMER']
-        self.bind(pos=self.redraw)
-        self.bind(size=self.redraw)
+
+    # Method to show another scene by rebinding the pooled widgets
+    @traced('Scene.load_spec')
+    def load_spec(self, spec: SceneSpec, prefetched: Optional[PrefetchedAssets] = None) -> None:
+        """Rebind the scene widgets to another scene spec. on_exit must be called first.
+
+        Args:
+            spec (SceneSpec): the scene to show
+            prefetched (Optional[PrefetchedAssets]): assets loaded ahead of time, None on a prefetch miss
+        """
+        self.assign(spec.scene_id, spec.media_source, spec.media_type, spec.audio_source, spec.button_config,
+                    spec.text_style, spec.bg_color, spec.audio_repeat_count, spec.backoff_rate, spec.has_text,
+                    spec.last_scene_id, prefetched)
+        self.redraw()
+        self.build_media_player()
+        self.build_subtitle()
+        self.build_button_bar()
+        self.timer_label.text = ""
+        self.timeline.schedule('audio_start', 0, self.build_audio_player) # Starting the audio on the next frame, once the scene is drawn
 
 
     # Method to redraw the scene by setting the window clear color
@@ -70,6 +133,7 @@ class Scene(RelativeLayout):
             Window.clearcolor = self.bg_color
 
     # Method to build the scene
+    @traced('Scene.build')
     def build(self) -> None:
         """Build the scene."""
         self.build_media_player()
@@ -77,30 +141,90 @@ class Scene(RelativeLayout):
         self.build_button_bar()
         self.build_close_button()
         self.build_timer_label()
-        self.audio_player_scheduler = Clock.schedule_once(self.build_audio_player, 1)
+        self.timeline.schedule('audio_start', 0, self.build_audio_player) # Starting the audio on the next frame, once the scene is drawn
 
         return self
 
     # Method to build the media player widget based on media type
+    @traced('Scene.build_media_player')
     def build_media_player(self) -> None:
-        """Build the media player."""
-        media_path = f'assets/{self.scene_id}/{self.media_source}'
-        if self.media_type == 'video': # Creating a Video widget
-            self.media_player = Video(
-                source=media_path, state='play', options={'eos': 'loop', 'hide_controls': True}
-            )
-        elif self.media_type == 'image': # Creating an Image widget 
-            self.media_player = Image(source=media_path)
+        """Build the media player, reusing the image or video widget of a previous scene."""
+        media_path = asset_path(self.scene_id, self.media_source)
+        if self.media_type == 'video': # Creating the Video widget once, then swapping its source
+            if self.video_player is None:
+                Video = load_video_class()
+                self.video_player = Video(options={'eos': 'loop', 'hide_controls': True})
+            self.video_player.source = media_path
+            self.video_player.state = 'play'
+            player = self.video_player
+        else:
+            if self.image_player is None: # Creating the Image widget once, then swapping its texture
+                self.image_player = Image()
+                self.image_player.bind(size=self.on_image_size)
+            if self.prefetched and self.prefetched.image: # Using the prefetched texture
+                self.image_key = self.prefetched.keys[0]
+                self.show_texture(self.prefetched.image.texture)
+            else: # Using the shared decoded image, downscaled for the window
+                try:
+                    self.image_key, image = acquire_image(self.app.asset_store, self.scene_id, self.media_source, self.app.image_lod)
+                    self.asset_keys.append(self.image_key)
+                    self.show_texture(image.texture)
+                except Exception as e:
+                    print(f"Error loading image {media_path}: {e}")
+                    self.image_player.source = media_path
+            player = self.image_player
+
+        if self.media_player is not player:
+            if self.media_player is self.video_player and self.video_player is not None:
+                self.video_player.unload() # Releasing the video stream while images are shown
+            if self.media_player is not None:
+                self.remove_widget(self.media_player)
+            self.add_widget(player, index=len(self.children)) # Adding the media player widget below the other widgets
+            self.media_player = player
+
+    # Method to show a texture in the pooled image widget
+    def show_texture(self, texture) -> None:
+        """Show a texture in the image widget, clearing any file source it had."""
+        self.image_player.source = ''
+        self.image_player.texture = texture
 
-        self.add_widget(self.media_player) # Adding the media player widget to the scene
+    # Method to handle size changes of the image widget
+    def on_image_size(self, _, size) -> None:
+        """Reload the image at the resolution of the new size, once the window stopped being resized."""
+        if self.media_player is self.image_player and self.image_key and self.app.image_lod and not self.scene_ended:
+            self.timeline.schedule('image_lod', 0.2, self.refresh_image)
+
+    # Method to swap the shown image for the variant matching the widget size
+    @traced('Scene.refresh_image')
+    def refresh_image(self, _) -> None:
+        """Show the smallest image variant covering the image widget, if it is not the one shown."""
+        level = self.app.image_lod.level_for(self.image_player.size)
+        if self.image_key.partition('@')[2] == (level_name(level) if level else ''):
+            return
+        try:
+            key, image = acquire_image(self.app.asset_store, self.scene_id, self.media_source, self.app.image_lod,
+                                       self.image_player.size)
+        except Exception as e:
+            print(f"Error loading image {asset_path(self.scene_id, self.media_source)}: {e}")
+            return
+        self.asset_keys.remove(self.image_key)
+        self.app.asset_store.release(self.image_key)
+        self.asset_keys.append(key)
+        self.image_key = key
+        self.show_texture(image.texture)
 
     # Method to build the subtitle label
+    @traced('Scene.build_subtitle')
     def build_subtitle(self) -> None:
-        """Build the label."""
-        if self.has_text:
-            subtitle_path = f'assets/{self.scene_id}/subtitle.txt' # Read subtitle text from a file
-            subtitle = read_file(subtitle_path)
-            label = SubtitleLabel(  # Creating a SubtitleLabel widget with specified properties and add it to the scene
+        """Build the label, reusing the label of a previous scene."""
+        subtitle = self.app.subtitles.get(self.scene_id) if self.has_text else None # Subtitles are loaded once at startup
+        if subtitle is None:
+            if self.subtitle_label is not None and self.subtitle_label.parent:
+                self.remove_widget(self.subtitle_label) # Hiding the label for scenes without text
+            return
+
+        if self.subtitle_label is None:
+            self.subtitle_label = SubtitleLabel(  # Creating a SubtitleLabel widget with specified properties
                 subtitle=subtitle,
                 pos_hint={'center_x': 0.5, 'center_y': 0.25},  # Adjust y value to position the label
                 size_hint=(0.9, None),  # Set width to 70%, height to 10%
@@ -108,33 +232,61 @@ class Scene(RelativeLayout):
                 theme_text_color="Custom",
                 **self.text_style
             )
-            self.add_widget(label)
+        else:
+            self.subtitle_label.text = subtitle
+            for name, value in self.text_style.items(): # Applying the text style of the new scene
+                setattr(self.subtitle_label, name, value)
+        if not self.subtitle_label.parent:
+            self.add_widget(self.subtitle_label)
 
     # Method to build the button bar
+    @traced('Scene.build_button_bar')
     def build_button_bar(self) -> None:
-        """Build the button bar."""
-        if self.button_config: # Creating a ButtonBar widget with specified configuration and add it to the scene
-            button_bar = ButtonBar(self.button_config, app=self.app)
-            self.add_widget(button_bar)
+        """Build the button bar, reusing the buttons of a previous scene."""
+        if not self.button_config:
+            if self.button_bar is not None and self.button_bar.parent:
+                self.remove_widget(self.button_bar) # Hiding the button bar for scenes without choices
+            return
+
+        if self.button_bar is None: # Creating a ButtonBar widget with specified configuration
+            self.button_bar = ButtonBar(self.button_config, app=self.app)
+        else:
+            self.button_bar.set_buttons(self.button_config)
+        if not self.button_bar.parent:
+            self.add_widget(self.button_bar)
 
     # Method to build the audio player
+    @traced('Scene.build_audio_player')
     def build_audio_player(self, _) -> None:
         """Build the audio player."""
-        audio_path = f'assets/{self.scene_id}/{self.audio_source}'
-        if self.audio_source: # Loading the audio file and configure the audio player
-            self.audio = SoundLoader.load(audio_path)
-            if self.audio:
-                self.audio.loop = False
-                self.audio.bind(on_stop=self.on_audio_stop)
-                self.audio.play()
+        if self.prefetched and self.prefetched.sound: # Using the audio loaded by the prefetcher
+            self.audio = self.prefetched.sound
+        elif self.audio_source: # Loading the audio file from the asset store and configure the audio player
+            try:
+                key, self.audio = self.app.acquire_audio(self.app.asset_store, self.scene_id, self.audio_source)
+                self.asset_keys.append(key)
+            except Exception as e: # OSError from SoundLoader, decoding errors from the audio engine
+                print(f"Error loading audio {asset_path(self.scene_id, self.audio_source)}: {e}")
+        if self.audio and self.app.recorder: # Replays play the sound for as long as it plays here
+            length = self.audio.duration if self.app.audio_engine else self.audio.length
+            self.app.recorder.sound(asset_path(self.scene_id, self.audio_source), length)
+        if self.audio and self.app.audio_engine: # Every repeat is cued on the sample clock of the mixer
+            cues = repeat_cues(self.audio, self.audio_repeat_count, self.backoff_rate)
+            self.voice = self.app.audio_engine.play(self.audio, cues, on_finished=self.on_voice_finished)
+        elif self.audio:
+            self.audio.loop = False
+            self.audio.bind(on_stop=self.on_audio_stop)
+            self.audio.play()
 
     # Method to build the close button
+    @traced('Scene.build_close_button')
     def build_close_button(self) -> None:
         """Build the close button."""
         close_button = CloseButton(self.app) # Creating a CloseButton widget and add it to the scene
         self.add_widget(close_button)
 
     # Method to build the timer label
+    @traced('Scene.build_timer_label')
     def build_timer_label(self) -> None:
         """Build the timer label."""
         # Creating an MDLabel widget for displaying the timer and add it to the scene
@@ -152,52 +304,70 @@ class Scene(RelativeLayout):
         self.add_widget(self.timer_label)
 
     # Method to handle exit events
+    @traced('Scene.on_exit')
     def on_exit(self) -> None:
         """Handle exit events."""
         self.scene_ended = True
-        if self.audio:
+        if self.voice:
+            self.app.audio_engine.stop(self.voice)
+            self.voice = None
+        elif self.audio and not self.app.audio_engine: # A PcmBuffer of the engine has nothing to stop once its voice ended
             self.audio.unbind(on_stop=self.on_audio_stop)
             self.audio.stop()
 
         self.unschedule_events()
 
+        # Releasing the shared assets so the store can evict them when over budget
+        for key in self.asset_keys:
+            self.app.asset_store.release(key)
+        self.asset_keys = []
+
     # Method to unschedule various events
     def unschedule_events(self) -> None:
-        """Unschedule events."""
-        if hasattr(self, 'audio_repeat_scheduler'):
-            Clock.unschedule(self.audio_repeat_scheduler)
-        if hasattr(self, 'fallback_event_scheduler'):
-            Clock.unschedule(self.fallback_event_scheduler)
-        if hasattr(self, 'timer_event_interval'):
-            Clock.unschedule(self.timer_event_interval)
-        if hasattr(self, 'audio_player_scheduler'):
-            Clock.unschedule(self.audio_player_scheduler)
-
+        """Unschedule events. Every timed event lives in the timeline, so they are all cancelled at once."""
+        self.timeline.cancel_all()
 
     # Method to handle audio stop events
     def on_audio_stop(self, _) -> None:
-        """Handle audio stop events."""
-        if not self.scene_ended:
+        """Handle audio stop events of a Kivy sound, the audio engine reports through on_voice_finished."""
+        if not self.scene_ended and not self.app.audio_engine:
             self.audio.seek(0)
             self.audio_play_count += 1
 
             if self.audio_play_count < self.audio_repeat_count:
                 self.audio.seek(0)
-                self.audio_repeat_scheduler = Clock.schedule_once(   # Scheduling playing audio again after a specified backoff rate
-                    self.play_audio_after_buffer, self.backoff_rate
+                self.timeline.schedule(   # Scheduling playing audio again after a specified backoff rate
+                    'audio_repeat', self.backoff_rate, self.play_audio_after_buffer
                 )
             else:
                 self.audio.unbind(on_stop=self.on_audio_stop)
                 self.audio.stop()
-                if self.last_scene_id:
-                    self.app.switch_to_scene(self.last_scene_id)
-                else:
-                    self.fallback_event_scheduler = Clock.schedule_once(self.go_to_fallback, self.backoff_rate)
+                self.on_audio_finished()
+
+    # Method to handle the end of the last cue of the audio engine
+    def on_voice_finished(self, voice: Voice) -> None:
+        """Handle the end of the last play of the scene audio."""
+        if voice is self.voice and not self.scene_ended: # Ignoring a voice of a scene that was left meanwhile
+            self.voice = None
+            self.on_audio_finished()
+
+    # Method to move on once the audio played every time
+    def on_audio_finished(self) -> None:
+        """Go to the last scene, or start the fallback timer for scenes waiting for a choice."""
+        if self.last_scene_id: # Moving on to the last scene outside of the audio callback
+            self.timeline.schedule('auto_advance', 0, self.go_to_last_scene)
+        else:
+            self.timeline.schedule('fallback', self.backoff_rate, self.go_to_fallback)
+
+    # Method to go to the scene that follows a scene without choices
+    def go_to_last_scene(self, _) -> None:
+        """Go to the last scene, unless the player already chose another one."""
+        self.app.transitions.request(self.last_scene_id, user=False)
 
     # Method to play audio after a buffer time
     def play_audio_after_buffer(self, _) -> None:
         """Play audio after buffer time."""
-        if self.audio:
+        if self.audio and not self.app.audio_engine: # The audio engine cues its repeats itself
             self.audio.play()
             self.audio.seek(0)
 
@@ -205,7 +375,7 @@ class Scene(RelativeLayout):
     def go_to_fallback(self, _) -> None:
         """Go to fallback scene."""
         self.timer_label.text = f"Idle. Game terminating in {self.timer_duration} seconds"
-        self.timer_event_interval = Clock.schedule_interval(self.update_timer, 1)
+        self.timeline.schedule_interval('countdown', 1, self.update_timer)
 
     # Method to update the timer label
     def update_timer(self, _) -> None:
@@ -218,4 +388,5 @@ class Scene(RelativeLayout):
         self.timer_duration -= 1 # Decrease the remaining time in the timer by 1 second.
         self.timer_label.text = f"Idle. Game terminating in {self.timer_duration} seconds" # Update the text of the timer_label to reflect the new remaining time.
         if self.timer_duration <= 0: # Check if the timer has reached or fallen below zero.
+            self.timeline.cancel('countdown')
             self.app.stop() # If the timer has elapsed, stop the application.
@@ -1,12 +1,13 @@
 from kivy.graphics import Color, Rectangle
-from kivymd.uix.label import MDLabel
 
+from widgets.cached_label import CachedLabel
 
-class SubtitleLabel(MDLabel):
+
+class SubtitleLabel(CachedLabel):
     """Creates a custom label for subtitle
 
     Args:
-        MDLabel (_type_): Inherits the MDLabel class
+        CachedLabel (_type_): Inherits the CachedLabel class, an MDLabel reusing the textures of text shown before
     """
 
     def __init__(self, subtitle, padding=(10, 5), **kwargs):
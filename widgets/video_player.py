@@ -0,0 +1,242 @@
+import threading
+from typing import Callable, Optional, Tuple
+
+from kivy.clock import Clock
+from kivy.graphics.texture import Texture
+from kivy.properties import OptionProperty, StringProperty
+from kivy.uix.image import Image
+
+from configs.constants import DEFAULTS
+
+DROP_OLDEST = 'drop_oldest' # A full buffer discards its oldest frame to make room, playback stays current
+DROP_NEWEST = 'drop_newest' # A full buffer discards the decoded frame, frames already queued are kept
+
+
+class FrameRing:
+    """Bounded ring buffer of decoded RGBA frames shared by the decoder thread and the UI thread.
+
+    Frame buffers are allocated once per frame size and reused for every frame.
+    """
+
+    def __init__(self, capacity: int = DEFAULTS['VIDEO_RING_SIZE'], policy: str = DROP_OLDEST):
+        self.capacity = capacity
+        self.policy = policy
+        self.size: Optional[Tuple[int, int]] = None
+        self.decoded = 0
+        self.dropped = 0
+        self.shown = 0
+        self.generation = 0 # Bumped by clear, frames decoded for an earlier generation are discarded
+        self._lock = threading.Lock()
+        self._slots = []
+        self._pts = [0.0] * capacity
+        self._start = 0
+        self._count = 0
+
+    def push(self, data: memoryview, size: Tuple[int, int], pts: float, generation: Optional[int] = None) -> bool:
+        """Copy a decoded frame into the next free buffer. Called by the decoder thread.
+
+        Args:
+            data (memoryview): packed RGBA pixels
+            size (Tuple[int, int]): frame width and height
+            pts (float): presentation time of the frame
+            generation (Optional[int]): generation the decoder was started for, None accepts the frame in any
+
+        Returns:
+            bool: False when the frame was dropped because the buffer is full or the decoder was stopped
+        """
+        with self._lock:
+            if generation is not None and generation != self.generation: # A stopped decoder that has not noticed yet
+                return False
+            self.decoded += 1
+            if size != self.size: # The frame size changed, the buffers are allocated again
+                self.size = size
+                self._slots = [bytearray(len(data)) for _ in range(self.capacity)]
+                self._start = self._count = 0
+            if self._count == self.capacity:
+                self.dropped += 1
+                if self.policy == DROP_NEWEST:
+                    return False
+                self._start = (self._start + 1) % self.capacity
+                self._count -= 1
+            slot = (self._start + self._count) % self.capacity
+            self._slots[slot][:] = data
+            self._pts[slot] = pts
+            self._count += 1
+            return True
+
+    def consume_latest(self, use: Callable[[bytearray, Tuple[int, int], float], None]) -> bool:
+        """Hand the newest frame to use and drop the older ones. Called by the UI thread.
+
+        Args:
+            use (Callable[[bytearray, Tuple[int, int], float], None]): receives the pixels, size and time of the frame
+
+        Returns:
+            bool: False when no frame was waiting
+        """
+        with self._lock:
+            if not self._count:
+                return False
+            slot = (self._start + self._count - 1) % self.capacity
+            self.dropped += self._count - 1 # Frames the UI was too slow to show
+            self.shown += 1
+            use(self._slots[slot], self.size, self._pts[slot])
+            self._start = self._count = 0
+            return True
+
+    def clear(self) -> int:
+        """Drop every queued frame, and the frames still being decoded for them.
+
+        Returns:
+            int: the new generation, to push the frames of the next decoder with
+        """
+        with self._lock:
+            self._start = self._count = 0
+            self.generation += 1
+            return self.generation
+
+
+class ThreadedVideo(Image):
+    """Video widget decoding on a worker thread.
+
+    Frames are decoded by ffpyplayer already scaled to fit the widget, queued in a
+    FrameRing, and the newest one is uploaded into a reused texture once per frame on
+    the UI thread. Exposes the source, state and unload interface of kivy's Video.
+    """
+
+    source = StringProperty('')
+    state = OptionProperty('stop', options=['play', 'pause', 'stop'])
+
+    def __init__(self, options: Optional[dict] = None, ring_size: int = DEFAULTS['VIDEO_RING_SIZE'],
+                 drop_policy: str = DROP_OLDEST, **kwargs):
+        self.options = options or {}
+        self.ring = FrameRing(ring_size, drop_policy)
+        self._worker: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._player = None
+        self._target_size: Tuple[int, int] = (0, 0)
+        self._upload_event = None
+        self._frame_texture: Optional[Texture] = None
+        super(ThreadedVideo, self).__init__(**kwargs)
+        self.bind(size=self.on_widget_size)
+
+    def texture_update(self, *largs) -> None:
+        """Keep Image from loading the video source as a picture, frames come from the decoder."""
+
+    # Method to start, pause or stop decoding when the state changes
+    def on_state(self, _, state: str) -> None:
+        """Apply a state change."""
+        if state == 'play':
+            if self._worker is None:
+                self.start_decoding()
+            elif self._player is not None:
+                self._player.set_pause(False)
+        elif state == 'pause':
+            if self._player is not None:
+                self._player.set_pause(True)
+        else:
+            self.stop_decoding()
+
+    # Method to restart decoding when the source changes
+    def on_source(self, _, source: str) -> None:
+        """Restart decoding on the new source if the video is playing."""
+        self.stop_decoding()
+        if source and self.state == 'play':
+            self.start_decoding()
+
+    # Method to rescale decoded frames when the widget is resized
+    def on_widget_size(self, _, size) -> None:
+        """Request frames scaled to the new widget size."""
+        self._target_size = (int(size[0]), int(size[1]))
+
+    def start_decoding(self) -> None:
+        """Start the decoder thread and the per-frame texture upload."""
+        if not self.source:
+            return
+        self._stop_event = threading.Event()
+        generation = self.ring.clear()
+        self._worker = threading.Thread(
+            target=self.decode, args=(self.source, self._stop_event, generation), name='video-decoder', daemon=True
+        )
+        self._worker.start()
+        self._upload_event = Clock.schedule_interval(self.upload_frame, 0)
+
+    def stop_decoding(self) -> None:
+        """Stop the decoder thread and the texture upload.
+
+        The decoder is not waited for, which would block the UI thread for up to a frame
+        delay. It notices the stop on its next wait, closes its player itself and exits,
+        and the frames it decodes until then are discarded by the ring.
+        """
+        self._stop_event.set()
+        self._worker = None
+        if self._upload_event is not None:
+            self._upload_event.cancel()
+            self._upload_event = None
+        self.ring.clear()
+
+    def unload(self) -> None:
+        """Stop the video and release its texture."""
+        self.state = 'stop'
+        self.stop_decoding()
+        self._frame_texture = None
+        self.texture = None
+
+    # Method run on the decoder thread
+    def decode(self, source: str, stop_event: threading.Event, generation: Optional[int] = None) -> None:
+        """Decode frames into the ring buffer until stopped, pacing them to their presentation time.
+
+        The player is created, and closed when stopped, on this thread.
+        """
+        from ffpyplayer.player import MediaPlayer # Imported on first use, only video scenes need it
+
+        loop = 0 if self.options.get('eos') == 'loop' else 1 # ffpyplayer loops forever when loop is 0
+        player = MediaPlayer(source, ff_opts={'out_fmt': 'rgba', 'loop': loop})
+        if not stop_event.is_set(): # Not handed to the widget when it was stopped while the source opened
+            self._player = player
+        applied_size = None
+        try:
+            while not stop_event.is_set():
+                if self._target_size != applied_size and self._target_size[0] and self._target_size[1]:
+                    applied_size = self._target_size
+                    self.apply_output_size(player, applied_size)
+
+                frame, delay = player.get_frame()
+                if delay == 'eof':
+                    break
+                if frame is None:
+                    stop_event.wait(0.005)
+                    continue
+                if delay > 0:
+                    stop_event.wait(delay) # Waiting until the frame is due, so the ring holds current frames
+                image, pts = frame
+                self.ring.push(image.to_memoryview(keep_align=False)[0], image.get_size(), pts, generation)
+        finally:
+            if self._player is player: # A decoder started since for a new source keeps its own player
+                self._player = None
+            player.close_player()
+
+    @staticmethod
+    def apply_output_size(player, box: Tuple[int, int]) -> None:
+        """Make the decoder scale frames to fit in box, keeping the source aspect ratio."""
+        source_size = player.get_metadata().get('src_vid_size') or (0, 0)
+        if not source_size[0] or not source_size[1]:
+            return
+        scale = min(box[0] / source_size[0], box[1] / source_size[1], 1.0) # Frames are never scaled up
+        player.set_size(max(int(source_size[0] * scale), 1), max(int(source_size[1] * scale), 1))
+
+    # Method run on the UI thread once per frame
+    def upload_frame(self, _) -> None:
+        """Upload the newest decoded frame into the reused texture."""
+        self.ring.consume_latest(self.blit_frame)
+
+    def blit_frame(self, pixels: bytearray, size: Tuple[int, int], _) -> None:
+        """Copy frame pixels into the texture, creating it only when the frame size changes."""
+        texture = self._frame_texture
+        if texture is None or texture.size != size:
+            texture = self._frame_texture = Texture.create(size=size, colorfmt='rgba')
+            texture.flip_vertical()
+        texture.blit_buffer(pixels, colorfmt='rgba', bufferfmt='ubyte')
+        if self.texture is not texture:
+            self.texture = texture
+        else:
+            self.canvas.ask_update()